@@ -5,6 +5,10 @@ from decouple import config as conf
 from sqlalchemy import engine_from_config, pool
 from sqlmodel import SQLModel
 
+from modules.shared.db.advisor import ADVISED_INDEX_PREFIX
+from modules.shared.db.cache import VERSIONS_TABLE
+from modules.shared.db.counts import COUNTS_TABLE
+from modules.shared.db.search import SEARCH_ROWID, SEARCH_VECTOR
 from modules.shared.models import BaseTable
 import pkgutil
 import importlib
@@ -27,6 +31,23 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = SQLModel.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    "Keep autogenerate away from runtime-managed objects and advised indexes"
+    if type_ == "table" and reflected and ("_fts" in name or "_trgm" in name):
+        return False
+    if type_ == "table" and reflected and name in (COUNTS_TABLE, VERSIONS_TABLE):
+        return False
+    if type_ == "column" and reflected and name in (SEARCH_VECTOR, SEARCH_ROWID):
+        return False
+    runtime_indexes = (f"_{SEARCH_VECTOR}", f"_{SEARCH_ROWID}", "_trgm")
+    if type_ == "index" and reflected and name.endswith(runtime_indexes):
+        return False
+    # Created by `fh indexes --write` migrations, not declared on the models
+    if type_ == "index" and reflected and compare_to is None:
+        return not name.startswith(ADVISED_INDEX_PREFIX)
+    return True
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,6 +70,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -71,7 +93,11 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
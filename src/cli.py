@@ -1,5 +1,6 @@
 import os
 from enum import StrEnum
+from pathlib import Path
 import typer
 from rich import print
 import subprocess
@@ -71,6 +72,64 @@ def migrate():
         print("[green]Migrations applied successfully![/green]")
     except subprocess.CalledProcessError as e:
         print(f"[red]Error applying migrations: {e}[/red]")
+        return
+    install()
+
+@app.command()
+def install():
+    """
+    Install the search indexes and row-count triggers the migrations leave out.
+    """
+    import modules  # noqa: F401 - registers every model
+    from modules.shared.db import service
+
+    print("[yellow]Installing search indexes and row counters...[/yellow]")
+    service.install_runtime_objects()
+    print("[green]Runtime database objects installed![/green]")
+
+@app.command()
+def reconcile_counts():
+    """
+    Recount the tables with maintained row counters and correct any drift.
+    """
+    import modules  # noqa: F401 - registers every model
+    from modules.shared.db import service
+
+    print("[yellow]Reconciling row counters...[/yellow]")
+    for table, drift in service.reconcile_counts().items():
+        if drift:
+            print(f"[red]{table}[/red] counter was off by {drift}, corrected")
+        else:
+            print(f"[green]{table}[/green] counter is exact")
+
+@app.command()
+def indexes(
+    write: bool = typer.Option(False, help="Write a migration creating the missing indexes"),
+    message: str = typer.Option("Add advised indexes", help="Optional migration message"),
+):
+    """
+    Report indexes missing for sort keys, foreign keys and alt-key lookups.
+    """
+    import modules  # noqa: F401 - registers every model
+    from sqlmodel import SQLModel
+    from modules.shared.db import service
+    from modules.shared.db.advisor import advise, write_migration
+
+    print("[yellow]Inspecting models and database schema...[/yellow]")
+    models = [m.class_ for m in SQLModel._sa_registry.mappers]
+    advice = advise(service.engine, models)
+    if not advice:
+        print("[green]No missing indexes found.[/green]")
+        return
+    for index in advice:
+        columns = ", ".join(index.columns)
+        print(f"[red]missing[/red] {index.table} ({columns}) - {index.reason}")
+    if not write:
+        print("[yellow]Run with --write to generate a migration for these.[/yellow]")
+        return
+    config_file = Path(__file__).resolve().parent.parent / "alembic.ini"
+    path = write_migration(advice, message, config_file)
+    print(f"[green]Migration written to {path}[/green]")
 
 @app.command()
 def run():
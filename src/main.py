@@ -1,12 +1,18 @@
 import logging
 import secrets
 
+from decouple import config
+
 # import modules
 from fasthtml.common import *
 from monsterui.core import *
 from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 
+from modules.shared.db import service
+from modules.shared.db.profiling import QueryStatsMiddleware
+from modules.shared.db.session import DBSessionMiddleware
+from modules.shared.metrics import registry
 from modules.shared.toaster import setup_custom_toasts
 from route_collector import add_routes
 
@@ -16,7 +22,12 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
-middleware = [Middleware(SessionMiddleware, secret_key=secrets.token_urlsafe(32))]
+middleware = [
+    Middleware(SessionMiddleware, secret_key=secrets.token_urlsafe(32)),
+    # Outside the DB session so the request's commit is counted
+    Middleware(QueryStatsMiddleware),
+    Middleware(DBSessionMiddleware),
+]
 
 frankenui_headers = Theme.rose.headers()
 
@@ -38,6 +49,7 @@ beforeware = Beforeware(
         r"/about",
         r"/contact",
         r"/api/.*",
+        "/metrics",
         "/",
     ],
 )
@@ -46,6 +58,8 @@ beforeware = Beforeware(
 app, rt = fast_app(
     before=beforeware,
     middleware=middleware,
+    on_startup=[service.astart],
+    on_shutdown=[service.aclose],
     static_path="assets",
     live=True,
     pico=False,
@@ -61,5 +75,14 @@ app, rt = fast_app(
 setup_custom_toasts(app)
 app = add_routes(app)
 
+
+@rt("/metrics")
+def metrics():
+    "Prometheus scrape endpoint, only served when METRICS_ENABLED is set"
+    if not config("METRICS_ENABLED", default=False, cast=bool):
+        return Response(status_code=404)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     serve(reload=True)
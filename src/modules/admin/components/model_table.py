@@ -90,6 +90,13 @@ def ModelTableFromDicts(
 ):
     renderer = TableFieldRenderer()
     visible_headers = [h for h in header_data if h.lower() != "id"]
+    # Foreign keys of the whole page resolve in one query per related model
+    related = model.resolve_related(body_data, visible_headers) if model else {}
+
+    def cell_value(row, key):
+        value = row.get(key, "")
+        record = related[key].get(value) if key in related else None
+        return str(record) if record is not None else value
     return Table(
         Thead(
             Tr(
@@ -106,7 +113,8 @@ def ModelTableFromDicts(
                 Tr(
                     *[
                         renderer.render_cell(
-                            model.model_fields.get(k) if model else None, r.get(k, "")
+                            model.model_fields.get(k) if model else None,
+                            cell_value(r, k),
                         )
                         for k in visible_headers
                     ]
@@ -124,9 +132,15 @@ def ModelTableFromDicts(
 def ModelTable(model, request):
     page = int(request.query_params.get("page", 1))
     per_page = int(request.query_params.get("per_page", 10))
-    table_data = model.table_view_data(request)
+    search_value = request.query_params.get("search_value")
+    # Rows and the filtered total come back from the same query
+    if model.keyset_pagination:
+        page_data = model.table_view_page(request, with_total=True)
+    else:
+        page_data = model.table_view_data(request, with_total=True)
+    table_data = page_data.records
     total_records = len(table_data)
-    total_table_records = model.total_records()
+    total_table_records = page_data.total
     total_pages = max(1, (total_table_records + per_page - 1) // per_page)
 
     pagination = Pagination(
@@ -134,6 +148,10 @@ def ModelTable(model, request):
         current_page=page,
         total_pages=total_pages,
         per_page=per_page,
+        keyset=model.keyset_pagination,
+        next_cursor=page_data.next_cursor,
+        prev_cursor=page_data.prev_cursor,
+        search_value=search_value,
     )
 
     return Div(
@@ -149,7 +167,7 @@ def ModelTable(model, request):
                 table_name=model.__name__.lower(),
             )
         ),
-        pagination.__ft__(total_records, total_table_records),
+        pagination.__ft__(total_records, total_table_records, page_data.approximate),
     )
 
 
@@ -1,7 +1,12 @@
 from typing import Optional
+from urllib.parse import quote_plus
+
 from fasthtml.common import *
 from monsterui.core import *
 
+from modules.shared.db.counts import humanize_count
+from modules.shared.db.pagination import LAST_PAGE_CURSOR
+
 
 class Pagination:
     def __init__(
@@ -11,14 +16,32 @@ class Pagination:
         total_pages: int,
         per_page: int,
         target: str = "#table-container",
+        keyset: bool = False,
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+        search_value: Optional[str] = None,
     ):
         self.base_url = base_url
         self.total_pages = max(1, total_pages)
         self.current_page = max(1, min(current_page, self.total_pages))
         self.per_page = max(1, per_page)
         self.target = target
+        self.keyset = keyset
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.search_value = search_value
+
+    def _page_url(self, page: int, cursor: Optional[str] = None) -> str:
+        url = f"{self.base_url}?page={page}&per_page={self.per_page}"
+        if self.search_value:
+            url += f"&search_value={quote_plus(self.search_value)}"
+        if cursor:
+            url += f"&cursor={cursor}"
+        return url
 
-    def _page_link(self, icon: str, page: Optional[int], disabled: bool) -> UkIconLink:
+    def _page_link(
+        self, icon: str, page: Optional[int], disabled: bool, cursor: Optional[str] = None
+    ) -> UkIconLink:
         if page is None:
             page = self.current_page
 
@@ -36,14 +59,49 @@ class Pagination:
             icon=icon,
             button=True,
             disabled=is_disabled,
-            hx_get=f"{self.base_url}?page={page}&per_page={self.per_page}",
+            hx_get=self._page_url(page, cursor),
             hx_target=self.target,
             cls="cursor-pointer"
             if not is_disabled
             else "opacity-50 cursor-not-allowed",
         )
 
-    def __ft__(self, total_records: int, total_table_records: int) -> DivFullySpaced:
+    def _links(self) -> list:
+        if self.keyset:
+            # Cursors only seek one page at a time; first/last jump to either end
+            no_prev, no_next = self.prev_cursor is None, self.next_cursor is None
+            return [
+                self._page_link("chevrons-left", 1, disabled=no_prev),
+                self._page_link(
+                    "chevron-left",
+                    self.current_page - 1,
+                    disabled=no_prev,
+                    cursor=self.prev_cursor,
+                ),
+                self._page_link(
+                    "chevron-right",
+                    self.current_page + 1,
+                    disabled=no_next,
+                    cursor=self.next_cursor,
+                ),
+                self._page_link(
+                    "chevrons-right",
+                    self.total_pages,
+                    disabled=no_next,
+                    cursor=LAST_PAGE_CURSOR,
+                ),
+            ]
+        # Remove False parameter to let _page_link handle disabled state
+        return [
+            self._page_link("chevrons-left", 1, disabled=False),
+            self._page_link("chevron-left", self.current_page - 1, disabled=False),
+            self._page_link("chevron-right", self.current_page + 1, disabled=False),
+            self._page_link("chevrons-right", self.total_pages, disabled=False),
+        ]
+
+    def __ft__(
+        self, total_records: int, total_table_records: int, approximate: bool = False
+    ) -> DivFullySpaced:
         # Recalculate pages based on actual records
         actual_total_pages = max(
             1, (total_table_records + self.per_page - 1) // self.per_page
@@ -51,9 +109,15 @@ class Pagination:
         self.total_pages = actual_total_pages
         self.current_page = max(1, min(self.current_page, actual_total_pages))
 
+        if approximate:
+            estimate = humanize_count(total_table_records)
+            summary = f"{total_records} out of about {estimate} records shown."
+        else:
+            summary = f"{total_records} out of {total_table_records} record(s) shown."
+
         return DivFullySpaced(cls="mt-4 px-2 py-2")(
             Div(
-                f"{total_records} out of {total_table_records} record(s) shown.",
+                summary,
                 cls="flex-1 text-sm text-muted-foreground",
             ),
             Div(cls="flex flex-none items-center space-x-8")(
@@ -61,16 +125,6 @@ class Pagination:
                     f"Page {self.current_page} of {self.total_pages}",
                     cls="w-[100px] text-sm font-medium",
                 ),
-                DivLAligned(
-                    # Remove False parameter to let _page_link handle disabled state
-                    self._page_link("chevrons-left", 1, disabled=False),
-                    self._page_link(
-                        "chevron-left", self.current_page - 1, disabled=False
-                    ),
-                    self._page_link(
-                        "chevron-right", self.current_page + 1, disabled=False
-                    ),
-                    self._page_link("chevrons-right", self.total_pages, disabled=False),
-                ),
+                DivLAligned(*self._links()),
             ),
         )
@@ -167,7 +167,7 @@ async def post(request, table: str = ""):
             processed_data[key] = False
 
     if model:
-        if model.upsert(processed_data):
+        if await model.aupsert(processed_data):
             return model.render_table(request, records_only=True)
     else:
         return H1("Table not found")
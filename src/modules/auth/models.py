@@ -41,6 +41,7 @@ class RolePriviledge(BaseTable, table=True):
     sidebar_item = True
     detail_page_title = "Role Priviledge"
     default_sort_field = "role_name"
+    search_fields = ["role_name", "priviledge_name"]
     table_view_fields = ["role_name", "priviledge_name", "created_at", "updated_at"]
     detail_page_fields = ["role_name", "priviledge_name"]
     sidebar_icon = "key-round"
@@ -55,7 +56,11 @@ class RolePriviledge(BaseTable, table=True):
 
 
 class User(BaseTable, table=True):
-    email: str = Field(nullable=False, unique=True, schema_extra={"input_type": "email"})
+    email: str = Field(
+        nullable=False,
+        unique=True,
+        schema_extra={"input_type": "email", "substring_search": True},
+    )
     full_name: Optional[str] = Field(nullable=True, title="Full Name")
     avatar_url: Optional[str] = Field(nullable=True, title="Avatar")
     password: Optional[str] = Field(nullable=True, default="")
@@ -73,6 +78,7 @@ class User(BaseTable, table=True):
 
     # * Class Medatadata
     table_view_fields = ["id", "email", "full_name", "is_admin", "role"]
+    search_fields = ["email", "full_name", "role"]
     detail_page_fields = ["full_name", "email", "is_admin", "role"]
     detail_page_title = "User Details"
     field_groups = {
@@ -81,11 +87,17 @@ class User(BaseTable, table=True):
     }
     display_name = "Users"
     sidebar_icon = "user"
+    keyset_pagination = True
+    alt_keys = ["email"]
 
     @classmethod
     def get_by_email(cls, email: str) -> "User":
         return cls.get(id=email, alt_key="email")
 
+    @classmethod
+    async def aget_by_email(cls, email: str) -> "User":
+        return await cls.aget(id=email, alt_key="email")
+
     @property
     def priviledges(self) -> list[str]:
         privileges: dict = RolePriviledge.query(
@@ -116,6 +128,7 @@ class Role(BaseTable, table=True):
         nullable=True,
         title="Product Name",
         description="The name of the product associated with this role",
+        schema_extra={"substring_search": True},
     )
     description: Optional[str] = Field(nullable=True, title="Description")
 
@@ -127,6 +140,7 @@ class Role(BaseTable, table=True):
 
     # * Class Metadata
     display_name = "Roles"
+    display_field = "name"
     sidebar_item = True
     detail_page_title = "Role"
     table_view_fields = [
@@ -136,6 +150,9 @@ class Role(BaseTable, table=True):
         "created_at",
         "updated_at",
     ]
+    search_fields = ["name", "product_name", "description"]
+    cache_ttl = 300
+    alt_keys = ["name"]
     detail_page_fields = ["name", "product_name", "description"]
     sidebar_icon = "key-round"
 
@@ -164,9 +181,13 @@ class Priviledge(BaseTable, table=True):
     )
 
     display_name = "Priviledges"
+    display_field = "name"
     sidebar_item = True
     detail_page_title = "Priviledge"
     table_view_fields = ["name", "description", "created_at", "updated_at"]
+    search_fields = ["name", "description"]
+    cache_ttl = 300
+    alt_keys = ["name"]
     detail_page_fields = ["name", "description"]
     sidebar_icon = "key-round"
 
@@ -36,7 +36,7 @@ async def upload_avatar(request):
                 return P("Invalid file upload", cls="text-red-500 mt-4")
 
             user_data = json.loads(request.session.get("user"))
-            user = User.get(user_data["id"])
+            user = await User.aget(user_data["id"])
 
             # Read file content
             content = await file.read()
@@ -48,7 +48,7 @@ async def upload_avatar(request):
             # Update user's avatar_url
             avatar_url = f"assets/uploads/avatars/{file_path.name}"
             user.avatar_url = avatar_url
-            user.save()
+            await user.asave()
 
             # Return success message and refresh the main avatar
             return Div(
@@ -71,14 +71,14 @@ async def update_profile(request):
     try:
         async with request.form() as form:
             user_data = json.loads(request.session.get("user"))
-            user = User.get(user_data["id"])
+            user = await User.aget(user_data["id"])
 
             # Update user fields
             user.full_name = form.get("full_name", user.full_name)
             user.email = form.get("email", user.email)
             # user.user_metadata = json.loads(form.get("user_metadata", "{}"))
 
-            user.save()
+            await user.asave()
             add_custom_toast(
                 request.session, "Profile updated successfully!", "success"
             )
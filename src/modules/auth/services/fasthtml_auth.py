@@ -3,6 +3,7 @@ import logging
 import random
 import smtplib
 import time
+from datetime import datetime, timezone
 
 import bcrypt
 import resend
@@ -25,13 +26,14 @@ class FastHTMLAuth:
 
     async def login(self, request, email, password):
         try:
-            user = User.get_by_email(email)
+            user = await User.aget_by_email(email)
             if not user:
                 add_custom_toast(
                     request.session, f"User with email {email} not found", "error"
                 )
                 return None
             if bcrypt.checkpw(password.encode("utf-8"), user.password.encode("utf-8")):
+                self._signed_in(user)
                 return user
             else:
                 add_custom_toast(request.session, "Incorect Password", "error")
@@ -47,11 +49,12 @@ class FastHTMLAuth:
             # Validate the OTP
             if await self.validate_otp(request, email, otp):
                 # Get the user
-                user = User.get_by_email(email)
+                user = await User.aget_by_email(email)
                 if user:
                     # Clean up the OTP after successful login
                     if email in FastHTMLAuth.otps:
                         del FastHTMLAuth.otps[email]
+                    self._signed_in(user)
                     return user
             return None
         except Exception as e:
@@ -60,6 +63,10 @@ class FastHTMLAuth:
             )
             return None
 
+    def _signed_in(self, user):
+        # Off the login path: written by the write-behind queue
+        User.defer_update(user.id, {"last_sign_in_at": datetime.now(timezone.utc)})
+
     async def oauth_login(self, request, provider, code: str = None):
         # TODO: Implement this method with fasthtml
         # auth_callback_path = f"oauth/{provider}"
@@ -76,7 +83,7 @@ class FastHTMLAuth:
 
     async def register(self, request, password, email):
         try:
-            if User.get_by_email(email):
+            if await User.aget_by_email(email):
                 return None
             hashed_password = bcrypt.hashpw(
                 password.encode("utf-8"), bcrypt.gensalt()
@@ -84,7 +91,7 @@ class FastHTMLAuth:
             user = User()
             user.password = hashed_password
             user.email = email
-            user.save()
+            await user.asave()
             return user
         except Exception as e:
             add_custom_toast(request.session, f"Registration error: {e}", "error")
@@ -97,7 +104,7 @@ class FastHTMLAuth:
 
     async def request_password_reset(self, request, email):
         try:
-            user = User.get_by_email(email)
+            user = await User.aget_by_email(email)
             if user:
                 otp = self._generate_otp()
                 FastHTMLAuth.otps[email] = {
@@ -156,13 +163,13 @@ class FastHTMLAuth:
 
             otp_data = FastHTMLAuth.otps.get(email)
             if otp_data and otp_data.get("verified"):
-                user = User.get_by_email(email)
+                user = await User.aget_by_email(email)
                 if user:
                     hashed_password = bcrypt.hashpw(
                         new_password.encode("utf-8"), bcrypt.gensalt()
                     ).decode("utf-8")
                     user.password = hashed_password
-                    user.save()
+                    await user.asave()
                     # Clean up the OTP after successful password reset
                     del FastHTMLAuth.otps[email]
                     return True
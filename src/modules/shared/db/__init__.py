@@ -1,16 +1,27 @@
 import os
 
-from decouple import config
+from decouple import Csv, config
 
+from modules.shared.db.async_sqlmodel import AsyncSQLModelDB
 from modules.shared.db.sqlmodel import SQLModelDB
 
+DB_BACKENDS = {
+    "sqlmodel": SQLModelDB,
+    "async_sqlmodel": AsyncSQLModelDB,
+}
+
 
 def get_db_service():
-    db_type = "sqlmodel"
+    db_type = config("DATABASE_BACKEND", default="sqlmodel")
+    if db_type not in DB_BACKENDS:
+        raise ValueError(f"Unknown DATABASE_BACKEND '{db_type}'")
 
-    return SQLModelDB(url=config("DATABASE_URL"))
+    return DB_BACKENDS[db_type](
+        url=config("DATABASE_URL"),
+        replica_urls=config("DATABASE_REPLICA_URLS", default="", cast=Csv()),
+    )
 
 
 service = get_db_service()
 
-__all__ = ["service"]
\ No newline at end of file
+__all__ = ["service"]
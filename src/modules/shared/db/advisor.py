@@ -0,0 +1,123 @@
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Set, Tuple, Type
+from uuid import uuid4
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+from modules.shared.db.introspection import TableSchema, describe, schema_cache
+
+# Advised indexes live only in migrations, not in the models' metadata;
+# migrations/env.py keeps autogenerate from dropping them by this prefix
+ADVISED_INDEX_PREFIX = "ix_adv_"
+# Postgres truncates longer identifiers
+MAX_NAME_LENGTH = 63
+
+
+@dataclass
+class IndexAdvice:
+    table: str
+    columns: Tuple[str, ...]
+    reason: str
+
+    @property
+    def name(self) -> str:
+        name = f"{ADVISED_INDEX_PREFIX}{self.table}_{'_'.join(self.columns)}"
+        if len(name) > MAX_NAME_LENGTH:
+            digest = hashlib.md5(name.encode()).hexdigest()[:8]
+            name = f"{name[: MAX_NAME_LENGTH - 9]}_{digest}"
+        return name
+
+
+def wanted_indexes(model: Type[SQLModel]) -> List[IndexAdvice]:
+    "Indexes `model`'s declared query patterns rely on"
+    table = model.__table__
+    wanted = []
+    sort_field = getattr(model, "default_sort_field", None)
+    if sort_field and sort_field != "id" and sort_field in table.columns:
+        # Keyset pages seek on (sort field, id); offset pages sort on the prefix
+        wanted.append(
+            IndexAdvice(table.name, (sort_field, "id"), "default_sort_field")
+        )
+    for field, (target, column) in describe(model).foreign_keys.items():
+        reason = f"foreign key to {target}.{column}"
+        wanted.append(IndexAdvice(table.name, (field,), reason))
+    for key in getattr(model, "alt_keys", None) or []:
+        if key in table.columns:
+            wanted.append(IndexAdvice(table.name, (key,), "alt_keys lookup"))
+    return wanted
+
+
+def existing_indexes(
+    schema: Optional[TableSchema], table: sa.Table
+) -> Set[Tuple[str, ...]]:
+    "Column lists already indexed, in the live schema or declared on the model"
+    existing = set()
+    if schema is not None:
+        existing.add(tuple(schema.primary_key))
+        for index in schema.indexes:
+            existing.add(tuple(c for c in index["column_names"] if c))
+        for constraint in schema.unique_constraints:
+            existing.add(tuple(constraint["column_names"]))
+    existing.add(tuple(c.name for c in table.primary_key.columns))
+    for index in table.indexes:
+        existing.add(tuple(c.name for c in index.columns))
+    for constraint in table.constraints:
+        if isinstance(constraint, sa.UniqueConstraint):
+            existing.add(tuple(c.name for c in constraint.columns))
+    for column in table.columns:
+        if column.unique or column.index:
+            existing.add((column.name,))
+    return existing
+
+
+def covered(columns: Sequence[str], existing: Iterable[Tuple[str, ...]]) -> bool:
+    "Whether an index serves `columns`: they must be its leading columns"
+    columns = tuple(columns)
+    return any(index[: len(columns)] == columns for index in existing)
+
+
+def advise(engine: Engine, models: Iterable[Type[SQLModel]]) -> List[IndexAdvice]:
+    "Indexes the models' query patterns need but neither schema nor model has"
+    tables = schema_cache.tables(engine)
+    advice = []
+    for model in sorted(models, key=lambda m: m.__tablename__):
+        table = model.__table__
+        existing = existing_indexes(tables.get(table.name), table)
+        # Widest first, so e.g. (role_name, id) also serves the role_name FK
+        wanted = sorted(wanted_indexes(model), key=lambda w: -len(w.columns))
+        for index in wanted:
+            if covered(index.columns, existing):
+                continue
+            existing.add(index.columns)
+            advice.append(index)
+    return advice
+
+
+def write_migration(
+    advice: List[IndexAdvice], message: str, config_file: Path
+) -> str:
+    "Emit an Alembic revision creating the advised indexes; returns its path"
+    from alembic.autogenerate import render_python_code
+    from alembic.config import Config
+    from alembic.operations import ops
+    from alembic.script import ScriptDirectory
+
+    upgrade = ops.UpgradeOps(
+        ops=[ops.CreateIndexOp(a.name, a.table, list(a.columns)) for a in advice]
+    )
+    config = Config(str(config_file))
+    script = ScriptDirectory.from_config(config)
+    Path(script.versions).mkdir(parents=True, exist_ok=True)
+    revision = script.generate_revision(
+        uuid4().hex[-12:],
+        message,
+        head="head",
+        upgrades=render_python_code(upgrade),
+        downgrades=render_python_code(upgrade.reverse()),
+        imports="",
+    )
+    return revision.path
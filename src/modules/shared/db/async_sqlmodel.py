@@ -0,0 +1,523 @@
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.engine import make_url
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from modules.shared.db.base import STREAM_BATCH_SIZE
+from modules.shared.db.bulk import (
+    BULK_CHUNK_SIZE,
+    ID_PARAM,
+    TIMESTAMP_FIELDS,
+    ConflictTarget,
+    changed_columns,
+    chunked,
+    coerce_id,
+    conflict_columns,
+    mark_saved,
+    prepare_rows,
+    prepare_updates,
+    update_statement,
+)
+from modules.shared.db.cache import can_fill, mark_stale, query_key
+from modules.shared.db.counts import (
+    CACHED,
+    ESTIMATED,
+    EXACT,
+    MAINTAINED,
+    count_strategy,
+    estimate_rows,
+)
+from modules.shared.db.pagination import Page
+from modules.shared.db.pool import create_async_db_engine, pool_stats
+from modules.shared.db.session import (
+    REPLICAS,
+    SESSION_LOCK,
+    USE_PRIMARY,
+    RoutingSession,
+    current_session,
+)
+from modules.shared.db.sqlmodel import SQLModelDB, utc_now
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_url(url: str) -> str:
+    "Swap the sync DBAPI driver in `url` for its asyncio counterpart"
+    url = make_url(url)
+    drivername = ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    return url.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+class AsyncSQLModelDB(SQLModelDB):
+    """SQLModelDB with native asyncio record methods.
+
+    The synchronous API stays available for sync routes and components, while
+    the `a*` methods run on an async engine (aiosqlite / asyncpg) so `async def`
+    handlers never block the event loop on a database round-trip.
+
+    Inside DBSessionMiddleware's unit of work the request session is a sync
+    Session, which an async engine cannot share. Writes there, and reads once
+    the request has written, run on that session in a worker thread (the base
+    class' implementation) so they commit or roll back with the request and
+    read its writes; see `_joins_request`. Other reads stay native, on their
+    own connection and transaction.
+    """
+
+    def __init__(self, url: str, replica_urls: Optional[List[str]] = None):
+        super().__init__(url, replica_urls)
+        self.async_engine = create_async_db_engine(async_url(url))
+        self.async_replicas = [
+            create_async_db_engine(async_url(replica), label=f"async-replica-{i}")
+            for i, replica in enumerate(replica_urls or [])
+        ]
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = super().pool_stats()
+        stats["async"] = pool_stats(self.async_engine.sync_engine)
+        for i, replica in enumerate(self.async_replicas):
+            stats[f"async-replica-{i}"] = pool_stats(replica.sync_engine)
+        return stats
+
+    async def aclose(self) -> None:
+        await self.async_engine.dispose()
+        for replica in self.async_replicas:
+            await replica.dispose()
+        await super().aclose()
+
+    def _async_session(self, write: bool = False) -> AsyncSession:
+        # info["db"] lets the session hooks find our entity cache
+        info = {"db": self, REPLICAS: [r.sync_engine for r in self.async_replicas]}
+        if write:
+            info[USE_PRIMARY] = True
+        return AsyncSession(
+            self.async_engine, info=info, sync_session_class=RoutingSession
+        )
+
+    def _joins_request(self, write: bool = False) -> bool:
+        "Whether an `a*` call must run on the request's session"
+        session = current_session.get()
+        if session is None or session.info.get("db") is not self:
+            return False
+        lock = session.info.get(SESSION_LOCK)
+        if lock is not None and lock.locked():
+            # A joined call is using the session, maybe writing: queue behind it
+            return True
+        return write or not self._shares_reads()
+
+    async def get_async_session(self) -> AsyncGenerator[AsyncSession, None]:
+        async with self._async_session() as session:
+            yield session
+
+    async def aall_records(self, model: Type[SQLModel]) -> List[SQLModel]:
+        if self._joins_request():
+            return await super().aall_records(model)
+        async with self._async_session() as session:
+            results = await session.exec(select(model))
+            return results.all()
+
+    async def aquery_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        if self._joins_request():
+            return await super().aquery_records(
+                model,
+                search_value=search_value,
+                sorting_field=sorting_field,
+                sort_direction=sort_direction,
+                limit=limit,
+                offset=offset,
+                as_dict=as_dict,
+                fields=fields,
+                keyset=keyset,
+                cursor=cursor,
+                with_total=with_total,
+                substring=substring,
+            )
+        if as_dict:
+            key = query_key(
+                search_value,
+                sorting_field,
+                sort_direction,
+                limit,
+                offset,
+                fields,
+                keyset,
+                cursor,
+                with_total,
+                substring,
+            )
+            cached = self.query_cache.get(model, key)
+            if cached is not None:
+                return cached
+            version = self.query_cache.version(model)
+
+        async def run():
+            async with self._async_session() as session:
+                result = await self._arun_query(
+                    session,
+                    model,
+                    search_value=search_value,
+                    sorting_field=sorting_field,
+                    sort_direction=sort_direction,
+                    limit=limit,
+                    offset=offset,
+                    as_dict=as_dict,
+                    fields=fields,
+                    keyset=keyset,
+                    cursor=cursor,
+                    with_total=with_total,
+                    substring=substring,
+                )
+                if as_dict and can_fill(session.sync_session, self.query_cache, model):
+                    self.query_cache.put(model, version, key, result)
+                return result
+
+        if not as_dict:
+            return await run()
+        return await self.flights.ado(model, ("query", version, key), run)
+
+    async def _arun_query(
+        self,
+        session: AsyncSession,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        # Unfiltered totals follow the model's count_strategy rather than a
+        # window count over every row
+        table_total = (
+            with_total and not search_value and count_strategy(model) != EXACT
+        )
+        window = with_total and not table_total
+        query, params = self._build_query(
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            limit=limit,
+            offset=offset,
+            fields=fields,
+            keyset=keyset,
+            cursor=cursor,
+            with_total=window,
+            substring=substring,
+        )
+        records = None
+        if fields and as_dict and not keyset and not window:
+            result = await self._acore_execute(session, query, params)
+            records = [dict(row) for row in result.mappings()]
+        elif fields:
+            results = (await self._acore_execute(session, query, params)).all()
+        else:
+            results = (await session.exec(query, params=params)).all()
+
+        if keyset:
+            page = self._keyset_page(
+                model, results, sorting_field, limit, cursor, as_dict, fields
+            )
+            if table_total:
+                page.total, page.approximate = await self._atable_count(session, model)
+            elif with_total:
+                count_query, params = self._count_query(
+                    model, search_value, substring
+                )
+                page.total = (await session.exec(count_query, params=params)).one()
+            return page
+
+        if window:
+            records, total = self._split_total(results, fields, as_dict)
+            if total is None:
+                count_query, params = self._count_query(
+                    model, search_value, substring
+                )
+                total = 0
+                if offset:
+                    total = (await session.exec(count_query, params=params)).one()
+            return Page(records=records, total=total)
+
+        if records is None:
+            records = [result._asdict() for result in results] if as_dict else results
+        if table_total:
+            total, approximate = await self._atable_count(session, model)
+            return Page(records=records, total=total, approximate=approximate)
+        return records
+
+    async def _atable_count(
+        self, session: AsyncSession, model: Type[SQLModel]
+    ) -> Tuple[int, bool]:
+        strategy = count_strategy(model)
+        if strategy == CACHED:
+            cached = self.counts.get(model)
+            if cached is not None:
+                return cached, False
+        elif strategy == ESTIMATED:
+            connection = await session.connection()
+            estimate = await connection.run_sync(estimate_rows, model)
+            if estimate is not None:
+                return estimate, True
+        elif strategy == MAINTAINED and self.counters.available(model):
+            maintained = await session.scalar(self.counters.query(model))
+            if maintained is not None:
+                return maintained, False
+        query, params = self._count_query(model)
+        total = (await session.exec(query, params=params)).one()
+        if strategy == CACHED:
+            self.counts.put(model, total)
+        return total, False
+
+    async def _acore_execute(
+        self, session: AsyncSession, query, params: Dict[str, Any]
+    ):
+        if session.autoflush:
+            await session.flush()
+        connection = await session.connection(bind_arguments={"clause": query})
+        return await connection.execute(query, params)
+
+    async def astream_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+        substring: bool = False,
+    ) -> AsyncIterator[Union[SQLModel, Dict[str, Any]]]:
+        if self._joins_request():
+            records = super().astream_records(
+                model,
+                search_value=search_value,
+                sorting_field=sorting_field,
+                sort_direction=sort_direction,
+                as_dict=as_dict,
+                fields=fields,
+                batch_size=batch_size,
+                substring=substring,
+            )
+            async for record in records:
+                yield record
+            return
+        query, params = self._build_query(
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            fields=fields,
+            substring=substring,
+        )
+        options = {"yield_per": batch_size}
+        async with self._async_session() as session:
+            result = await session.stream(
+                query, params=params, execution_options=options
+            )
+            if not fields:
+                result = result.scalars()
+            async for partition in result.partitions():
+                for row in partition:
+                    yield self._stream_row(row, fields, as_dict)
+
+    async def aget_record(
+        self, model: Type[SQLModel], id: Any, alt_key: str = None
+    ) -> Optional[SQLModel]:
+        if self._joins_request():
+            return await super().aget_record(model, id, alt_key)
+        cached = self.cache.get(model, id, alt_key)
+        if cached is not None:
+            return cached
+        async with self._async_session() as session:
+            if alt_key:
+                stmt = select(model).where(getattr(model, alt_key) == id)
+                result = (await session.exec(stmt)).first()
+            else:
+                if isinstance(id, str):
+                    id = UUID(id)
+                result = await session.get(model, id)
+            if result is not None and can_fill(
+                session.sync_session, self.cache, model, result
+            ):
+                self.cache.put(result)
+            return result
+
+    async def aupdate_record(
+        self, model: Type[SQLModel], id: Any, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if self._joins_request(write=True):
+            return await super().aupdate_record(model, id, data)
+        async with self._async_session(write=True) as session:
+            record = await session.get(model, id)
+            if not record:
+                raise Exception(f"Record with id {id} not found")
+            for key, value in data.items():
+                setattr(record, key, value)
+            session.add(record)
+            await session.commit()
+            await session.refresh(record)
+            return record.dict()
+
+    async def asave_record(self, record: SQLModel) -> SQLModel:
+        if self._joins_request(write=True):
+            return await super().asave_record(record)
+        model = type(record)
+        if not sa.inspect(record).has_identity:
+            return await self.aupsert_record(model, record.dict())
+        changes = changed_columns(record, utc_now())
+        if not changes:
+            return record
+        async with self._async_session(write=True) as session:
+            connection = await session.connection()
+            stmt = update_statement(model.__table__)
+            result = await connection.execute(stmt, {**changes, ID_PARAM: record.id})
+            if result.rowcount:
+                mark_saved(record, changes)
+                self._written(session.sync_session, model, [record.id])
+                await session.commit()
+        if not result.rowcount:
+            return await self.aupsert_record(model, record.dict())
+        return record
+
+    async def adelete_record(self, model: Type[SQLModel], id: Any) -> None:
+        if self._joins_request(write=True):
+            return await super().adelete_record(model, id)
+        async with self._async_session(write=True) as session:
+            record = await session.get(model, id)
+            if record:
+                await session.delete(record)
+                await session.commit()
+
+    async def aupsert_record(
+        self,
+        model: Type[SQLModel],
+        data: Dict[str, Any],
+        conflict_target: ConflictTarget = None,
+    ) -> SQLModel:
+        if self._joins_request(write=True):
+            return await super().aupsert_record(model, data, conflict_target)
+        target = conflict_columns(model, conflict_target)
+        data = {k: v for k, v in data.items() if k not in TIMESTAMP_FIELDS}
+        if "id" in data:
+            data["id"] = coerce_id(data["id"])
+        stmt = self._native_upsert(model, data, target)
+        async with self._async_session(write=True) as session:
+            if stmt is not None:
+                db_record = (await session.exec(stmt)).scalars().one()
+                self._written(session.sync_session, model, [db_record.id])
+                session.expunge(db_record)
+                await session.commit()
+                return db_record
+
+            db_record = None
+            condition = self._lookup_condition(model, data, target)
+            if condition is not None:
+                query = select(model).where(condition)
+                db_record = (await session.exec(query)).first()
+            db_record = self._merge_upsert(model, data, db_record)
+
+            session.add(db_record)
+            await session.commit()
+            await session.refresh(db_record)
+
+            return db_record
+
+    async def abulk_insert(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        returning: bool = False,
+    ) -> Union[int, List[Any]]:
+        if self._joins_request(write=True):
+            return await super().abulk_insert(model, data, chunk_size, returning)
+        rows = prepare_rows(model, data, utc_now())
+        table = model.__table__
+        ids = []
+        async with self._async_session(write=True) as session:
+            connection = await session.connection()
+            mark_stale(session.sync_session, self.query_cache, model, None)
+            for chunk in chunked(rows, chunk_size):
+                if returning:
+                    stmt = sa.insert(table).returning(table.c.id)
+                    ids.extend((await connection.execute(stmt, chunk)).scalars().all())
+                else:
+                    await connection.execute(sa.insert(table), chunk)
+            await session.commit()
+        return ids if returning else len(rows)
+
+    async def abulk_update(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        refresh: bool = False,
+    ) -> Union[int, List[SQLModel]]:
+        if self._joins_request(write=True):
+            return await super().abulk_update(model, data, chunk_size, refresh)
+        groups = prepare_updates(model, data, utc_now())
+        stmt = update_statement(model.__table__)
+        matched = 0
+        async with self._async_session(write=True) as session:
+            connection = await session.connection()
+            for rows in groups.values():
+                ids = [row[ID_PARAM] for row in rows]
+                self._written(session.sync_session, model, ids)
+                for chunk in chunked(rows, chunk_size):
+                    matched += (await connection.execute(stmt, chunk)).rowcount
+            await session.commit()
+            if not refresh:
+                return matched
+            ids = [row[ID_PARAM] for rows in groups.values() for row in rows]
+            records = []
+            for chunk in chunked(list(dict.fromkeys(ids)), chunk_size):
+                query = select(model).where(model.id.in_(chunk))
+                records += (await session.exec(query)).all()
+            return records
+
+    async def acount_records(self, model: Type[SQLModel]) -> int:
+        if self._joins_request():
+            return await super().acount_records(model)
+
+        async def run():
+            async with self._async_session() as session:
+                return (await self._atable_count(session, model))[0]
+
+        version = self.query_cache.version(model)
+        return await self.flights.ado(model, ("count", version), run)
@@ -1,18 +1,45 @@
 # db/base.py
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Generator, Any, Dict, List, Optional, Type
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    Union,
+)
 from sqlmodel import SQLModel
 
+from modules.shared.db.bulk import BULK_CHUNK_SIZE, ConflictTarget
+from modules.shared.db.pagination import Page
+from modules.shared.db.session import request_lock
+
+# Rows fetched per round trip by stream_records
+STREAM_BATCH_SIZE = 1000
+
 
 class DatabaseService(ABC):
     @abstractmethod
     def init_db(self) -> None:
         pass
 
+    @abstractmethod
+    def new_session(self) -> Any:
+        pass
+
     @abstractmethod
     def get_session(self) -> Generator[Any, None, None]:
         pass
 
+    @abstractmethod
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        pass
+
     @abstractmethod
     def schema(self) -> str:
         pass
@@ -32,7 +59,25 @@ class DatabaseService(ABC):
         offset: Optional[int] = None,
         as_dict: bool = False,
         fields: Optional[List[str]] = None,
-    ) -> List[Dict[str, Any]]:
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        pass
+
+    @abstractmethod
+    def stream_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+        substring: bool = False,
+    ) -> Iterator[Union[SQLModel, Dict[str, Any]]]:
         pass
 
     @abstractmethod
@@ -41,32 +86,236 @@ class DatabaseService(ABC):
     ) -> Optional[SQLModel]:
         pass
 
+    @abstractmethod
+    def get_records(
+        self, model: Type[SQLModel], values: List[Any], key: str = "id"
+    ) -> List[SQLModel]:
+        "Records whose `key` is in `values`, in no particular order"
+        pass
+
     @abstractmethod
     def update_record(
         self, model: Type[SQLModel], id: Any, data: Dict[str, Any]
     ) -> Dict[str, Any]:
         pass
 
+    @abstractmethod
+    def save_record(self, record: SQLModel) -> SQLModel:
+        "Insert a new record, or write only the columns changed since it was loaded"
+        pass
+
     @abstractmethod
     def delete_record(self, model: Type[SQLModel], id: Any) -> None:
         pass
 
     @abstractmethod
-    def upsert_record(self, model: Type[SQLModel], data: Dict[str, Any]) -> SQLModel:
+    def upsert_record(
+        self,
+        model: Type[SQLModel],
+        data: Dict[str, Any],
+        conflict_target: ConflictTarget = None,
+    ) -> SQLModel:
+        pass
+
+    @abstractmethod
+    def upsert_many(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        conflict_target: ConflictTarget = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
         pass
 
     @abstractmethod
     def bulk_insert(
-        self, model: Type[SQLModel], data: List[Dict[str, Any]]
-    ) -> List[SQLModel]:
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        returning: bool = False,
+    ) -> Union[int, List[Any]]:
         pass
 
     @abstractmethod
     def bulk_update(
-        self, model: Type[SQLModel], data: List[Dict[str, Any]]
-    ) -> List[SQLModel]:
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        refresh: bool = False,
+    ) -> Union[int, List[SQLModel]]:
         pass
 
     @abstractmethod
     def count_records(self, model: Type[SQLModel]) -> int:
         pass
+
+    def install_runtime_objects(self) -> None:
+        "Create the database objects that live outside the Alembic migrations"
+        pass
+
+    def reconcile_counts(self) -> Dict[str, int]:
+        "Correct drift in maintained row counters; returns the drift per table"
+        return {}
+
+    async def astart(self) -> None:
+        "Start background maintenance jobs; called on application startup"
+        pass
+
+    async def aclose(self) -> None:
+        "Release pooled connections; called on application shutdown"
+        pass
+
+    # Awaitable twins of the record methods. The defaults run the synchronous
+    # implementation in a worker thread so the event loop is never blocked;
+    # async-native backends override them.
+
+    async def _in_thread(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `fn` in a worker thread, one at a time on the request session.
+
+        Worker threads inherit `current_session`, and a Session is not
+        thread-safe: calls gathered in one request take turns on it.
+        """
+        lock = request_lock(self)
+        if lock is None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        async with lock:
+            call = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # The thread cannot be stopped: hold the session until it ends
+                await asyncio.wait([call])
+                raise
+
+    async def aall_records(self, model: Type[SQLModel]) -> List[SQLModel]:
+        return await self._in_thread(self.all_records, model)
+
+    async def aquery_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        return await self._in_thread(
+            self.query_records,
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            limit=limit,
+            offset=offset,
+            as_dict=as_dict,
+            fields=fields,
+            keyset=keyset,
+            cursor=cursor,
+            with_total=with_total,
+            substring=substring,
+        )
+
+    async def astream_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+        substring: bool = False,
+    ) -> AsyncIterator[Union[SQLModel, Dict[str, Any]]]:
+        records = self.stream_records(
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            as_dict=as_dict,
+            fields=fields,
+            batch_size=batch_size,
+            substring=substring,
+        )
+
+        def next_batch() -> List[Union[SQLModel, Dict[str, Any]]]:
+            return [record for _, record in zip(range(batch_size), records)]
+
+        try:
+            while batch := await self._in_thread(next_batch):
+                for record in batch:
+                    yield record
+        finally:
+            await self._in_thread(records.close)
+
+    async def aget_record(
+        self, model: Type[SQLModel], id: Any, alt_key: str = None
+    ) -> Optional[SQLModel]:
+        return await self._in_thread(self.get_record, model, id, alt_key)
+
+    async def aget_records(
+        self, model: Type[SQLModel], values: List[Any], key: str = "id"
+    ) -> List[SQLModel]:
+        return await self._in_thread(self.get_records, model, values, key)
+
+    async def asave_record(self, record: SQLModel) -> SQLModel:
+        return await self._in_thread(self.save_record, record)
+
+    async def aupdate_record(
+        self, model: Type[SQLModel], id: Any, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return await self._in_thread(self.update_record, model, id, data)
+
+    async def adelete_record(self, model: Type[SQLModel], id: Any) -> None:
+        return await self._in_thread(self.delete_record, model, id)
+
+    async def aupsert_record(
+        self,
+        model: Type[SQLModel],
+        data: Dict[str, Any],
+        conflict_target: ConflictTarget = None,
+    ) -> SQLModel:
+        return await self._in_thread(self.upsert_record, model, data, conflict_target)
+
+    async def aupsert_many(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        conflict_target: ConflictTarget = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        return await self._in_thread(
+            self.upsert_many, model, data, conflict_target, chunk_size
+        )
+
+    async def abulk_insert(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        returning: bool = False,
+    ) -> Union[int, List[Any]]:
+        return await self._in_thread(
+            self.bulk_insert, model, data, chunk_size, returning
+        )
+
+    async def abulk_update(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        refresh: bool = False,
+    ) -> Union[int, List[SQLModel]]:
+        return await self._in_thread(
+            self.bulk_update, model, data, chunk_size, refresh
+        )
+
+    async def acount_records(self, model: Type[SQLModel]) -> int:
+        return await self._in_thread(self.count_records, model)
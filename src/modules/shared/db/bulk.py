@@ -0,0 +1,209 @@
+import io
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type, Union
+
+from uuid import UUID
+
+from decouple import config
+from pydantic_core import PydanticUndefined
+from sqlalchemy import Table, bindparam, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import SQLModel
+
+BULK_CHUNK_SIZE = config("DATABASE_BULK_CHUNK_SIZE", default=1000, cast=int)
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+# A unique column name, several of them, or None for the primary key
+ConflictTarget = Optional[Union[str, Sequence[str]]]
+# Bind name for the row id in bulk UPDATEs; must not clash with a column name
+ID_PARAM = "_id"
+
+
+def coerce_id(value: Any) -> Any:
+    "Ids arrive as strings from forms and JSON; the UUID column type wants UUIDs"
+    return UUID(value) if isinstance(value, str) else value
+
+
+def chunked(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    if size < 1:
+        raise ValueError(f"Chunk size must be positive, got {size}")
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def prepare_rows(
+    model: Type[SQLModel], data: List[Dict[str, Any]], now: datetime
+) -> List[Dict[str, Any]]:
+    """Column dicts for a Core executemany, without building ORM objects.
+
+    Every row gets the same keys: missing values take the field default
+    (`default_factory` is called per row), and the timestamps all share `now`.
+    """
+    present = {key for item in data for key in item}
+    fillers: Dict[str, Callable[[], Any]] = {}
+    for name in model.__table__.columns.keys():
+        field = model.model_fields.get(name)
+        if name in TIMESTAMP_FIELDS:
+            fillers[name] = lambda: now
+        elif field is not None and field.default_factory is not None:
+            fillers[name] = field.default_factory
+        elif field is not None and field.default is not PydanticUndefined:
+            fillers[name] = lambda default=field.default: default
+        elif name in present:
+            fillers[name] = lambda: None
+    rows = [
+        {name: item[name] if name in item else fill() for name, fill in fillers.items()}
+        for item in data
+    ]
+    if "id" in present:
+        for row in rows:
+            row["id"] = coerce_id(row["id"])
+    return rows
+
+
+def _copy_value(value: Any) -> str:
+    "CSV field for COPY: unquoted empty is NULL, everything else is quoted"
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, default=str)
+    elif isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    elif isinstance(value, Enum):
+        # SQLAlchemy's Enum type stores member names, not values
+        value = value.name
+    text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def copy_rows(connection: Connection, table: Table, rows: List[Dict[str, Any]]) -> bool:
+    """Load `rows` with Postgres `COPY ... FROM STDIN` on the session's connection.
+
+    Returns False for drivers other than psycopg2 (whose `copy_expert` is
+    used), so the caller can fall back to executemany.
+    """
+    if connection.dialect.driver != "psycopg2":
+        return False
+    driver_connection = connection.connection.driver_connection
+    preparer = connection.dialect.identifier_preparer
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_value(row[column]) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+    with driver_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {preparer.format_table(table)} "
+            f"({', '.join(preparer.quote(c) for c in columns)}) "
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    return True
+
+
+def prepare_updates(
+    model: Type[SQLModel], data: List[Dict[str, Any]], now: datetime
+) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+    """Group update rows by the columns they set, one executemany per group.
+
+    The id moves to the `ID_PARAM` bind and `updated_at` is bumped to `now`
+    unless the row sets it. Rows without an id are skipped.
+    """
+    columns = set(model.__table__.columns.keys())
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for item in data:
+        if "id" not in item:
+            continue
+        row = {key: value for key, value in item.items() if key in columns and key != "id"}
+        if "updated_at" in columns and "updated_at" not in row:
+            row["updated_at"] = now
+        if not row:
+            continue
+        row[ID_PARAM] = coerce_id(item["id"])
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+def update_statement(table: Table):
+    "UPDATE by primary key; the SET clause comes from the executemany rows"
+    return update(table).where(table.c.id == bindparam(ID_PARAM))
+
+
+def changed_columns(record: SQLModel, now: datetime) -> Dict[str, Any]:
+    """Columns of a loaded `record` assigned a new value since it was loaded.
+
+    Values equal to the loaded ones do not count; in-place changes to mutable
+    values (a JSON dict) are not seen, so reassign them. `updated_at` is bumped
+    to `now` whenever something changed. Empty when there is nothing to write.
+    """
+    state = inspect(record)
+    columns = record.__table__.columns
+    changes = {
+        key: getattr(record, key)
+        for key in state.committed_state
+        if key in columns and state.attrs[key].history.has_changes()
+    }
+    if changes and "updated_at" in columns and "updated_at" not in changes:
+        changes["updated_at"] = now
+    return changes
+
+
+def mark_saved(record: SQLModel, values: Dict[str, Any]) -> None:
+    "Make `values` the loaded state of `record`: they are in its row now"
+    for key, value in values.items():
+        set_committed_value(record, key, value)
+
+
+def conflict_columns(
+    model: Type[SQLModel], conflict_target: ConflictTarget = None
+) -> List[str]:
+    "Columns of the unique constraint an upsert collides on (default: primary key)"
+    if conflict_target is None:
+        return [column.name for column in model.__table__.primary_key.columns]
+    if isinstance(conflict_target, str):
+        return [conflict_target]
+    return list(conflict_target)
+
+
+def missing_required(table: Table, row: Dict[str, Any]) -> List[str]:
+    "NOT NULL columns `row` leaves to neither a value nor a default"
+    return [
+        column.name
+        for column in table.columns
+        if column.name not in row
+        and not column.nullable
+        and column.default is None
+        and column.server_default is None
+    ]
+
+
+def upsert_statement(
+    model: Type[SQLModel], dialect: str, keys: Sequence[str], target: List[str]
+):
+    """Dialect-native `INSERT ... ON CONFLICT (target) DO UPDATE` for `model`.
+
+    Only the columns in `keys` are overwritten on conflict, along with
+    `updated_at`; the id, `created_at` and the target itself are kept.
+    Returns None on dialects without ON CONFLICT.
+    """
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model)
+    else:
+        return None
+    columns = model.__table__.columns
+    keep = set(target) | {"id", "created_at"}
+    updates = {
+        key: stmt.excluded[key] for key in keys if key in columns and key not in keep
+    }
+    if "updated_at" in columns:
+        updates["updated_at"] = stmt.excluded.updated_at
+    if not updates:
+        # DO NOTHING would return no row; a no-op update still returns it
+        updates = {target[0]: stmt.excluded[target[0]]}
+    return stmt.on_conflict_do_update(index_elements=target, set_=updates)
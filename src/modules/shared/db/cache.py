@@ -0,0 +1,430 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type, Union
+
+import sqlalchemy as sa
+from decouple import config
+from sqlalchemy import event, exc, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlmodel import SQLModel
+
+from modules.shared.db.bulk import coerce_id
+from modules.shared.db.session import reads_replica
+from modules.shared.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ENTITY_CACHE_SIZE = config("DATABASE_ENTITY_CACHE_SIZE", default=10000, cast=int)
+QUERY_CACHE_SIZE = config("DATABASE_QUERY_CACHE_SIZE", default=1000, cast=int)
+QUERY_CACHE_TTL = config("DATABASE_QUERY_CACHE_TTL", default=300, cast=float)
+# Seconds between reads of the table versions other processes publish
+QUERY_CACHE_SYNC = config("DATABASE_QUERY_CACHE_SYNC", default=1, cast=float)
+VERSIONS_TABLE = "table_versions"
+REPLICA_LAG = config("DATABASE_REPLICA_LAG", default=5, cast=float)
+# Session.info key collecting the writes of the session's open transaction
+STALE = "stale_entities"
+
+CACHE_HITS = registry.counter(
+    "db_entity_cache_hits_total",
+    "get_record calls served from the entity cache",
+    labelnames=("model",),
+)
+CACHE_MISSES = registry.counter(
+    "db_entity_cache_misses_total",
+    "get_record calls on cached models that went to the database",
+    labelnames=("model",),
+)
+QUERY_CACHE_HITS = registry.counter(
+    "db_query_cache_hits_total",
+    "query_records calls served from the result cache",
+    labelnames=("model",),
+)
+QUERY_CACHE_MISSES = registry.counter(
+    "db_query_cache_misses_total",
+    "query_records calls that went to the database",
+    labelnames=("model",),
+)
+QUERY_CACHE_EVICTIONS = registry.counter(
+    "db_query_cache_evictions_total",
+    "Results dropped from the full result cache",
+    labelnames=("model",),
+)
+
+
+def cache_ttl(model: Type[SQLModel]) -> Optional[float]:
+    "Seconds `model` records may be cached for; None when the model opted out"
+    return getattr(model, "cache_ttl", None)
+
+
+def alt_keys(model: Type[SQLModel]) -> Tuple[str, ...]:
+    return tuple(getattr(model, "alt_keys", None) or ())
+
+
+class WriteClock:
+    "When each table was last written through this process (see `can_fill`)"
+
+    def __init__(self):
+        self._written_at: Dict[str, float] = {}
+
+    def _written(self, model: Type[SQLModel]) -> None:
+        self._written_at[model.__tablename__] = time.monotonic()
+
+    def settled(self, model: Type[SQLModel]) -> bool:
+        "Whether replicas have had REPLICA_LAG seconds to catch up on `model`"
+        written_at = self._written_at.get(model.__tablename__)
+        return written_at is None or time.monotonic() - written_at >= REPLICA_LAG
+
+
+class EntityCache(WriteClock):
+    """Bounded LRU of record column values with a per-model TTL.
+
+    Entries are keyed by (table, id); each model's `alt_keys` (unique columns
+    such as `email`) point at the id entry. Hits return a fresh detached
+    instance, so callers never share mutable state.
+    """
+
+    def __init__(self, maxsize: int = ENTITY_CACHE_SIZE):
+        super().__init__()
+        self.maxsize = maxsize
+        # (table, id) -> (expiry, column values, alt-key pointers to this entry)
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[float, Dict, List]]" = (
+            OrderedDict()
+        )
+        self._alt: Dict[Tuple[str, str, Any], Any] = {}
+        self._lock = threading.Lock()
+
+    def _id_for(self, model: Type[SQLModel], key: Optional[str], value: Any) -> Any:
+        if key is None or key == "id":
+            return coerce_id(value)
+        return self._alt.get((model.__tablename__, key, value))
+
+    def get(
+        self, model: Type[SQLModel], value: Any, key: Optional[str] = None
+    ) -> Optional[SQLModel]:
+        if cache_ttl(model) is None or key not in (None, "id", *alt_keys(model)):
+            return None
+        table = model.__tablename__
+        with self._lock:
+            id = self._id_for(model, key, value)
+            entry = self._entries.get((table, id))
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop((table, id))
+                entry = None
+            if entry is None:
+                CACHE_MISSES.inc(model=table)
+                return None
+            self._entries.move_to_end((table, id))
+            values = copy.deepcopy(entry[1])
+        CACHE_HITS.inc(model=table)
+        record = model(**values)
+        make_transient_to_detached(record)
+        return record
+
+    def put(self, record: SQLModel) -> None:
+        model = type(record)
+        ttl = cache_ttl(model)
+        if ttl is None:
+            return
+        values = {
+            attr.key: getattr(record, attr.key) for attr in inspect(model).column_attrs
+        }
+        table = model.__tablename__
+        key = (table, values["id"])
+        pointers = [(table, alt, values.get(alt)) for alt in alt_keys(model)]
+        expires = time.monotonic() + ttl
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (expires, copy.deepcopy(values), pointers)
+            for pointer in pointers:
+                self._alt[pointer] = values["id"]
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: Tuple[str, Any]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for pointer in entry[2]:
+            if self._alt.get(pointer) == key[1]:
+                del self._alt[pointer]
+
+    def invalidate(self, model: Type[SQLModel], ids: Optional[Iterable[Any]]) -> None:
+        "Drop `ids` of `model`, or every cached `model` record when ids is None"
+        if cache_ttl(model) is None:
+            return
+        self._written(model)
+        if ids is None:
+            self.clear(model)
+            return
+        with self._lock:
+            for id in ids:
+                self._drop((model.__tablename__, coerce_id(id)))
+
+    def clear(self, model: Optional[Type[SQLModel]] = None) -> None:
+        with self._lock:
+            if model is None:
+                self._entries.clear()
+                self._alt.clear()
+                return
+            for key in [k for k in self._entries if k[0] == model.__tablename__]:
+                self._drop(key)
+
+
+# A table's (local, shared) version pair, see QueryCache.version
+Version = Tuple[int, int]
+
+
+class QueryCache(WriteClock):
+    """LRU of `query_records` results scoped by per-table version counters.
+
+    Every write through the service bumps the table's version, so entries
+    cached under an older version can never be served again (they age out of
+    the LRU).
+
+    Local versions only see this process' writes. With an `engine`, each
+    committing transaction also bumps its tables' rows in `table_versions`
+    (created by `fh install`), and every process re-reads that table at most
+    every `sync` seconds: writes by other workers go unseen for up to `sync`
+    seconds, or up to `ttl` while the table is not installed.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = QUERY_CACHE_SIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        engine: Optional[Engine] = None,
+        sync: float = QUERY_CACHE_SYNC,
+    ):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.engine = engine
+        self.sync = sync
+        self._versions: Dict[str, int] = {}
+        self._shared: Dict[str, int] = {}
+        # monotonic time of the last read of `table_versions`, None before it
+        self._synced_at: Optional[float] = None
+        # Whether `table_versions` exists, None until it is first read
+        self._shared_installed: Optional[bool] = None
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _versions_table(self) -> sa.TableClause:
+        return sa.table(VERSIONS_TABLE, sa.column("table_name"), sa.column("version"))
+
+    def install(self) -> None:
+        "Create the shared `table_versions` table (run by `fh install`)"
+        if self.engine is None:
+            return
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} "
+                "(table_name VARCHAR PRIMARY KEY, version BIGINT NOT NULL)"
+            )
+        self._synced_at = None
+
+    def _sync(self) -> None:
+        "Re-read the shared versions when the last read is `sync` seconds old"
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync:
+                return
+            # Other threads keep using the previous versions meanwhile
+            self._synced_at = now
+        versions = self._versions_table()
+        query = sa.select(versions.c.table_name, versions.c.version)
+        try:
+            with self.engine.connect() as conn:
+                shared = {table: version for table, version in conn.execute(query)}
+        except exc.DBAPIError:
+            if self._shared_installed is not False:
+                logger.warning(
+                    f"{VERSIONS_TABLE} is not installed; other processes' writes "
+                    "stay cached up to the query cache TTL until `fh install` is run"
+                )
+            self._shared, self._shared_installed = {}, False
+            return
+        self._shared, self._shared_installed = shared, True
+
+    def version(self, model: Type[SQLModel]) -> Version:
+        "Read before running the query, so a concurrent write makes the fill moot"
+        table = model.__tablename__
+        if self.engine is None or not self.maxsize:
+            return (self._versions.get(table, 0), 0)
+        self._sync()
+        return (self._versions.get(table, 0), self._shared.get(table, 0))
+
+    def publish(self, session: Session, tables: Set[str]) -> None:
+        "Bump the shared versions of `tables` inside `session`'s transaction"
+        if self.engine is None:
+            return
+        self._sync()
+        if not self._shared_installed:
+            return
+        bump = sa.text(
+            f"INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (:table, 1) "
+            "ON CONFLICT (table_name) DO UPDATE "
+            f"SET version = {VERSIONS_TABLE}.version + 1"
+        )
+        connection = session.connection()
+        # A fixed order keeps concurrent commits from deadlocking on the rows
+        for table in sorted(tables):
+            connection.execute(bump, {"table": table})
+
+    def get(self, model: Type[SQLModel], params: Tuple) -> Optional[Any]:
+        if not self.maxsize:
+            return None
+        table = model.__tablename__
+        key = (table, self.version(model), params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                QUERY_CACHE_MISSES.inc(model=table)
+                return None
+            self._entries.move_to_end(key)
+        QUERY_CACHE_HITS.inc(model=table)
+        return copy.deepcopy(entry[1])
+
+    def put(
+        self, model: Type[SQLModel], version: Version, params: Tuple, value: Any
+    ) -> None:
+        if not self.maxsize or version != self.version(model):
+            return
+        table = model.__tablename__
+        entry = (time.monotonic() + self.ttl, copy.deepcopy(value))
+        with self._lock:
+            self._entries[(table, version, params)] = entry
+            self._entries.move_to_end((table, version, params))
+            while len(self._entries) > self.maxsize:
+                (evicted, _, _), _ = self._entries.popitem(last=False)
+                QUERY_CACHE_EVICTIONS.inc(model=evicted)
+
+    def invalidate(
+        self, model: Type[SQLModel], ids: Optional[Iterable[Any]] = None
+    ) -> None:
+        "Any write makes every cached result for the table stale"
+        with self._lock:
+            table = model.__tablename__
+            self._versions[table] = self._versions.get(table, 0) + 1
+        self._written(model)
+
+
+def query_key(
+    search_value: Optional[str],
+    sorting_field: Optional[str],
+    sort_direction: str,
+    limit: Optional[int],
+    offset: Optional[int],
+    fields: Optional[List[str]],
+    keyset: bool,
+    cursor: Optional[str],
+    with_total: bool,
+    substring: bool,
+) -> Tuple:
+    "Normalized `query_records` arguments: equivalent calls share one entry"
+    return (
+        search_value or None,
+        sorting_field,
+        sort_direction.lower() == "desc",
+        limit,
+        offset or None,
+        tuple(fields) if fields else None,
+        keyset,
+        cursor if keyset else None,
+        with_total,
+        substring and bool(search_value),
+    )
+
+
+def mark_stale(
+    session: Session,
+    cache: Union[EntityCache, QueryCache],
+    model: Type[SQLModel],
+    ids: Optional[Iterable[Any]],
+) -> None:
+    """Invalidate now, and again once `session` commits.
+
+    Another request may re-cache the old row between our write and the
+    commit of a request-scoped session; the second pass drops it. Sessions
+    that wrote also stop filling the cache (see `can_fill`).
+    """
+    ids = None if ids is None else list(ids)
+    cache.invalidate(model, ids)
+    session.info.setdefault(STALE, []).append((cache, model, ids))
+
+
+def has_writes(session: Session) -> bool:
+    "Whether `session` holds writes other sessions cannot see yet"
+    return bool(
+        session.info.get(STALE) or session.new or session.dirty or session.deleted
+    )
+
+
+def can_fill(
+    session: Session,
+    cache: WriteClock,
+    model: Type[SQLModel],
+    record: Optional[SQLModel] = None,
+) -> bool:
+    """Only committed, current state may be cached.
+
+    Not from sessions with pending writes, nor from a replica read of a table
+    written in the last REPLICA_LAG seconds: the replica may not have
+    replayed that write yet, and the stale row would be served until it
+    expires. Reads bound to the primary always fill.
+    """
+    if session.info.get(STALE):
+        return False
+    if record is not None and record in session.dirty:
+        return False
+    return not reads_replica(session) or cache.settled(model)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flushed(session: Session, flush_context) -> None:
+    "ORM writes (update_record, delete_record, app code) invalidate themselves"
+    db = session.info.get("db")
+    if db is None:
+        return
+    written: Dict[Type[SQLModel], List[Any]] = {}
+    for record in session.new:
+        written.setdefault(type(record), [])
+    for record in [*session.dirty, *session.deleted]:
+        identity = inspect(record).identity
+        if identity is not None:
+            written.setdefault(type(record), []).append(identity[0])
+    for model, ids in written.items():
+        mark_stale(session, db.cache, model, ids)
+        mark_stale(session, db.query_cache, model, None)
+
+
+@event.listens_for(Session, "before_commit")
+def _publish_versions(session: Session) -> None:
+    "Bump the shared versions of the tables written, atomically with the writes"
+    db = session.info.get("db")
+    if db is None:
+        return
+    if session.new or session.dirty or session.deleted:
+        # The commit's own flush only runs after this hook
+        session.flush()
+    tables = {
+        model.__tablename__
+        for cache, model, _ in session.info.get(STALE, [])
+        if cache is db.query_cache
+    }
+    if tables:
+        db.query_cache.publish(session, tables)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _drop_stale(session: Session) -> None:
+    for cache, model, ids in session.info.pop(STALE, []):
+        cache.invalidate(model, ids)
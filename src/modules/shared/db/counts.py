@@ -0,0 +1,276 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import sqlalchemy as sa
+from decouple import config
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+from modules.shared.db.search import PROBE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# How a model's unfiltered row count is obtained (BaseTable.count_strategy)
+EXACT = "exact"
+CACHED = "cached"
+ESTIMATED = "estimated"
+MAINTAINED = "maintained"
+COUNT_STRATEGIES = (EXACT, CACHED, ESTIMATED, MAINTAINED)
+COUNT_REFRESH = config("DATABASE_COUNT_REFRESH", default=60, cast=float)
+# Seconds between in-process recounts of the maintained counters; off by
+# default, `fh reconcile-counts` runs one from cron or a deploy job instead
+COUNT_RECONCILE = config("DATABASE_COUNT_RECONCILE", default=0, cast=float)
+COUNTS_TABLE = "table_counts"
+
+
+def count_strategy(model: Type[SQLModel]) -> str:
+    strategy = getattr(model, "count_strategy", None) or EXACT
+    if strategy not in COUNT_STRATEGIES:
+        raise ValueError(
+            f"Unknown count_strategy '{strategy}' on {model.__name__}; "
+            f"expected one of {', '.join(COUNT_STRATEGIES)}"
+        )
+    return strategy
+
+
+def count_refresh(model: Type[SQLModel]) -> float:
+    "Seconds a cached count is served before it is recounted"
+    refresh = getattr(model, "count_refresh", None)
+    return COUNT_REFRESH if refresh is None else refresh
+
+
+def estimate_rows(connection: Connection, model: Type[SQLModel]) -> Optional[int]:
+    """Planner statistics' idea of the table size, or None without statistics.
+
+    Postgres keeps `pg_class.reltuples` current through autovacuum/ANALYZE;
+    SQLite only has `sqlite_stat1` after an explicit ANALYZE.
+    """
+    table = model.__tablename__
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        estimate = connection.execute(
+            sa.text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": table},
+        ).scalar()
+        # -1 (or 0 before PG 14) until the table is first vacuumed/analyzed
+        return int(estimate) if estimate is not None and estimate > 0 else None
+    if dialect == "sqlite":
+        has_stats = connection.execute(
+            sa.text(
+                "SELECT count(*) FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'sqlite_stat1'"
+            )
+        ).scalar()
+        if not has_stats:
+            return None
+        # The first number of every stat row is the row count of the table
+        stat = connection.execute(
+            sa.text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table LIMIT 1"),
+            {"table": table},
+        ).scalar()
+        return int(stat.split()[0]) if stat else None
+    return None
+
+
+def humanize_count(count: int) -> str:
+    "Rounded count for estimates: 4213337 -> '4.2M'"
+    for threshold, suffix in ((10**9, "B"), (10**6, "M"), (10**3, "K")):
+        if count >= threshold:
+            value = f"{count / threshold:.1f}".rstrip("0").rstrip(".")
+            return f"{value}{suffix}"
+    return str(count)
+
+
+class CountCache:
+    "Exact counts of `cached`-strategy models, recounted every `count_refresh`"
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: Type[SQLModel]) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(model.__tablename__)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, model: Type[SQLModel], count: int) -> None:
+        expires = time.monotonic() + count_refresh(model)
+        with self._lock:
+            self._entries[model.__tablename__] = (expires, count)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RowCounter:
+    """Row counts of `maintained`-strategy models, kept by database triggers.
+
+    `fh install` (run by `fh migrate`) creates AFTER INSERT/DELETE triggers
+    that adjust the model's row in `table_counts` inside the writing
+    transaction, so every write path (ORM flushes, Core upserts and bulk
+    statements, raw SQL) keeps it exact and `count_records` reads one row
+    instead of scanning the table. The price is that concurrent inserts into
+    one table serialize on that row. Postgres uses statement-level triggers,
+    one update per bulk statement.
+
+    Triggers disabled during a restore or manual edits can still make a
+    counter drift; `reconcile` (`fh reconcile-counts`) recounts and corrects
+    it without blocking writers.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self._installed: Dict[str, bool] = {}
+        # table -> monotonic time of the next probe for a missing counter
+        self._retry: Dict[str, float] = {}
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _ddl(self, model: Type[SQLModel]) -> List[str]:
+        name = model.__tablename__
+        table = self._quote(name)
+        counts = self._quote(COUNTS_TABLE)
+        literal = "'" + name.replace("'", "''") + "'"
+        # SQLite needs the WHERE to parse ON CONFLICT after INSERT ... SELECT
+        seed = (
+            f"INSERT INTO {counts} (table_name, row_count) "
+            f"SELECT {literal}, count(*) FROM {table} WHERE true "
+            "ON CONFLICT (table_name) DO UPDATE SET row_count = excluded.row_count"
+        )
+        create = (
+            f"CREATE TABLE IF NOT EXISTS {counts} "
+            "(table_name VARCHAR PRIMARY KEY, row_count BIGINT NOT NULL)"
+        )
+        adjust = f"UPDATE {counts} SET row_count = row_count %s WHERE table_name = %s"
+        if self.dialect == "sqlite":
+            return [
+                create,
+                f"CREATE TRIGGER IF NOT EXISTS {self._quote(name + '_count_ai')} "
+                f"AFTER INSERT ON {table} BEGIN "
+                f"{adjust % ('+ 1', literal)}; END",
+                f"CREATE TRIGGER IF NOT EXISTS {self._quote(name + '_count_ad')} "
+                f"AFTER DELETE ON {table} BEGIN "
+                f"{adjust % ('- 1', literal)}; END",
+                seed,
+            ]
+        if self.dialect == "postgresql":
+            functions = [
+                ("inserted", "+ (SELECT count(*) FROM new_rows)"),
+                ("deleted", "- (SELECT count(*) FROM old_rows)"),
+                ("truncated", "* 0"),
+            ]
+            triggers = [
+                ("ai", "INSERT", "REFERENCING NEW TABLE AS new_rows ", "inserted"),
+                ("ad", "DELETE", "REFERENCING OLD TABLE AS old_rows ", "deleted"),
+                ("at", "TRUNCATE", "", "truncated"),
+            ]
+            statements = [create]
+            for function, change in functions:
+                statements.append(
+                    f"CREATE OR REPLACE FUNCTION {COUNTS_TABLE}_{function}() "
+                    "RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+                    f"{adjust % (change, 'TG_TABLE_NAME')}; "
+                    "RETURN NULL; END $$"
+                )
+            for suffix, event, referencing, function in triggers:
+                trigger = self._quote(f"{name}_count_{suffix}")
+                statements += [
+                    f"DROP TRIGGER IF EXISTS {trigger} ON {table}",
+                    f"CREATE TRIGGER {trigger} AFTER {event} ON {table} "
+                    f"{referencing}FOR EACH STATEMENT "
+                    f"EXECUTE FUNCTION {COUNTS_TABLE}_{function}()",
+                ]
+            # CREATE TRIGGER holds off writers until commit: the seed is exact
+            return statements + [seed]
+        return []
+
+    def install(self, model: Type[SQLModel]) -> None:
+        statements = self._ddl(model)
+        if not statements:
+            return
+        with self.engine.begin() as conn:
+            for statement in statements:
+                conn.exec_driver_sql(statement)
+        self._installed[model.__tablename__] = True
+        self._retry.pop(model.__tablename__, None)
+
+    def install_all(self, models: Iterable[Type[SQLModel]]) -> None:
+        for model in models:
+            if count_strategy(model) == MAINTAINED:
+                self.install(model)
+
+    def _probe(self, model: Type[SQLModel]) -> bool:
+        if not sa.inspect(self.engine).has_table(COUNTS_TABLE):
+            return False
+        with self.engine.connect() as conn:
+            return conn.execute(self.query(model)).first() is not None
+
+    def available(self, model: Type[SQLModel]) -> bool:
+        name = model.__tablename__
+        if self._installed.get(name):
+            return True
+        retry = self._retry.get(name)
+        if retry is not None and time.monotonic() < retry:
+            return False
+        self._installed[name] = self._probe(model)
+        if not self._installed[name]:
+            if retry is None and count_strategy(model) == MAINTAINED:
+                logger.warning(
+                    f"Row counter for {name} is not installed; its totals are "
+                    "counted until `fh install` is run"
+                )
+            self._retry[name] = time.monotonic() + PROBE_INTERVAL
+        return self._installed[name]
+
+    def query(self, model: Type[SQLModel]):
+        "SELECT of `model`'s maintained count, run on the caller's session"
+        counts = sa.table(COUNTS_TABLE, sa.column("table_name"), sa.column("row_count"))
+        return sa.select(counts.c.row_count).where(
+            counts.c.table_name == model.__tablename__
+        )
+
+    def reconcile(self, model: Type[SQLModel]) -> int:
+        """Recount `model` and correct its counter; returns the drift found.
+
+        The recount and the counter are read by one statement, so they come
+        from the same snapshot and agree unless the counter drifted. The drift
+        is then subtracted rather than the count written back: writes that
+        commit in between have moved the counter by their own rows, and stay
+        counted. Writers are never blocked.
+        """
+        if not self.available(model):
+            return 0
+        name = model.__tablename__
+        recount = sa.select(sa.func.count()).select_from(sa.table(name))
+        snapshot = sa.select(
+            self.query(model).scalar_subquery(), recount.scalar_subquery()
+        )
+        with self.engine.connect() as conn:
+            kept, counted = conn.execute(snapshot).one()
+        drift = (kept or 0) - counted
+        if drift:
+            with self.engine.begin() as conn:
+                conn.execute(
+                    sa.text(
+                        f"UPDATE {self._quote(COUNTS_TABLE)} "
+                        "SET row_count = row_count - :drift WHERE table_name = :table"
+                    ),
+                    {"drift": drift, "table": name},
+                )
+            logger.warning(f"Row counter for {name} drifted by {drift}; corrected")
+        return drift
+
+    def reconcile_all(self, models: Iterable[Type[SQLModel]]) -> Dict[str, int]:
+        "Reconcile every maintained counter; returns the drift found per table"
+        return {
+            model.__tablename__: self.reconcile(model)
+            for model in models
+            if count_strategy(model) == MAINTAINED
+        }
@@ -3,13 +3,15 @@ from typing import Any, Dict, List, Optional, Type
 from datetime import datetime, timezone
 from decouple import config
 from uuid import UUID
-from sqlmodel import select, SQLModel, Session, create_engine
-import sqlalchemy as sa
+from sqlmodel import select, SQLModel, Session
 from sqlalchemy import or_, func
 
+from modules.shared.db.introspection import describe, schema_cache
+from modules.shared.db.pool import create_db_engine
+
 url = config("DATABASE_URL")
 
-engine = create_engine(url, echo=True)
+engine = create_db_engine(url, label="db")
 
 
 def init_db():
@@ -23,13 +25,11 @@ def get_session():
 
 def schema():
     "Show all tables and columns"
-    inspector = sa.inspect(engine)
     res = ""
-    for table_name in inspector.get_table_names():
+    for table_name, table in schema_cache.tables(engine).items():
         res += f"Table: {table_name}\n"
-        pk_cols = inspector.get_pk_constraint(table_name)["constrained_columns"]
-        for column in inspector.get_columns(table_name):
-            pk_marker = "*" if column["name"] in pk_cols else "-"
+        for column in table.columns:
+            pk_marker = "*" if column["name"] in table.primary_key else "-"
             res += f"  {pk_marker} {column['name']}: {column['type']}\n"
     return res
 
@@ -39,7 +39,7 @@ def utc_now() -> datetime:
 
 
 def get_model_fields(model: Type[SQLModel]) -> List[str]:
-    return list(model.__fields__.keys())
+    return list(describe(model).fields)
 
 
 def all_records(model: Type[SQLModel]) -> List[SQLModel]:
@@ -66,9 +66,7 @@ def query_records(
             query = select(model)
 
         if search_value:
-            string_fields = [
-                k for k, v in model.__fields__.items() if v.annotation is str
-            ]
+            string_fields = describe(model).string_fields
             if string_fields:
                 conditions = [
                     getattr(model, field).ilike(f"%{search_value}%")
@@ -77,7 +75,7 @@ def query_records(
                 query = query.filter(or_(*conditions))
 
         if sorting_field:
-            if sorting_field in model.__fields__:
+            if sorting_field in describe(model).sortable_fields:
                 order_field = getattr(model, sorting_field)
                 query = query.order_by(
                     order_field.desc()
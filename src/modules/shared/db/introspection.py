@@ -0,0 +1,181 @@
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Type
+from uuid import UUID
+
+import sqlalchemy as sa
+from pydantic_core import PydanticUndefined
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+from sqlmodel import SQLModel
+
+# schema_extra flag marking fields for infix (substring) search
+SUBSTRING_SEARCH = "substring_search"
+
+# Form input type per field annotation, unless schema_extra sets "input_type"
+INPUT_TYPES = {
+    str: "text",
+    int: "number",
+    float: "number",
+    bool: "checkbox",
+    datetime: "date",
+    UUID: "text",
+    list: "select",
+    dict: "json",
+}
+
+
+def input_type(field_info) -> str:
+    "Form input type of a pydantic field"
+    if field_info._attributes_set and "input_type" in field_info._attributes_set:
+        return field_info._attributes_set["input_type"]
+    if getattr(field_info, "foreign_key", PydanticUndefined) is not PydanticUndefined:
+        return "select"
+    if hasattr(field_info.annotation, "__members__"):  # Enum
+        return "select"
+    return INPUT_TYPES.get(field_info.annotation, "text")
+
+
+@dataclass(frozen=True)
+class ModelDescriptor:
+    """What the data layer needs to know about a model, derived once.
+
+    Built when the model is mapped (see `_describe_mapped`), so queries, forms
+    and tables read precomputed values instead of walking `model_fields`.
+    """
+
+    fields: Tuple[str, ...]
+    # Table columns; empty for models without a table
+    columns: Tuple[str, ...]
+    string_fields: Tuple[str, ...]
+    substring_fields: Tuple[str, ...]
+    sortable_fields: FrozenSet[str]
+    # NOT NULL columns: keyset pages can only seek on these
+    keyset_fields: FrozenSet[str] = frozenset()
+    column_types: Dict[str, Any] = field(default_factory=dict)
+    input_types: Dict[str, str] = field(default_factory=dict)
+    # field -> (target table, target column), from Field(foreign_key="table.col")
+    foreign_keys: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+
+
+def _build(model: Type[SQLModel]) -> ModelDescriptor:
+    model_fields = model.model_fields
+    table = getattr(model, "__table__", None)
+    columns = tuple(table.columns.keys()) if table is not None else ()
+    foreign_keys = {}
+    for name, info in model_fields.items():
+        target = getattr(info, "foreign_key", PydanticUndefined)
+        if isinstance(target, str):
+            table_name, column = target.split(".")
+            foreign_keys[name] = (table_name, column)
+    return ModelDescriptor(
+        fields=tuple(model_fields),
+        columns=columns,
+        string_fields=tuple(k for k, v in model_fields.items() if v.annotation is str),
+        substring_fields=tuple(
+            name
+            for name, info in model_fields.items()
+            if info._attributes_set.get(SUBSTRING_SEARCH)
+        ),
+        sortable_fields=frozenset(columns),
+        keyset_fields=frozenset(c.name for c in table.columns if not c.nullable)
+        if columns
+        else frozenset(),
+        column_types={c.name: c.type for c in table.columns} if columns else {},
+        input_types={name: input_type(info) for name, info in model_fields.items()},
+        foreign_keys=foreign_keys,
+    )
+
+
+_descriptors: Dict[Type[SQLModel], ModelDescriptor] = {}
+
+
+def describe(model: Type[SQLModel]) -> ModelDescriptor:
+    "The model's descriptor; models without a mapper get theirs on first use"
+    descriptor = _descriptors.get(model)
+    if descriptor is None:
+        descriptor = _descriptors[model] = _build(model)
+    return descriptor
+
+
+@event.listens_for(Mapper, "after_mapper_constructed")
+def _describe_mapped(mapper: Mapper, class_: type) -> None:
+    if not issubclass(class_, SQLModel):
+        return
+    descriptor = _descriptors[class_] = _build(class_)
+    sort_field = getattr(class_, "default_sort_field", None) or "id"
+    if getattr(class_, "keyset_pagination", False) and (
+        sort_field not in descriptor.keyset_fields
+    ):
+        raise ValueError(
+            f"{class_.__name__}.keyset_pagination needs a NOT NULL "
+            f"default_sort_field; '{sort_field}' is nullable"
+        )
+
+
+@dataclass
+class TableSchema:
+    "One reflected table, as `sa.inspect` reports it"
+
+    columns: List[Dict[str, Any]]
+    primary_key: List[str]
+    indexes: List[Dict[str, Any]]
+    unique_constraints: List[Dict[str, Any]]
+
+
+class SchemaCache:
+    """Reflected schema per engine, reused until the database is migrated.
+
+    Reflection costs several queries per table; a cached copy is served for
+    as long as `alembic_version` is unchanged, so checking costs one query.
+    DDL issued by this process (`create_all`, `init_db`) calls `invalidate`.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Engine, Tuple[Optional[str], Dict[str, TableSchema]]] = {}
+        self._lock = threading.Lock()
+
+    def _version(self, connection) -> Optional[str]:
+        if not sa.inspect(connection).has_table("alembic_version"):
+            return None
+        versions = connection.exec_driver_sql("SELECT version_num FROM alembic_version")
+        return ",".join(sorted(v for (v,) in versions))
+
+    def tables(self, engine: Engine) -> Dict[str, TableSchema]:
+        with engine.connect() as connection:
+            version = self._version(connection)
+            with self._lock:
+                entry = self._entries.get(engine)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            inspector = sa.inspect(connection)
+            tables = {}
+            for name in inspector.get_table_names():
+                primary_key = inspector.get_pk_constraint(name)
+                tables[name] = TableSchema(
+                    columns=inspector.get_columns(name),
+                    primary_key=primary_key["constrained_columns"],
+                    indexes=inspector.get_indexes(name),
+                    unique_constraints=inspector.get_unique_constraints(name),
+                )
+        with self._lock:
+            self._entries[engine] = (version, tables)
+        return tables
+
+    def invalidate(self, engine: Optional[Engine] = None) -> None:
+        with self._lock:
+            if engine is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(engine, None)
+
+
+schema_cache = SchemaCache()
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+@event.listens_for(SQLModel.metadata, "after_drop")
+def _schema_changed(target, connection, **kw) -> None:
+    schema_cache.invalidate(connection.engine)
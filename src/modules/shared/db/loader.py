@@ -0,0 +1,72 @@
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from sqlmodel import SQLModel
+
+from modules.shared.db.cache import Version
+
+# Session.info key holding the request's RelatedLoader
+LOADER = "related_loader"
+
+
+class RelatedLoader:
+    """Request-scoped batching of related-record lookups (the DataLoader pattern).
+
+    A render first calls `want` with every key it is going to need; the first
+    `get`/`get_many` then resolves all pending keys of that model with one
+    `WHERE key IN (...)` query. Results are memoized for the rest of the
+    request and dropped when the model's table version moves (any write made
+    through the service), so a request that writes still reads its own writes.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        # (model, key) -> (table version, {key value: record})
+        self._records: Dict[Tuple[Type[SQLModel], str], Tuple[Version, Dict]] = {}
+        self._pending: Dict[Tuple[Type[SQLModel], str], Set[Any]] = {}
+        self._all: Dict[Type[SQLModel], Tuple[Version, List[SQLModel]]] = {}
+
+    def _loaded(self, model: Type[SQLModel], key: str) -> Dict[Any, Any]:
+        version = self.db.query_cache.version(model)
+        entry = self._records.get((model, key))
+        if entry is None or entry[0] != version:
+            entry = self._records[(model, key)] = (version, {})
+        return entry[1]
+
+    def want(self, model: Type[SQLModel], key: str, values: Iterable[Any]) -> None:
+        "Queue `values` of `model.key` for the next batch"
+        loaded = self._loaded(model, key)
+        pending = self._pending.setdefault((model, key), set())
+        pending.update(v for v in values if v is not None and v not in loaded)
+
+    def _resolve(self, model: Type[SQLModel], key: str) -> Dict[Any, Any]:
+        loaded = self._loaded(model, key)
+        pending = self._pending.pop((model, key), set())
+        if pending:
+            for record in self.db.get_records(model, list(pending), key=key):
+                loaded[getattr(record, key)] = record
+            # Remember misses too, so they are not queried again
+            for value in pending:
+                loaded.setdefault(value, None)
+        return loaded
+
+    def get(self, model: Type[SQLModel], key: str, value: Any) -> Optional[SQLModel]:
+        if value is None:
+            return None
+        self.want(model, key, [value])
+        return self._resolve(model, key).get(value)
+
+    def get_many(
+        self, model: Type[SQLModel], key: str, values: Iterable[Any]
+    ) -> Dict[Any, Optional[SQLModel]]:
+        values = list(values)
+        self.want(model, key, values)
+        loaded = self._resolve(model, key)
+        return {value: loaded.get(value) for value in values if value is not None}
+
+    def all(self, model: Type[SQLModel]) -> List[SQLModel]:
+        "Every `model` record (select options), loaded once per request"
+        version = self.db.query_cache.version(model)
+        entry = self._all.get(model)
+        if entry is None or entry[0] != version:
+            entry = self._all[model] = (version, self.db.all_records(model))
+        return entry[1]
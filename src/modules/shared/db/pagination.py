@@ -0,0 +1,100 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+from uuid import UUID
+
+NEXT = "n"
+PREV = "p"
+
+
+class InvalidCursor(ValueError):
+    "A pagination cursor that was not produced by `encode_cursor` for this query"
+
+
+@dataclass
+class Page:
+    """One page of query results.
+
+    `total` is the number of rows matching the filter (when requested), and
+    `approximate` says it came from planner statistics; the cursors are only
+    set for keyset-paginated queries.
+    """
+
+    records: List[Any]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+    approximate: bool = False
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, UUID):
+        return {"uuid": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "uuid" in value:
+            return UUID(value["uuid"])
+    return value
+
+
+def encode_cursor(direction: str, values: Optional[List[Any]]) -> str:
+    """Opaque cursor seeking `direction` from the row whose sort key is `values`.
+
+    A PREV cursor without values points at the last page.
+    """
+    payload = [direction, None if values is None else [_encode_value(v) for v in values]]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Optional[List[Any]]]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+        if direction not in (NEXT, PREV):
+            raise ValueError(f"Unknown direction {direction!r}")
+        if values is not None:
+            values = [_decode_value(v) for v in values]
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Invalid pagination cursor '{cursor}'") from e
+    return direction, values
+
+
+def coerce_cursor(cursor: str, values: List[Any], types: List[Any]) -> List[Any]:
+    """Cast decoded cursor values to the Python types of the columns they seek on.
+
+    A cursor is client input: a value the column cannot hold must not reach the
+    database as a bind parameter.
+    """
+    coerced = []
+    for value, type_ in zip(values, types):
+        try:
+            python_type = type_.python_type
+        except NotImplementedError:
+            coerced.append(value)
+            continue
+        try:
+            if value is None:
+                raise TypeError("Sort keys are never NULL")
+            if not isinstance(value, python_type):
+                value = python_type(value)
+        except (TypeError, ValueError, AttributeError) as e:
+            raise InvalidCursor(f"Invalid pagination cursor '{cursor}'") from e
+        coerced.append(value)
+    return coerced
+
+
+LAST_PAGE_CURSOR = encode_cursor(PREV, None)
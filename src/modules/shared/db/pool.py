@@ -0,0 +1,136 @@
+import time
+import weakref
+from typing import Any, Dict
+
+from decouple import config
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import create_engine
+
+from modules.shared.metrics import registry
+
+POOL_WAIT = registry.histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    labelnames=("pool",),
+)
+POOL_TIMEOUTS = registry.counter(
+    "db_pool_timeouts_total",
+    "Connection checkouts that gave up after pool_timeout",
+    labelnames=("pool",),
+)
+
+_engines: "weakref.WeakValueDictionary[str, Engine]" = weakref.WeakValueDictionary()
+
+
+class InstrumentedPoolMixin:
+    "Records how long each checkout waited for a connection"
+
+    def _do_get(self):
+        label = self.logging_name or "default"
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc(pool=label)
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start, pool=label)
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    "Engine keyword arguments read from the DATABASE_* settings"
+    options = {"echo": config("DATABASE_ECHO", default=True, cast=bool)}
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite uses a single shared connection, not a queue pool
+        return options
+    options.update(
+        pool_size=config("DATABASE_POOL_SIZE", default=5, cast=int),
+        max_overflow=config("DATABASE_MAX_OVERFLOW", default=10, cast=int),
+        pool_timeout=config("DATABASE_POOL_TIMEOUT", default=30, cast=float),
+        pool_recycle=config("DATABASE_POOL_RECYCLE", default=1800, cast=int),
+        pool_pre_ping=config("DATABASE_POOL_PRE_PING", default=True, cast=bool),
+    )
+    return options
+
+
+def create_db_engine(url: str, label: str = "primary", **kwargs) -> Engine:
+    options = engine_options(url)
+    if "pool_size" in options:
+        options.update(poolclass=InstrumentedQueuePool, pool_logging_name=label)
+    options.update(kwargs)
+    engine = create_engine(url, **options)
+    _engines[label] = engine
+    return engine
+
+
+def create_async_db_engine(url: str, label: str = "async", **kwargs):
+    options = engine_options(url)
+    if "pool_size" in options:
+        options.update(poolclass=InstrumentedAsyncQueuePool, pool_logging_name=label)
+    options.update(kwargs)
+    engine = create_async_engine(url, **options)
+    _engines[label] = engine.sync_engine
+    return engine
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    "Current saturation of `engine`'s pool plus its checkout wait histogram"
+    pool = engine.pool
+    label = pool.logging_name or "default"
+    stats = {"pool": label, "class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(0, pool.overflow()),
+            max_overflow=pool._max_overflow,
+            timeout=pool.timeout(),
+        )
+    stats["timeouts"] = POOL_TIMEOUTS.value(pool=label)
+    stats["wait"] = POOL_WAIT.snapshot(pool=label)
+    return stats
+
+
+def _collect(field: str):
+    def collect():
+        values = {}
+        for label, engine in list(_engines.items()):
+            stats = pool_stats(engine)
+            if field in stats:
+                values[(label,)] = stats[field]
+        return values
+
+    return collect
+
+
+registry.gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    _collect("checked_out"),
+    labelnames=("pool",),
+)
+registry.gauge(
+    "db_pool_overflow",
+    "Connections opened beyond pool_size",
+    _collect("overflow"),
+    labelnames=("pool",),
+)
+registry.gauge(
+    "db_pool_size",
+    "Configured pool size",
+    _collect("size"),
+    labelnames=("pool",),
+)
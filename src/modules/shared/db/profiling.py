@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from modules.shared.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = config("DATABASE_SLOW_QUERY_MS", default=200, cast=float)
+# Statement shapes run more often than this in one request are flagged as N+1
+N_PLUS_ONE_THRESHOLD = config("DATABASE_N_PLUS_ONE_THRESHOLD", default=10, cast=int)
+QUERY_HEADERS = config("DATABASE_QUERY_HEADERS", default=False, cast=bool)
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+# Longest parameter repr written to the slow query log
+MAX_PARAMS_LOGGED = 500
+
+REQUEST_QUERIES = registry.histogram(
+    "db_request_queries",
+    "Statements executed per HTTP request",
+    labelnames=("route",),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+REQUEST_QUERY_SECONDS = registry.histogram(
+    "db_request_query_seconds",
+    "Time per HTTP request spent executing statements",
+    labelnames=("route",),
+)
+SLOW_QUERIES = registry.counter(
+    "db_slow_queries_total",
+    "Statements slower than DATABASE_SLOW_QUERY_MS",
+    labelnames=("route",),
+)
+N_PLUS_ONE = registry.counter(
+    "db_n_plus_one_total",
+    "Statement shapes repeated past DATABASE_N_PLUS_ONE_THRESHOLD in a request",
+    labelnames=("route",),
+)
+
+
+class QueryStats:
+    "Statements run on behalf of one request, fed by the cursor event hooks"
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        # Statement text (SQLAlchemy's parameterized SQL) -> executions
+        self.shapes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def request(self) -> str:
+        return f"{self.scope.get('method', '')} {self.scope.get('path', '')}"
+
+    @property
+    def route(self) -> str:
+        "Path template of the matched route, a bounded metrics label"
+        return route_path(self.scope)
+
+    def record(self, statement: str, seconds: float) -> int:
+        "Count one execution; returns how often this shape has run so far"
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            runs = self.shapes[statement] = self.shapes.get(statement, 0) + 1
+        return runs
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "current_query_stats", default=None
+)
+
+_route_paths: Dict[Any, str] = {}
+
+
+def route_path(scope: Dict[str, Any]) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in _route_paths:
+        routes = getattr(scope.get("app"), "routes", [])
+        paths = [r.path for r in routes if getattr(r, "endpoint", None) is endpoint]
+        name = getattr(endpoint, "__name__", "?")
+        _route_paths[endpoint] = paths[0] if paths else name
+    return _route_paths[endpoint]
+
+
+def _format_params(parameters: Any, executemany: bool) -> str:
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+    text = repr(parameters)
+    if len(text) > MAX_PARAMS_LOGGED:
+        text = text[:MAX_PARAMS_LOGGED] + "..."
+    return text
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_stats.get()
+    request = stats.request if stats is not None else "outside a request"
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            f"Slow query ({seconds * 1000:.1f} ms) in {request}: {statement} "
+            f"params={_format_params(parameters, executemany)}"
+        )
+        if stats is not None and METRICS_ENABLED:
+            SLOW_QUERIES.inc(route=stats.route)
+    if stats is None:
+        return
+    runs = stats.record(statement, seconds)
+    if runs == N_PLUS_ONE_THRESHOLD + 1:
+        logger.warning(
+            f"Possible N+1 in {request}: statement ran {runs} times: {statement}"
+        )
+        if METRICS_ENABLED:
+            N_PLUS_ONE.inc(route=stats.route)
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_timer(context) -> None:
+    "A failed statement never reaches after_cursor_execute"
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+class QueryStatsMiddleware:
+    """Attributes statement count and time to each HTTP request.
+
+    With DATABASE_QUERY_HEADERS (development) the totals are sent back as
+    `X-DB-Queries` and `Server-Timing` headers; with METRICS_ENABLED they feed
+    the per-route histograms. Place it outside DBSessionMiddleware so the
+    statements flushed by the request's commit are counted too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and QUERY_HEADERS:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode()))
+                duration = stats.seconds * 1000
+                timing = f'db;dur={duration:.1f};desc="{stats.count} queries"'
+                headers.append((b"server-timing", timing.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            if METRICS_ENABLED:
+                REQUEST_QUERIES.observe(stats.count, route=stats.route)
+                REQUEST_QUERY_SECONDS.observe(stats.seconds, route=stats.route)
@@ -0,0 +1,368 @@
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Type
+
+import sqlalchemy as sa
+from sqlalchemy import exc
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel
+
+from modules.shared.db.introspection import describe
+
+logger = logging.getLogger(__name__)
+
+SEARCH_VECTOR = "search_vector"
+# Integer key the SQLite side tables point at: VACUUM may renumber the rowid of
+# tables without an INTEGER PRIMARY KEY, which would detach every index entry
+SEARCH_ROWID = "search_rowid"
+# Seconds before a missing index is looked for again, so one installed while
+# the app runs is picked up without a restart
+PROBE_INTERVAL = 60
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# The trigram tokenizer cannot match anything shorter than one trigram
+MIN_NGRAM = 3
+
+
+def search_fields(model: Type[SQLModel]) -> List[str]:
+    return list(getattr(model, "search_fields", None) or [])
+
+
+def substring_fields(model: Type[SQLModel]) -> List[str]:
+    "Fields flagged with `schema_extra={\"substring_search\": True}`"
+    return list(describe(model).substring_fields)
+
+
+def fts_table(model: Type[SQLModel]) -> str:
+    return f"{model.__tablename__}_fts"
+
+
+def ngram_name(model: Type[SQLModel], field: str) -> str:
+    "Side table (SQLite) or index (Postgres) holding `field`'s trigrams"
+    return f"{model.__tablename__}_{field}_trgm"
+
+
+def has_terms(search_value: str) -> bool:
+    "Whether `search_value` has any word the index can match"
+    return TOKEN_RE.search(search_value) is not None
+
+
+def ngram_phrase(search_value: str) -> str:
+    "FTS5 phrase matching `search_value` verbatim in a trigram table"
+    return '"' + search_value.replace('"', '""') + '"'
+
+
+def fts_match_query(search_value: str) -> Optional[str]:
+    "FTS5 MATCH expression: every token must match as a prefix"
+    tokens = TOKEN_RE.findall(search_value)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def tsquery(search_value: str) -> Optional[str]:
+    "Postgres to_tsquery expression: every token must match as a prefix"
+    tokens = TOKEN_RE.findall(search_value)
+    if not tokens:
+        return None
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+class SearchIndex(ABC):
+    "Runtime-managed search index DDL, installed by `fh install` (and `fh migrate`)"
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self._installed: Dict[str, bool] = {}
+        # table -> monotonic time of the next probe for a missing index
+        self._retry: Dict[str, float] = {}
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    @abstractmethod
+    def _ddl(self, model: Type[SQLModel]) -> List[str]:
+        pass
+
+    @abstractmethod
+    def _probe(self, model: Type[SQLModel]) -> bool:
+        pass
+
+    def install(self, model: Type[SQLModel]) -> None:
+        statements = self._ddl(model)
+        if not statements:
+            return
+        with self.engine.begin() as conn:
+            if self.dialect == "sqlite":
+                self._sqlite_key(conn, model)
+            for statement in statements:
+                conn.exec_driver_sql(statement)
+        self._installed[model.__tablename__] = True
+        self._retry.pop(model.__tablename__, None)
+
+    def install_all(self, models: Iterable[Type[SQLModel]]) -> None:
+        for model in models:
+            self.install(model)
+
+    def available(self, model: Type[SQLModel]) -> bool:
+        name = model.__tablename__
+        if self._installed.get(name):
+            return True
+        retry = self._retry.get(name)
+        if retry is not None and time.monotonic() < retry:
+            return False
+        self._installed[name] = self._probe(model)
+        if not self._installed[name]:
+            if retry is None and self._ddl(model):
+                logger.warning(
+                    f"{type(self).__name__} index for {name} is not installed; "
+                    "searches scan the table until `fh install` is run"
+                )
+            self._retry[name] = time.monotonic() + PROBE_INTERVAL
+        return self._installed[name]
+
+    def _rowid(self, model: Type[SQLModel]):
+        return sa.literal_column(f"{self._quote(model.__tablename__)}.{SEARCH_ROWID}")
+
+    def _sqlite_key(self, conn, model: Type[SQLModel]) -> None:
+        "Add the `SEARCH_ROWID` column the side tables are keyed on, and fill it"
+        table = self._quote(model.__tablename__)
+        key = self._quote(SEARCH_ROWID)
+        info = conn.exec_driver_sql(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in info]
+        if SEARCH_ROWID not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {key} INTEGER")
+        index = self._quote(f"ix_{model.__tablename__}_{SEARCH_ROWID}")
+        conn.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ({key})"
+        )
+        # Rows written before the install are numbered after the highest key
+        top = conn.exec_driver_sql(f"SELECT coalesce(max({key}), 0) FROM {table}")
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET {key} = rowid + ? WHERE {key} IS NULL",
+            (top.scalar(),),
+        )
+
+    def _sqlite_side_table(
+        self, model: Type[SQLModel], name: str, fields: List[str], options: str = ""
+    ) -> List[str]:
+        """External-content FTS5 table over `fields`, kept in sync by triggers.
+
+        Rows are keyed on `SEARCH_ROWID` (see `_sqlite_key`); the insert
+        trigger numbers new rows, and only updates of `fields` re-index.
+        """
+        table = self._quote(model.__tablename__)
+        side = self._quote(name)
+        key = self._quote(SEARCH_ROWID)
+        cols = ", ".join(self._quote(f) for f in fields)
+        new = ", ".join(f"new.{self._quote(f)}" for f in fields)
+        old = ", ".join(f"old.{self._quote(f)}" for f in fields)
+        # Every side table of the model runs this; only the first one numbers
+        number = (
+            f"UPDATE {table} SET {key} = (SELECT coalesce(max({key}), 0) + 1 "
+            f"FROM {table}) WHERE rowid = new.rowid AND {key} IS NULL"
+        )
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {side} USING fts5("
+            f"{cols}, content={table}, content_rowid={key}{options})",
+            f"CREATE TRIGGER IF NOT EXISTS {self._quote(name + '_ai')} "
+            f"AFTER INSERT ON {table} BEGIN {number}; "
+            f"INSERT INTO {side}(rowid, {cols}) VALUES "
+            f"((SELECT {key} FROM {table} WHERE rowid = new.rowid), {new}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {self._quote(name + '_ad')} "
+            f"AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {side}({side}, rowid, {cols}) "
+            f"VALUES ('delete', old.{key}, {old}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {self._quote(name + '_au')} "
+            f"AFTER UPDATE OF {cols} ON {table} BEGIN "
+            f"INSERT INTO {side}({side}, rowid, {cols}) "
+            f"VALUES ('delete', old.{key}, {old}); "
+            f"INSERT INTO {side}(rowid, {cols}) VALUES (new.{key}, {new}); END",
+            f"INSERT INTO {side}({side}) VALUES('rebuild')",
+        ]
+
+    def _sqlite_rebuild(self, name: str) -> None:
+        side = self._quote(name)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"INSERT INTO {side}({side}) VALUES('rebuild')")
+
+    def _sqlite_tables(self) -> List[str]:
+        return sa.inspect(self.engine).get_table_names()
+
+
+class FullTextSearch(SearchIndex):
+    """Index-backed search documents for models that declare `search_fields`.
+
+    SQLite gets an external-content FTS5 table kept in sync by triggers;
+    Postgres gets a generated `tsvector` column with a GIN index. Models whose
+    index has not been installed fall back to the `ilike` scan.
+
+    SQLite FTS rows are keyed by a `search_rowid` column `fh install` adds to
+    the table rather than by the implicit rowid, which VACUUM may renumber.
+    """
+
+    def _ddl(self, model: Type[SQLModel]) -> List[str]:
+        fields = search_fields(model)
+        if not fields:
+            return []
+        if self.dialect == "sqlite":
+            return self._sqlite_side_table(model, fts_table(model), fields)
+        if self.dialect == "postgresql":
+            return self._postgres_ddl(model, fields)
+        return []
+
+    def rebuild(self, model: Type[SQLModel]) -> None:
+        "Re-index every row (SQLite only; the Postgres column is generated)"
+        if self.dialect == "sqlite" and self.available(model):
+            self._sqlite_rebuild(fts_table(model))
+
+    def _postgres_ddl(self, model: Type[SQLModel], fields: List[str]) -> List[str]:
+        table = self._quote(model.__tablename__)
+        document = " || ' ' || ".join(
+            f"coalesce({self._quote(f)}::text, '')" for f in fields
+        )
+        index = self._quote(f"ix_{model.__tablename__}_{SEARCH_VECTOR}")
+        return [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {SEARCH_VECTOR} tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, {document})) STORED",
+            f"CREATE INDEX IF NOT EXISTS {index} ON {table} USING GIN ({SEARCH_VECTOR})",
+        ]
+
+    def _probe(self, model: Type[SQLModel]) -> bool:
+        if not search_fields(model):
+            return False
+        if self.dialect == "sqlite":
+            return fts_table(model) in self._sqlite_tables()
+        if self.dialect == "postgresql":
+            columns = sa.inspect(self.engine).get_columns(model.__tablename__)
+            return SEARCH_VECTOR in [c["name"] for c in columns]
+        return False
+
+    def _vector(self, model: Type[SQLModel]):
+        return sa.literal_column(f"{self._quote(model.__tablename__)}.{SEARCH_VECTOR}")
+
+    def match_value(self, search_value: str) -> Optional[str]:
+        "The dialect's query syntax for `search_value`, bound as `match` below"
+        if self.dialect == "sqlite":
+            return fts_match_query(search_value)
+        return tsquery(search_value)
+
+    def condition(self, model: Type[SQLModel], match):
+        "WHERE clause matching the `match` expression against the model's search index"
+        if self.dialect == "sqlite":
+            fts = sa.table(fts_table(model), sa.column("rowid"))
+            matches = (
+                sa.select(fts.c.rowid)
+                .where(sa.literal_column(self._quote(fts_table(model))).op("MATCH")(match))
+            )
+            return self._rowid(model).in_(matches.scalar_subquery())
+        return self._vector(model).op("@@")(sa.func.to_tsquery("simple", match))
+
+    def order_by_rank(self, query, model: Type[SQLModel], match):
+        "Order `query` by relevance to `match`, best matches first"
+        if self.dialect == "sqlite":
+            name = fts_table(model)
+            fts = sa.table(name, sa.column("rowid"))
+            ranked = (
+                sa.select(
+                    fts.c.rowid.label("rowid"),
+                    sa.literal_column("rank").label("rank"),
+                )
+                .where(sa.literal_column(self._quote(name)).op("MATCH")(match))
+                .subquery("fts_rank")
+            )
+            # Outer join: rows matched by other conditions (infix search) rank last
+            return query.outerjoin(
+                ranked, ranked.c.rowid == self._rowid(model)
+            ).order_by(ranked.c.rank.is_(None), ranked.c.rank)
+        rank = sa.func.ts_rank(self._vector(model), sa.func.to_tsquery("simple", match))
+        return query.order_by(rank.desc())
+
+
+class NgramSearch(SearchIndex):
+    """Trigram-backed infix search over fields flagged `substring_search`.
+
+    Postgres gets a `pg_trgm` GIN index per column, which the planner uses for
+    `ILIKE '%value%'` directly. SQLite gets a trigram-tokenized FTS5 side table
+    per column; it narrows the candidate rows and `ilike` verifies them.
+    Both are created by `fh install`, which `fh migrate` runs after upgrading.
+    """
+
+    def _ddl(self, model: Type[SQLModel]) -> List[str]:
+        fields = substring_fields(model)
+        if not fields:
+            return []
+        if self.dialect == "sqlite":
+            statements = []
+            for field in fields:
+                statements += self._sqlite_side_table(
+                    model, ngram_name(model, field), [field], ", tokenize='trigram'"
+                )
+            return statements
+        if self.dialect == "postgresql":
+            table = self._quote(model.__tablename__)
+            return ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+                f"CREATE INDEX IF NOT EXISTS {self._quote(ngram_name(model, field))} "
+                f"ON {table} USING GIN ({self._quote(field)} gin_trgm_ops)"
+                for field in fields
+            ]
+        return []
+
+    def install(self, model: Type[SQLModel]) -> None:
+        try:
+            super().install(model)
+        except exc.DBAPIError as e:
+            # pg_trgm needs CREATE privilege; ilike still works without the index
+            logger.warning(f"Trigram index for {model.__tablename__} not installed: {e}")
+            self._installed[model.__tablename__] = False
+
+    def rebuild(self, model: Type[SQLModel]) -> None:
+        "Re-index every row (SQLite only; Postgres maintains its own indexes)"
+        if self.dialect == "sqlite" and self.available(model):
+            for field in substring_fields(model):
+                self._sqlite_rebuild(ngram_name(model, field))
+
+    def _probe(self, model: Type[SQLModel]) -> bool:
+        fields = substring_fields(model)
+        if not fields:
+            return False
+        if self.dialect == "sqlite":
+            tables = self._sqlite_tables()
+            return all(ngram_name(model, field) in tables for field in fields)
+        if self.dialect == "postgresql":
+            indexes = sa.inspect(self.engine).get_indexes(model.__tablename__)
+            names = [index["name"] for index in indexes]
+            return all(ngram_name(model, field) in names for field in fields)
+        return False
+
+    def prefilter(self, model: Type[SQLModel], search_value: str) -> bool:
+        "Whether the SQLite trigram tables can narrow the rows for `search_value`"
+        return (
+            self.dialect == "sqlite"
+            and len(search_value) >= MIN_NGRAM
+            and self.available(model)
+        )
+
+    def condition(self, model: Type[SQLModel], pattern, phrase=None):
+        """WHERE clause matching the `ilike` `pattern` inside the flagged fields.
+
+        `phrase` (see `ngram_phrase`) narrows the candidates through the
+        trigram tables first; pass it only when `prefilter` allows.
+        """
+        clauses = []
+        for field in substring_fields(model):
+            column = getattr(model, field)
+            clause = column.ilike(pattern)
+            if phrase is not None:
+                name = ngram_name(model, field)
+                side = sa.table(name, sa.column("rowid"))
+                candidates = sa.select(side.c.rowid).where(
+                    sa.literal_column(self._quote(name)).op("MATCH")(phrase)
+                )
+                clause = sa.and_(
+                    self._rowid(model).in_(candidates.scalar_subquery()), clause
+                )
+            clauses.append(clause)
+        return sa.or_(*clauses) if clauses else None
@@ -0,0 +1,123 @@
+import asyncio
+import random
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState
+from sqlalchemy.orm import Session as _Session
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+# Session.info keys: the replica engines a session may read from, the one it
+# picked, and the flag pinning the session to the primary after a write
+REPLICAS = "replicas"
+REPLICA = "replica"
+USE_PRIMARY = "use_primary"
+# Session.info key of the lock worker threads take turns on the session with
+SESSION_LOCK = "session_lock"
+
+# Session bound to the current request; SQLModelDB reuses it instead of
+# opening a fresh Session (and transaction) for every call.
+current_session: ContextVar[Optional[Session]] = ContextVar(
+    "current_session", default=None
+)
+
+
+class RoutingSession(Session):
+    """Session that sends plain reads to a read replica.
+
+    Writes, `SELECT ... FOR UPDATE`, flushes and every statement after the
+    session's first write go to the primary (the session's bind), so a request
+    always reads its own writes. A session reads from one replica throughout.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replicas = self.info.get(REPLICAS)
+        if (
+            not replicas
+            or self.info.get(USE_PRIMARY)
+            or self._flushing
+            or clause is None
+            or not getattr(clause, "is_select", False)
+            or getattr(clause, "_for_update_arg", None) is not None
+        ):
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        if REPLICA not in self.info:
+            self.info[REPLICA] = random.choice(replicas)
+        return self.info[REPLICA]
+
+
+def request_lock(db) -> Optional[asyncio.Lock]:
+    "The lock guarding the current request's session, when it belongs to `db`"
+    session = current_session.get()
+    if session is None or session.info.get("db") is not db:
+        return None
+    return session.info.setdefault(SESSION_LOCK, asyncio.Lock())
+
+
+def use_primary(session: _Session) -> None:
+    "Pin `session` to the primary for the rest of its life (read-your-writes)"
+    session.info[USE_PRIMARY] = True
+
+
+def reads_replica(session: _Session) -> bool:
+    "Whether `session` sends its reads to a replica"
+    return REPLICA in session.info and not session.info.get(USE_PRIMARY)
+
+
+@event.listens_for(_Session, "after_flush")
+def _stick_after_flush(session: _Session, flush_context) -> None:
+    use_primary(session)
+
+
+@event.listens_for(_Session, "do_orm_execute")
+def _stick_on_dml(state: ORMExecuteState) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        use_primary(state.session)
+
+
+class DBSessionMiddleware:
+    """Request-scoped unit of work.
+
+    Binds one Session per HTTP request to `scope["db_session"]` and to
+    `current_session`, commits it before a successful or redirect response
+    starts (status < 400) and rolls it back on error responses and exceptions,
+    so a page render checks out a single connection and sees consistent reads,
+    and a handler that fails half-way leaves nothing behind.
+    """
+
+    def __init__(self, app, service=None):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.service is None:
+            from modules.shared.db import service
+
+            self.service = service
+
+        session = self.service.new_session()
+        scope["db_session"] = session
+        token = current_session.set(session)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and session.is_active:
+                if message["status"] < 400:
+                    await run_in_threadpool(session.commit)
+                else:
+                    await run_in_threadpool(session.rollback)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            await run_in_threadpool(session.rollback)
+            raise
+        finally:
+            current_session.reset(token)
+            await run_in_threadpool(session.close)
@@ -0,0 +1,87 @@
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Type
+
+from sqlmodel import SQLModel
+
+from modules.shared.metrics import registry
+
+SHARED_CALLS = registry.counter(
+    "db_single_flight_shared_total",
+    "Read calls answered by joining an identical call already in flight",
+    labelnames=("model",),
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Concurrent identical reads share one execution.
+
+    The first caller of a key runs the read; callers arriving while it is in
+    flight wait and receive a deep copy of its result (or its exception).
+    Nothing is kept once the call completes: this only collapses bursts, like
+    a page of requests arriving right after its cached result expired.
+    Threads (`do`) and the event loop (`ado`) each have their own table.
+
+    Keys must change whenever the answer may, e.g. by including the query
+    cache's table version, so a read started before a write is never handed
+    to a caller that arrives after it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[str, Hashable], _Call] = {}
+        self._lock = threading.Lock()
+        self._tasks: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+
+    def do(self, model: Type[SQLModel], key: Hashable, fn: Callable[[], Any]) -> Any:
+        table = model.__tablename__
+        with self._lock:
+            call = self._calls.get((table, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(table, key)] = _Call()
+        if not leader:
+            SHARED_CALLS.inc(model=table)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(table, key)]
+            call.done.set()
+
+    async def ado(
+        self,
+        model: Type[SQLModel],
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        table = model.__tablename__
+        task = self._tasks.get((table, key))
+        if task is None:
+            # A task of its own, so a cancelled caller does not cancel the others
+            task = self._tasks[(table, key)] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._finished(table, key, t))
+            return await asyncio.shield(task)
+        SHARED_CALLS.inc(model=table)
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _finished(self, table: str, key: Hashable, task: asyncio.Task) -> None:
+        self._tasks.pop((table, key), None)
+        if not task.cancelled():
+            # Retrieved here in case every caller was cancelled meanwhile
+            task.exception()
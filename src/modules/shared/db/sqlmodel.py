@@ -1,44 +1,299 @@
-from typing import Any, Dict, Generator, List, Optional, Type
+import asyncio
+import logging
+import random
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple, Type, Union
 from datetime import datetime, timezone
 
 import sqlalchemy as sa
 from sqlalchemy import func, or_
-from sqlmodel import Session, SQLModel, create_engine, select
-from uuid import UUID
+from sqlmodel import Session, SQLModel, select
+
+from modules.shared.db.base import STREAM_BATCH_SIZE, DatabaseService
+from modules.shared.db.bulk import (
+    BULK_CHUNK_SIZE,
+    ID_PARAM,
+    TIMESTAMP_FIELDS,
+    ConflictTarget,
+    changed_columns,
+    chunked,
+    coerce_id,
+    conflict_columns,
+    copy_rows,
+    mark_saved,
+    missing_required,
+    prepare_rows,
+    prepare_updates,
+    update_statement,
+    upsert_statement,
+)
+from modules.shared.db.cache import (
+    EntityCache,
+    QueryCache,
+    can_fill,
+    has_writes,
+    mark_stale,
+    query_key,
+)
+from modules.shared.db.counts import (
+    CACHED,
+    COUNT_RECONCILE,
+    ESTIMATED,
+    EXACT,
+    MAINTAINED,
+    CountCache,
+    RowCounter,
+    count_strategy,
+    estimate_rows,
+)
+from modules.shared.db.introspection import describe, schema_cache
+from modules.shared.db.loader import LOADER, RelatedLoader
+from modules.shared.db.pagination import (
+    NEXT,
+    PREV,
+    InvalidCursor,
+    Page,
+    coerce_cursor,
+    decode_cursor,
+    encode_cursor,
+)
+from modules.shared.db.pool import create_db_engine, pool_stats
+from modules.shared.db.search import (
+    FullTextSearch,
+    NgramSearch,
+    has_terms,
+    ngram_phrase,
+    substring_fields,
+)
+from modules.shared.db.session import (
+    REPLICAS,
+    RoutingSession,
+    current_session,
+    use_primary,
+)
+from modules.shared.db.singleflight import SingleFlight
+from modules.shared.db.statements import (
+    ROW_LIMIT,
+    ROW_OFFSET,
+    SEARCH_MATCH,
+    SEARCH_PATTERN,
+    SEARCH_PHRASE,
+    StatementCache,
+    cursor_param,
+)
+from modules.shared.db.writebehind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+TOTAL_LABEL = "_total"
+
 
-from modules.shared.db.base import DatabaseService
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
+
 class SQLModelDB(DatabaseService):
-    def __init__(self, url: str):
-        self.engine = create_engine(url, echo=True)
+    def __init__(self, url: str, replica_urls: Optional[List[str]] = None):
+        self.engine = create_db_engine(url)
+        # Reads go to a replica until the session writes (see RoutingSession)
+        self.replicas = [
+            create_db_engine(replica, label=f"replica-{i}")
+            for i, replica in enumerate(replica_urls or [])
+        ]
+        self.search = FullTextSearch(self.engine)
+        self.ngrams = NgramSearch(self.engine)
+        self.cache = EntityCache()
+        self.query_cache = QueryCache(engine=self.engine)
+        self.statements = StatementCache()
+        self.counts = CountCache()
+        self.counters = RowCounter(self.engine)
+        self._reconciler: Optional[asyncio.Task] = None
+        self.write_behind = WriteBehindQueue(self)
+        self.flights = SingleFlight()
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {"primary": pool_stats(self.engine)}
+        for i, replica in enumerate(self.replicas):
+            stats[f"replica-{i}"] = pool_stats(replica)
+        return stats
+
+    def new_session(self) -> Session:
+        return RoutingSession(self.engine, info={"db": self, REPLICAS: self.replicas})
+
+    @contextmanager
+    def _session(self, write: bool = False) -> Iterator[Session]:
+        """Reuse the request-scoped session when one is bound, else open our own.
+
+        `write` pins the session to the primary before its first read, so a
+        record is never loaded from a lagging replica and then written back.
+        """
+        session = current_session.get()
+        if session is not None and session.info.get("db") is self:
+            if write:
+                use_primary(session)
+            yield session
+            return
+        with self.new_session() as session:
+            if write:
+                use_primary(session)
+            yield session
+
+    def _shares_reads(self) -> bool:
+        "Whether reads may be shared: a request that wrote must read its own writes"
+        session = current_session.get()
+        return not (
+            session is not None
+            and session.info.get("db") is self
+            and has_writes(session)
+        )
+
+    def _commit(self, session: Session) -> None:
+        "Commit owned sessions; request-scoped ones are only flushed"
+        if session is current_session.get():
+            session.flush()
+        else:
+            session.commit()
+
+    def _written(
+        self, session: Session, model: Type[SQLModel], ids: Optional[List[Any]]
+    ) -> None:
+        "Invalidate both caches for a Core write (ORM flushes do it themselves)"
+        mark_stale(session, self.cache, model, ids)
+        mark_stale(session, self.query_cache, model, None)
+
+    async def astart(self) -> None:
+        await self.write_behind.start()
+        if COUNT_RECONCILE > 0:
+            self._reconciler = asyncio.create_task(self._reconcile_counts_loop())
+
+    async def _reconcile_counts_loop(self) -> None:
+        while True:
+            await asyncio.sleep(COUNT_RECONCILE)
+            try:
+                await asyncio.to_thread(self.reconcile_counts)
+            except Exception:
+                logger.exception("Row count reconciliation failed")
+
+    def reconcile_counts(self) -> Dict[str, int]:
+        "Correct drift in the maintained row counters"
+        return self.counters.reconcile_all(
+            m.class_ for m in SQLModel._sa_registry.mappers
+        )
+
+    async def aclose(self) -> None:
+        if self._reconciler is not None:
+            self._reconciler.cancel()
+            self._reconciler = None
+        await self.write_behind.aclose()
+        self.engine.dispose()
+        for replica in self.replicas:
+            replica.dispose()
 
     def init_db(self) -> None:
         SQLModel.metadata.create_all(self.engine)
+        self.install_runtime_objects()
+
+    def install_runtime_objects(self) -> None:
+        """Create the search indexes, row-count triggers and shared cache versions.
+
+        migrations/env.py hides them from autogenerate, so `fh migrate` runs
+        this after upgrading; `fh install` runs it on its own. Idempotent.
+        """
+        models = [m.class_ for m in SQLModel._sa_registry.mappers]
+        self.search.install_all(models)
+        self.ngrams.install_all(models)
+        self.counters.install_all(models)
+        self.query_cache.install()
+        # The DDL above bypasses the metadata events
+        schema_cache.invalidate(self.engine)
 
     def get_session(self) -> Generator[Session, None, None]:
         with Session(self.engine) as session:
             yield session
 
     def schema(self) -> str:
-        inspector = sa.inspect(self.engine)
+        tables = schema_cache.tables(random.choice(self.replicas or [self.engine]))
         res = ""
-        for table_name in inspector.get_table_names():
+        for table_name, table in tables.items():
             res += f"Table: {table_name}\n"
-            pk_cols = inspector.get_pk_constraint(table_name)["constrained_columns"]
-            for column in inspector.get_columns(table_name):
-                pk_marker = "*" if column["name"] in pk_cols else "-"
+            for column in table.columns:
+                pk_marker = "*" if column["name"] in table.primary_key else "-"
                 res += f"  {pk_marker} {column['name']}: {column['type']}\n"
         return res
 
     def all_records(self, model: Type[SQLModel]) -> List[SQLModel]:
-        with Session(self.engine) as session:
+        with self._session() as session:
             statement = select(model)
             results = session.exec(statement).all()
             return results
 
-    def query_records(
+    def _sort_keys(self, model: Type[SQLModel], sorting_field: Optional[str]) -> List[str]:
+        "Columns a keyset page seeks on: the sort field with `id` as tie-breaker"
+        if not sorting_field or sorting_field == "id":
+            return ["id"]
+        return [sorting_field, "id"]
+
+    def _search_params(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str],
+        substring: bool = False,
+    ) -> Tuple[Optional[Tuple[bool, bool, bool]], Dict[str, Any]]:
+        "Search strategies for `search_value` (part of the shape) and their bind values"
+        if not search_value:
+            return None, {}
+        fts = has_terms(search_value) and self.search.available(model)
+        infix = substring and bool(substring_fields(model))
+        trigram = infix and self.ngrams.prefilter(model, search_value)
+        params = {SEARCH_PATTERN: f"%{search_value}%"}
+        if fts:
+            params[SEARCH_MATCH] = self.search.match_value(search_value)
+        if trigram:
+            params[SEARCH_PHRASE] = ngram_phrase(search_value)
+        return (fts, infix, trigram), params
+
+    def _search_condition(
+        self, model: Type[SQLModel], search: Optional[Tuple[bool, bool, bool]]
+    ):
+        if search is None:
+            return None
+        fts, infix, trigram = search
+        pattern = sa.bindparam(SEARCH_PATTERN, type_=sa.String)
+        if fts:
+            condition = self.search.condition(
+                model, sa.bindparam(SEARCH_MATCH, type_=sa.String)
+            )
+        else:
+            fields = describe(model).string_fields
+            condition = (
+                or_(*[getattr(model, field).ilike(pattern) for field in fields])
+                if fields
+                else None
+            )
+        if infix:
+            # Infix matches on the flagged fields widen the word search
+            phrase = sa.bindparam(SEARCH_PHRASE, type_=sa.String) if trigram else None
+            clause = self.ngrams.condition(model, pattern, phrase)
+            condition = clause if condition is None else or_(condition, clause)
+        return condition
+
+    def _count_query(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        substring: bool = False,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        "COUNT(*) statement for the search, and its bind values"
+        search, params = self._search_params(model, search_value, substring)
+
+        def build():
+            query = select(func.count()).select_from(model)
+            condition = self._search_condition(model, search)
+            return query if condition is None else query.where(condition)
+
+        return self.statements.get(("count", model, search), build), params
+
+    def _build_query(
         self,
         model: Type[SQLModel],
         search_value: Optional[str] = None,
@@ -46,147 +301,701 @@ class SQLModelDB(DatabaseService):
         sort_direction: str = "asc",
         limit: Optional[int] = None,
         offset: Optional[int] = None,
-        as_dict: bool = False,
         fields: Optional[List[str]] = None,
-    ) -> List[Dict[str, Any]]:
-        with Session(self.engine) as session:
-            if fields:
-                query = select(*[getattr(model, field) for field in fields])
-            else:
-                query = select(model)
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """Statement for a `query_records` call, and its bind values.
+
+        The statement is built once per shape and reused; search terms,
+        cursor values, limit and offset only travel as bind parameters.
+        """
+        if sorting_field and sorting_field not in describe(model).sortable_fields:
+            raise ValueError(
+                f"Sorting field '{sorting_field}' does not exist in the model."
+            )
+
+        search, params = self._search_params(model, search_value, substring)
+        descending = sort_direction.lower() == "desc"
+        seek = False
+        if keyset:
+            keys = self._sort_keys(model, sorting_field)
+            nullable = [k for k in keys if k not in describe(model).keyset_fields]
+            if nullable:
+                # A row-value comparison with NULL is never true: those rows
+                # would silently drop out of every page
+                raise ValueError(
+                    f"Keyset pagination cannot seek on nullable field '{nullable[0]}'"
+                )
+            direction, values = decode_cursor(cursor) if cursor else (NEXT, None)
+            if values is not None and len(values) != len(keys):
+                raise InvalidCursor(
+                    f"Pagination cursor '{cursor}' was made for another sort key"
+                )
+            if direction == PREV:
+                # Walk backwards from the cursor and flip the rows afterwards
+                descending = not descending
+            if values is not None:
+                seek = True
+                types = [describe(model).column_types[key] for key in keys]
+                values = coerce_cursor(cursor, values, types)
+                params.update({cursor_param(i): v for i, v in enumerate(values)})
+            if limit is not None:
+                # One extra row tells us whether there is another page
+                params[ROW_LIMIT] = limit + 1
+            with_total, offset = False, None
+        else:
+            if limit is not None:
+                params[ROW_LIMIT] = limit
+            if offset is not None:
+                params[ROW_OFFSET] = offset
+
+        shape = (
+            model,
+            tuple(fields) if fields else None,
+            sorting_field,
+            descending,
+            search,
+            keyset,
+            seek,
+            with_total,
+            limit is not None,
+            offset is not None,
+        )
+        query = self.statements.get(shape, lambda: self._compose_query(*shape))
+        return query, params
 
-            if search_value:
-                string_fields = [
-                    k for k, v in model.__fields__.items() if v.annotation is str
+    def _compose_query(
+        self,
+        model: Type[SQLModel],
+        fields: Optional[Tuple[str, ...]],
+        sorting_field: Optional[str],
+        descending: bool,
+        search: Optional[Tuple[bool, bool, bool]],
+        keyset: bool,
+        seek: bool,
+        with_total: bool,
+        has_limit: bool,
+        has_offset: bool,
+    ):
+        "Build the statement for one `_build_query` shape"
+        if fields:
+            fields = list(fields)
+            if keyset:
+                fields = fields + [
+                    key for key in self._sort_keys(model, sorting_field) if key not in fields
                 ]
-                if string_fields:
-                    conditions = [
-                        getattr(model, field).ilike(f"%{search_value}%")
-                        for field in string_fields
+            columns = [getattr(model, field) for field in fields]
+        else:
+            columns = [model]
+        if with_total:
+            # The window count is evaluated before LIMIT/OFFSET, so every row
+            # carries the size of the whole filtered set
+            columns.append(func.count().over().label(TOTAL_LABEL))
+        query = select(*columns)
+
+        condition = self._search_condition(model, search)
+        if condition is not None:
+            query = query.filter(condition)
+
+        if keyset:
+            columns = [getattr(model, key) for key in self._sort_keys(model, sorting_field)]
+            if seek:
+                key = sa.tuple_(*columns)
+                bound = sa.tuple_(
+                    *[
+                        sa.bindparam(cursor_param(i), type_=c.type)
+                        for i, c in enumerate(columns)
                     ]
-                    query = query.filter(or_(*conditions))
-
-            if sorting_field:
-                if sorting_field in model.__fields__:
-                    order_field = getattr(model, sorting_field)
-                    query = query.order_by(
-                        order_field.desc()
-                        if sort_direction.lower() == "desc"
-                        else order_field
-                    )
-                else:
-                    raise ValueError(
-                        f"Sorting field '{sorting_field}' does not exist in the model."
-                    )
-            else:
-                query = query.order_by(model.id)
+                )
+                query = query.where(key < bound if descending else key > bound)
+            query = query.order_by(*[c.desc() if descending else c for c in columns])
+        elif sorting_field:
+            order_field = getattr(model, sorting_field)
+            query = query.order_by(order_field.desc() if descending else order_field)
+        else:
+            if search is not None and search[0]:
+                # No explicit sort: best full-text matches first
+                query = self.search.order_by_rank(
+                    query, model, sa.bindparam(SEARCH_MATCH, type_=sa.String)
+                )
+            query = query.order_by(model.id)
 
-            if limit is not None:
-                query = query.limit(limit)
+        if has_limit:
+            query = query.limit(sa.bindparam(ROW_LIMIT, type_=sa.Integer))
+        if has_offset:
+            query = query.offset(sa.bindparam(ROW_OFFSET, type_=sa.Integer))
+        return query
 
-            if offset is not None:
-                query = query.offset(offset)
+    def _split_total(
+        self, results: List[Any], fields: Optional[List[str]], as_dict: bool
+    ) -> Tuple[List[Any], Optional[int]]:
+        "Strip the `count(*) OVER ()` column added for `with_total`"
+        if not results:
+            return [], None
+        total = results[0][-1]
+        if not fields:
+            records = [row[0] for row in results]
+        elif as_dict:
+            records = [
+                {k: v for k, v in row._asdict().items() if k != TOTAL_LABEL}
+                for row in results
+            ]
+        else:
+            records = [tuple(row[:-1]) for row in results]
+        return records, total
+
+    def _keyset_page(
+        self,
+        model: Type[SQLModel],
+        results: List[Any],
+        sorting_field: Optional[str],
+        limit: Optional[int],
+        cursor: Optional[str],
+        as_dict: bool,
+        fields: Optional[List[str]],
+    ) -> Page:
+        direction, values = decode_cursor(cursor) if cursor else (NEXT, None)
+        has_more = limit is not None and len(results) > limit
+        results = list(results[:limit] if limit is not None else results)
+        if direction == PREV:
+            results.reverse()
+            has_prev, has_next = has_more, values is not None
+        else:
+            has_prev, has_next = values is not None, has_more
 
-            results = session.exec(query).all()
+        keys = self._sort_keys(model, sorting_field)
 
-            if as_dict:
-                dict_results = [result._asdict() for result in results]
-                return dict_results
-            else:
-                return results
+        def key_of(row):
+            return [getattr(row, key) for key in keys]
+
+        page = Page(records=results)
+        if results and has_next:
+            page.next_cursor = encode_cursor(NEXT, key_of(results[-1]))
+        if results and has_prev:
+            page.prev_cursor = encode_cursor(PREV, key_of(results[0]))
+        if as_dict:
+            # Drop the sort keys that were only selected to build the cursors
+            extra = set(keys) - set(fields or keys)
+            page.records = [
+                {k: v for k, v in result._asdict().items() if k not in extra}
+                for result in results
+            ]
+        return page
+
+    def query_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        # Only plain dicts are cached; ORM instances belong to their session.
+        use_cache = as_dict and self._shares_reads()
+        if use_cache:
+            key = query_key(
+                search_value,
+                sorting_field,
+                sort_direction,
+                limit,
+                offset,
+                fields,
+                keyset,
+                cursor,
+                with_total,
+                substring,
+            )
+            cached = self.query_cache.get(model, key)
+            if cached is not None:
+                return cached
+            version = self.query_cache.version(model)
+
+        def run():
+            with self._session() as session:
+                result = self._run_query(
+                    session,
+                    model,
+                    search_value=search_value,
+                    sorting_field=sorting_field,
+                    sort_direction=sort_direction,
+                    limit=limit,
+                    offset=offset,
+                    as_dict=as_dict,
+                    fields=fields,
+                    keyset=keyset,
+                    cursor=cursor,
+                    with_total=with_total,
+                    substring=substring,
+                )
+                if use_cache and can_fill(session, self.query_cache, model):
+                    self.query_cache.put(model, version, key, result)
+                return result
+
+        if not use_cache:
+            return run()
+        # Identical calls already in flight share its result (and cache fill)
+        return self.flights.do(model, ("query", version, key), run)
+
+    def _run_query(
+        self,
+        session: Session,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        # Unfiltered totals follow the model's count_strategy rather than a
+        # window count over every row
+        table_total = (
+            with_total and not search_value and count_strategy(model) != EXACT
+        )
+        window = with_total and not table_total
+        query, params = self._build_query(
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            limit=limit,
+            offset=offset,
+            fields=fields,
+            keyset=keyset,
+            cursor=cursor,
+            with_total=window,
+            substring=substring,
+        )
+        records = None
+        if fields and as_dict and not keyset and not window:
+            result = self._core_execute(session, query, params)
+            records = [dict(row) for row in result.mappings()]
+        elif fields:
+            results = self._core_execute(session, query, params).all()
+        else:
+            results = session.exec(query, params=params).all()
+
+        if keyset:
+            page = self._keyset_page(
+                model, results, sorting_field, limit, cursor, as_dict, fields
+            )
+            if table_total:
+                page.total, page.approximate = self._table_count(session, model)
+            elif with_total:
+                count_query, params = self._count_query(
+                    model, search_value, substring
+                )
+                page.total = session.exec(count_query, params=params).one()
+            return page
+
+        if window:
+            records, total = self._split_total(results, fields, as_dict)
+            if total is None:
+                # An empty page past the end still needs the filtered count
+                count_query, params = self._count_query(
+                    model, search_value, substring
+                )
+                total = session.exec(count_query, params=params).one() if offset else 0
+            return Page(records=records, total=total)
+
+        if records is None:
+            records = [result._asdict() for result in results] if as_dict else results
+        if table_total:
+            total, approximate = self._table_count(session, model)
+            return Page(records=records, total=total, approximate=approximate)
+        return records
+
+    def _table_count(self, session: Session, model: Type[SQLModel]) -> Tuple[int, bool]:
+        "Unfiltered row count per `model.count_strategy`, and whether it is an estimate"
+        strategy = count_strategy(model)
+        if strategy == CACHED:
+            cached = self.counts.get(model)
+            if cached is not None:
+                return cached, False
+        elif strategy == ESTIMATED:
+            estimate = estimate_rows(session.connection(), model)
+            if estimate is not None:
+                return estimate, True
+        elif strategy == MAINTAINED and self.counters.available(model):
+            maintained = session.scalar(self.counters.query(model))
+            if maintained is not None:
+                return maintained, False
+        # No statistics or counter yet: fall back to counting
+        query, params = self._count_query(model)
+        total = session.exec(query, params=params).one()
+        if strategy == CACHED:
+            self.counts.put(model, total)
+        return total, False
+
+    def _core_execute(self, session: Session, query, params: Dict[str, Any]):
+        """Run a column select on the session's connection, skipping ORM loading.
+
+        Plain rows need no identity map or instance state; only the autoflush
+        `session.exec` would do is kept, so pending writes stay visible.
+        """
+        if session.autoflush:
+            session.flush()
+        # The clause lets RoutingSession send the read to a replica
+        connection = session.connection(bind_arguments={"clause": query})
+        return connection.execute(query, params)
+
+    def _stream_row(self, row: Any, fields: Optional[List[str]], as_dict: bool) -> Any:
+        if not as_dict:
+            return row
+        if not fields:
+            return row.model_dump()
+        # A single selected column comes back as a bare scalar
+        return row._asdict() if len(fields) > 1 else {fields[0]: row}
+
+    def stream_records(
+        self,
+        model: Type[SQLModel],
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+        substring: bool = False,
+    ) -> Iterator[Union[SQLModel, Dict[str, Any]]]:
+        """Yield matching records one at a time from a server-side cursor.
+
+        Rows are fetched `batch_size` at a time (`yield_per`), so memory stays
+        bounded whatever the table size. The generator owns its session rather
+        than the request's, so close it (or exhaust it) to release the
+        connection.
+        """
+        query, params = self._build_query(
+            model,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            fields=fields,
+            substring=substring,
+        )
+        options = {"yield_per": batch_size}
+        with self.new_session() as session:
+            for partition in session.exec(
+                query, params=params, execution_options=options
+            ).partitions():
+                for row in partition:
+                    yield self._stream_row(row, fields, as_dict)
 
     # Add to SQLModelDB class in sqlmodel.py
 
     def get_record(
         self, model: Type[SQLModel], id: Any, alt_key: str = None
     ) -> Optional[SQLModel]:
-        with Session(self.engine) as session:
+        with self._session() as session:
+            if not alt_key:
+                id = coerce_id(id)
+                # The request's own instance, with its unflushed edits, wins
+                live = session.identity_map.get(session.identity_key(model, id))
+                if live is not None:
+                    return live
+            # A request that wrote must see its writes, not what was cached
+            shares = self._shares_reads()
+            cached = self.cache.get(model, id, alt_key) if shares else None
+            if cached is not None:
+                if session is not current_session.get():
+                    return cached
+                key = session.identity_key(model, cached.id)
+                live = session.identity_map.get(key)
+                if live is not None:
+                    return live
+                # Not in the session yet: attach without a SELECT so
+                # relationships still lazy-load
+                return session.merge(cached, load=False)
             if alt_key:
                 stmt = select(model).where(getattr(model, alt_key) == id)
                 result = session.exec(stmt).first()
             else:
-                if isinstance(id, str):
-                    id = UUID(id)
                 result = session.get(model, id)
+            if result is not None and can_fill(session, self.cache, model, result):
+                self.cache.put(result)
             return result
 
     def update_record(
         self, model: Type[SQLModel], id: Any, data: Dict[str, Any]
     ) -> Dict[str, Any]:
-        with Session(self.engine) as session:
+        with self._session(write=True) as session:
             record = session.get(model, id)
             if not record:
                 raise Exception(f"Record with id {id} not found")
             for key, value in data.items():
                 setattr(record, key, value)
             session.add(record)
-            session.commit()
+            self._commit(session)
             session.refresh(record)
             return record.dict()
 
+    def save_record(self, record: SQLModel) -> SQLModel:
+        """INSERT a new record, or UPDATE only the columns changed since load.
+
+        Loaded records (detached or in the request session) track their
+        assignments, so there is no pre-SELECT and an unchanged record is not
+        written at all. A row deleted in the meantime is inserted again.
+        """
+        model = type(record)
+        if not sa.inspect(record).has_identity:
+            return self.upsert_record(model, record.dict())
+        changes = changed_columns(record, utc_now())
+        if not changes:
+            return record
+        with self._session(write=True) as session:
+            connection = session.connection()
+            stmt = update_statement(model.__table__)
+            params = {**changes, ID_PARAM: record.id}
+            matched = connection.execute(stmt, params).rowcount
+            if matched:
+                # Before the flush, so the session does not write them again
+                mark_saved(record, changes)
+                self._written(session, model, [record.id])
+                self._commit(session)
+        if not matched:
+            return self.upsert_record(model, record.dict())
+        return record
+
     def delete_record(self, model: Type[SQLModel], id: Any) -> None:
-        with Session(self.engine) as session:
+        with self._session(write=True) as session:
             record = session.get(model, id)
             if record:
                 session.delete(record)
-                session.commit()
+                self._commit(session)
 
+    def _merge_upsert(
+        self, model: Type[SQLModel], data: Dict[str, Any], db_record: Optional[SQLModel]
+    ) -> SQLModel:
+        if db_record:
+            for key, value in data.items():
+                setattr(db_record, key, value)
+            db_record.updated_at = utc_now()
+        else:
+            db_record = model(**data)
+            db_record.created_at = utc_now()
+            db_record.updated_at = utc_now()
+        return db_record
 
-    def upsert_record(self, model: Type[SQLModel], data: Dict[str, Any]) -> SQLModel:
-        with Session(self.engine) as session:
-            if "id" in data:
-                if isinstance(data["id"], str):
-                    data["id"] = UUID(data["id"])
-                data.pop("created_at",None)
-                db_record = session.get(model, data["id"])
-                if db_record:
-                    for key, value in data.items():
-                        setattr(db_record, key, value)
-                    db_record.updated_at = utc_now()
-                else:
-                    db_record = model(**data)
-                    db_record.created_at = utc_now()
-                    db_record.updated_at = utc_now()
-            else:
-                db_record = model(**data)
-                db_record.created_at = utc_now()
-                db_record.updated_at = utc_now()
+    def _native_upsert(
+        self, model: Type[SQLModel], data: Dict[str, Any], target: List[str]
+    ):
+        """`INSERT ... ON CONFLICT DO UPDATE RETURNING` for one record.
+
+        None when the dialect has no ON CONFLICT, or when `data` is too partial
+        to be inserted (a NOT NULL column without value or default).
+        """
+        row = prepare_rows(model, [data], utc_now())[0]
+        stmt = upsert_statement(model, self.engine.dialect.name, list(data), target)
+        if stmt is None or missing_required(model.__table__, row):
+            return None
+        return (
+            stmt.values(row)
+            .returning(model)
+            .execution_options(populate_existing=True)
+        )
+
+    def _lookup_condition(
+        self, model: Type[SQLModel], data: Dict[str, Any], target: List[str]
+    ):
+        if not all(column in data for column in target):
+            return None
+        return sa.and_(*[getattr(model, column) == data[column] for column in target])
+
+    def upsert_record(
+        self,
+        model: Type[SQLModel],
+        data: Dict[str, Any],
+        conflict_target: ConflictTarget = None,
+    ) -> SQLModel:
+        """Insert `data`, or update the row it collides with on `conflict_target`.
+
+        One `ON CONFLICT` statement on SQLite and Postgres; elsewhere a lookup
+        followed by an insert or update.
+        """
+        target = conflict_columns(model, conflict_target)
+        # Timestamps are always set here, never taken from the caller
+        data = {k: v for k, v in data.items() if k not in TIMESTAMP_FIELDS}
+        if "id" in data:
+            data["id"] = coerce_id(data["id"])
+        stmt = self._native_upsert(model, data, target)
+        with self._session(write=True) as session:
+            if stmt is not None:
+                db_record = session.exec(stmt).scalars().one()
+                self._written(session, model, [db_record.id])
+                if session is not current_session.get():
+                    # Keep the loaded state once the owned session commits
+                    session.expunge(db_record)
+                self._commit(session)
+                return db_record
+
+            db_record = None
+            condition = self._lookup_condition(model, data, target)
+            if condition is not None:
+                db_record = session.exec(select(model).where(condition)).first()
+            db_record = self._merge_upsert(model, data, db_record)
 
             session.add(db_record)
-            session.commit()
+            self._commit(session)
             session.refresh(db_record)
 
             return db_record
 
+    def upsert_many(
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        conflict_target: ConflictTarget = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """Batched `upsert_record`: chunked executemany `INSERT ... ON CONFLICT`.
+
+        Rows are grouped by the columns they set so a conflict only overwrites
+        what each row provides. Returns the number of rows inserted or updated.
+        """
+        target = conflict_columns(model, conflict_target)
+        now = utc_now()
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for item in data:
+            item = {k: v for k, v in item.items() if k not in TIMESTAMP_FIELDS}
+            groups.setdefault(tuple(sorted(item)), []).append(item)
+
+        affected = 0
+        fallback = []
+        with self._session(write=True) as session:
+            session.flush()
+            connection = session.connection()
+            for keys, items in groups.items():
+                rows = prepare_rows(model, items, now)
+                # Conflicts on a unique column hit ids we can't know: drop the model
+                ids = [row["id"] for row in rows] if target == ["id"] else None
+                self._written(session, model, ids)
+                stmt = upsert_statement(model, connection.dialect.name, keys, target)
+                if stmt is None or missing_required(model.__table__, rows[0]):
+                    fallback += items
+                    continue
+                for chunk in chunked(rows, chunk_size):
+                    affected += connection.execute(stmt, chunk).rowcount
+            session.expire_all()
+            self._commit(session)
+        for item in fallback:
+            self.upsert_record(model, item, conflict_target)
+        return affected + len(fallback)
+
     def bulk_insert(
-        self, model: Type[SQLModel], data: List[Dict[str, Any]]
-    ) -> List[SQLModel]:
-        with Session(self.engine) as session:
-            records = [model(**item) for item in data]
-            session.add_all(records)
-            session.commit()
-            for record in records:
-                session.refresh(record)
-            return records
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        returning: bool = False,
+    ) -> Union[int, List[Any]]:
+        """Insert `data` with chunked Core executemany (COPY on Postgres).
+
+        Returns the number of rows inserted, or their ids when `returning`.
+        """
+        rows = prepare_rows(model, data, utc_now())
+        table = model.__table__
+        ids = []
+        with self._session(write=True) as session:
+            # Flush pending ORM changes first: the statements bypass the unit of work
+            session.flush()
+            connection = session.connection()
+            # New rows change query results but cannot stale a cached record
+            mark_stale(session, self.query_cache, model, None)
+            for chunk in chunked(rows, chunk_size):
+                if returning:
+                    stmt = sa.insert(table).returning(table.c.id)
+                    ids.extend(connection.execute(stmt, chunk).scalars().all())
+                elif not (
+                    connection.dialect.name == "postgresql"
+                    and copy_rows(connection, table, chunk)
+                ):
+                    connection.execute(sa.insert(table), chunk)
+            self._commit(session)
+        return ids if returning else len(rows)
 
     def bulk_update(
-        self, model: Type[SQLModel], data: List[Dict[str, Any]]
+        self,
+        model: Type[SQLModel],
+        data: List[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        refresh: bool = False,
+    ) -> Union[int, List[SQLModel]]:
+        """Chunked executemany `UPDATE ... WHERE id = :id`, bumping `updated_at`.
+
+        Returns the number of rows matched, or the updated records (loaded
+        with one SELECT per chunk) when `refresh` is set.
+        """
+        groups = prepare_updates(model, data, utc_now())
+        stmt = update_statement(model.__table__)
+        matched = 0
+        with self._session(write=True) as session:
+            # Flush pending ORM changes first: the statements bypass the unit of work
+            session.flush()
+            connection = session.connection()
+            for rows in groups.values():
+                ids = [row[ID_PARAM] for row in rows]
+                self._written(session, model, ids)
+                for chunk in chunked(rows, chunk_size):
+                    matched += connection.execute(stmt, chunk).rowcount
+            session.expire_all()
+            self._commit(session)
+            if not refresh:
+                return matched
+            ids = [row[ID_PARAM] for rows in groups.values() for row in rows]
+            return self._load_many(session, model, ids, chunk_size)
+
+    def _load_many(
+        self,
+        session: Session,
+        model: Type[SQLModel],
+        ids: List[Any],
+        chunk_size: int,
+        key: str = "id",
     ) -> List[SQLModel]:
-        with Session(self.engine) as session:
-            records = []
-            for item in data:
-                if "id" in item:
-                    record = session.get(model, item["id"])
-                    if record:
-                        for key, value in item.items():
-                            setattr(record, key, value)
-                        records.append(record)
-            session.add_all(records)
-            session.commit()
-            for record in records:
-                session.refresh(record)
-            return records
+        if key == "id":
+            ids = [coerce_id(id) for id in ids]
+        column = getattr(model, key)
+        records = []
+        for chunk in chunked(list(dict.fromkeys(ids)), chunk_size):
+            records += session.exec(select(model).where(column.in_(chunk))).all()
+        return records
+
+    def get_records(
+        self, model: Type[SQLModel], values: List[Any], key: str = "id"
+    ) -> List[SQLModel]:
+        with self._session() as session:
+            return self._load_many(session, model, values, BULK_CHUNK_SIZE, key)
+
+    def loader(self) -> RelatedLoader:
+        "The current request's RelatedLoader; outside a request, a throwaway one"
+        session = current_session.get()
+        if session is None or session.info.get("db") is not self:
+            return RelatedLoader(self)
+        if LOADER not in session.info:
+            session.info[LOADER] = RelatedLoader(self)
+        return session.info[LOADER]
 
     def count_records(self, model: Type[SQLModel]) -> int:
-        with Session(self.engine) as session:
-            return session.exec(select(func.count()).select_from(model)).one()
+        def run():
+            with self._session() as session:
+                return self._table_count(session, model)[0]
+
+        if not self._shares_reads():
+            return run()
+        version = self.query_cache.version(model)
+        return self.flights.do(model, ("count", version), run)
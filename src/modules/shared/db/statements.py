@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from decouple import config
+
+STATEMENT_CACHE_SIZE = config("DATABASE_STATEMENT_CACHE_SIZE", default=500, cast=int)
+# Bind names of the values `query_records` statements take at execution
+SEARCH_PATTERN = "search_pattern"
+SEARCH_MATCH = "search_match"
+SEARCH_PHRASE = "search_phrase"
+ROW_LIMIT = "row_limit"
+ROW_OFFSET = "row_offset"
+
+
+def cursor_param(position: int) -> str:
+    "Bind name of the `position`th keyset cursor value"
+    return f"cursor_{position}"
+
+
+class StatementCache:
+    """Built statements keyed by query shape.
+
+    A shape is everything that changes the SQL text (model, selected fields,
+    sort, which search strategies apply, whether there is a cursor, limit or
+    offset); the values themselves are bind parameters supplied at execution.
+    Reusing the statement object also reuses its memoized cache key, so
+    SQLAlchemy's compiled cache is hit without rebuilding anything.
+    """
+
+    def __init__(self, maxsize: int = STATEMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, shape: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            statement = self._entries.get(shape)
+            if statement is not None:
+                self._entries.move_to_end(shape)
+                return statement
+        # Two threads may build the same shape; either result is fine to keep
+        statement = build()
+        with self._lock:
+            self._entries[shape] = statement
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return statement
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
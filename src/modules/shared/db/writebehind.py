@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple, Type
+
+from decouple import config
+from sqlmodel import SQLModel
+
+from modules.shared.db.bulk import coerce_id, prepare_rows
+from modules.shared.db.session import current_session
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MS = config("DATABASE_WRITE_BEHIND_MS", default=500, cast=int)
+WRITE_BEHIND_MAX_ITEMS = config(
+    "DATABASE_WRITE_BEHIND_MAX_ITEMS", default=1000, cast=int
+)
+# Flushes a failing batch is tried in before its rows become dead letters, and
+# how many dead letters are kept for inspection
+WRITE_BEHIND_RETRIES = config("DATABASE_WRITE_BEHIND_RETRIES", default=3, cast=int)
+WRITE_BEHIND_DEAD_LETTERS = config(
+    "DATABASE_WRITE_BEHIND_DEAD_LETTERS", default=1000, cast=int
+)
+
+INSERT = "insert"
+UPDATE = "update"
+
+
+class WriteBehindQueue:
+    """Deferred low-priority writes, applied in bulk off the request path.
+
+    `insert` and `update` only record the write; pending writes to the same
+    (model, id) coalesce into one row, later values winning. A background
+    task flushes every DATABASE_WRITE_BEHIND_MS, or as soon as
+    DATABASE_WRITE_BEHIND_MAX_ITEMS rows are pending, through `bulk_insert`
+    and `bulk_update` on sessions of its own, never the request's; without
+    an event loop (scripts, CLI) a full queue is flushed in a thread.
+    `aclose` flushes what is left on shutdown.
+
+    A batch that fails goes back on the queue for the next flush, up to
+    DATABASE_WRITE_BEHIND_RETRIES times; then its rows are logged and kept in
+    `dead_letters`. Deferred writes are invisible to reads until flushed and
+    are lost if the process dies first: use it for data like sign-in
+    timestamps, never for anything a caller reads back.
+    """
+
+    def __init__(
+        self,
+        db,
+        interval_ms: int = WRITE_BEHIND_MS,
+        max_items: int = WRITE_BEHIND_MAX_ITEMS,
+        retries: int = WRITE_BEHIND_RETRIES,
+        dead_letters: int = WRITE_BEHIND_DEAD_LETTERS,
+    ):
+        self.db = db
+        self.interval = interval_ms / 1000
+        self.max_items = max_items
+        self.retries = retries
+        # (model, kind, row) of writes that failed every retry, oldest dropped
+        self.dead_letters: Deque[Tuple[Type[SQLModel], str, Dict[str, Any]]] = deque(
+            maxlen=dead_letters
+        )
+        # (model, id) -> [kind, column values, failed flushes], oldest first
+        self._pending: Dict[Tuple[Type[SQLModel], Any], List] = {}
+        self._lock = threading.Lock()
+        # Serializes flushes so batches apply in the order they were taken
+        self._flush_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flusher: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def insert(self, model: Type[SQLModel], data: Dict[str, Any]) -> Any:
+        "Queue a new row; returns its id (assigned now when `data` has none)"
+        row = prepare_rows(model, [data], datetime.now(timezone.utc))[0]
+        self._enqueue(model, row["id"], INSERT, row)
+        return row["id"]
+
+    def update(self, model: Type[SQLModel], id: Any, data: Dict[str, Any]) -> None:
+        "Queue an UPDATE of `data`'s columns on the row with `id`"
+        values = {key: value for key, value in data.items() if key != "id"}
+        self._enqueue(model, coerce_id(id), UPDATE, values)
+
+    def _enqueue(
+        self, model: Type[SQLModel], id: Any, kind: str, values: Dict[str, Any]
+    ) -> None:
+        with self._lock:
+            entry = self._pending.get((model, id))
+            if entry is None:
+                self._pending[(model, id)] = [kind, values, 0]
+            else:
+                # An update of a queued insert is folded into the insert
+                entry[1].update(values)
+                if kind == INSERT:
+                    entry[0] = INSERT
+            full = len(self._pending) >= self.max_items
+        if not full:
+            return
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+            return
+        # No background task (scripts, CLI): flush beside the caller
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self.flush, name="write-behind-flush"
+            )
+            self._flusher.start()
+
+    def flush(self) -> int:
+        "Apply every pending write now; returns the number of rows written"
+        # Batches commit on their own; they must not join a request's session
+        token = current_session.set(None)
+        try:
+            with self._flush_lock:
+                return self._flush()
+        finally:
+            current_session.reset(token)
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        batches: Dict[Tuple[Type[SQLModel], str], List[Tuple[Any, Dict, int]]] = {}
+        for (model, id), (kind, values, failures) in pending.items():
+            batches.setdefault((model, kind), []).append((id, values, failures))
+        written = 0
+        # Inserts first, so updates of rows inserted earlier find them
+        for (model, kind), entries in sorted(
+            batches.items(), key=lambda item: item[0][1] != INSERT
+        ):
+            rows = [
+                values if kind == INSERT else {"id": id, **values}
+                for id, values, _ in entries
+            ]
+            try:
+                if kind == INSERT:
+                    written += self.db.bulk_insert(model, rows)
+                else:
+                    written += self.db.bulk_update(model, rows)
+            except Exception:
+                self._failed(model, kind, entries)
+        return written
+
+    def _failed(
+        self, model: Type[SQLModel], kind: str, entries: List[Tuple[Any, Dict, int]]
+    ) -> None:
+        "Queue a failed batch for the next flush, or dead-letter it when out of tries"
+        failures = max(failures for _, _, failures in entries) + 1
+        if failures > self.retries:
+            logger.exception(
+                f"Write-behind {kind} of {len(entries)} {model.__name__} rows "
+                f"failed {failures} times; moved to dead letters"
+            )
+            for id, values, _ in entries:
+                row = values if kind == INSERT else {"id": id, **values}
+                self.dead_letters.append((model, kind, row))
+            return
+        logger.exception(
+            f"Write-behind {kind} of {len(entries)} {model.__name__} rows failed; "
+            "retrying on the next flush"
+        )
+        with self._lock:
+            for id, values, _ in entries:
+                newer = self._pending.get((model, id))
+                if newer is None:
+                    self._pending[(model, id)] = [kind, values, failures]
+                else:
+                    # Writes queued since keep winning over the failed values
+                    newer[1] = {**values, **newer[1]}
+                    newer[2] = failures
+                    if kind == INSERT:
+                        newer[0] = INSERT
+
+    async def start(self) -> None:
+        "Run the periodic flush on the current event loop"
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._pending:
+                await asyncio.to_thread(self.flush)
+
+    async def aclose(self) -> None:
+        "Stop the periodic flush and write out whatever is still queued"
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+        if self._flusher is not None:
+            await asyncio.to_thread(self._flusher.join)
+            self._flusher = None
+        # Failed batches come back until they run out of retries
+        while self._pending:
+            await asyncio.to_thread(self.flush)
@@ -1,11 +1,14 @@
 import json
 from datetime import datetime, timezone
 from functools import lru_cache
-from typing import Any, ClassVar, Dict, List, Optional, Set, Type
+from typing import Any, ClassVar, Dict, Iterator, List, Optional, Set, Type, Union
 from uuid import UUID, uuid4
 
 import sqlalchemy
-from .db import get_db_service
+from .db import service as db
+from .db.base import STREAM_BATCH_SIZE
+from .db.introspection import describe
+from .db.pagination import InvalidCursor, Page
 from pydantic import ConfigDict
 from pydantic.json import pydantic_encoder
 from pydantic_core import PydanticUndefined
@@ -14,8 +17,6 @@ from sqlmodel import Field, SQLModel
 
 from modules.admin.components import ModalForm, ModelTable, table_page
 
-db = get_db_service()
-
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
@@ -53,10 +54,28 @@ class BaseTable(SQLModel):
     # Class-level metadata for frontend rendering
     display_name: ClassVar[str] = "Untitled"
     sidebar_icon: ClassVar[str] = "table"
+    # Column whose value str() of a record renders; foreign keys targeting it
+    # are shown as they are, without loading the related record
+    display_field: ClassVar[Optional[str]] = None
 
     default_sort_field: ClassVar[str] = "id"
+    # Page the admin table with (default_sort_field, id) cursors instead of
+    # OFFSET; default_sort_field must then be NOT NULL (checked when mapped)
+    keyset_pagination: ClassVar[bool] = False
     table_view_fields: ClassVar[List[str]] = []
+    # Fields indexed for full-text search; empty means `ilike` over every str field
+    search_fields: ClassVar[List[str]] = []
     detail_page_fields: ClassVar[List[str]] = []
+    # Seconds get() may serve records from the entity cache; None disables it
+    cache_ttl: ClassVar[Optional[float]] = None
+    # Unique columns records are also looked up by (get(value, alt_key=...))
+    alt_keys: ClassVar[List[str]] = []
+    # How total_records() and unfiltered table totals are counted: "exact",
+    # "cached" (recounted every count_refresh seconds), "estimated" (from
+    # planner statistics, shown as "about 4.2M records") or "maintained"
+    # (a trigger-kept counter row, installed by `fh install`)
+    count_strategy: ClassVar[str] = "exact"
+    count_refresh: ClassVar[Optional[float]] = None
     detail_page_title: ClassVar[Optional[str]] = None
     field_groups: ClassVar[Dict[str, List[str]]] = {}
 
@@ -74,8 +93,8 @@ class BaseTable(SQLModel):
         return db.all_records(cls)
 
     @classmethod
-    def total_records(cls) -> List["BaseTable"]:
-        return len(db.all_records(cls))
+    def total_records(cls) -> int:
+        return db.count_records(cls)
 
     @classmethod
     def query(
@@ -87,7 +106,11 @@ class BaseTable(SQLModel):
         offset: Optional[int] = None,
         as_dict: bool = False,
         fields: Optional[List[str]] = None,
-    ) -> List[Dict[str, Any]]:
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
         return db.query_records(
             cls,
             search_value=search_value,
@@ -97,10 +120,38 @@ class BaseTable(SQLModel):
             offset=offset,
             as_dict=as_dict,
             fields=fields,
+            keyset=keyset,
+            cursor=cursor,
+            with_total=with_total,
+            substring=substring,
         )
 
     @classmethod
-    def table_view_data(cls, request) -> List[Dict[str, Any]]:
+    def stream(
+        cls,
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+        substring: bool = False,
+    ) -> Iterator[Union["BaseTable", Dict[str, Any]]]:
+        return db.stream_records(
+            cls,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            as_dict=as_dict,
+            fields=fields,
+            batch_size=batch_size,
+            substring=substring,
+        )
+
+    @classmethod
+    def table_view_data(
+        cls, request, with_total: bool = False
+    ) -> Union[List[Dict[str, Any]], Page]:
         search_value = None
         page = 1
         per_page = 10
@@ -124,9 +175,47 @@ class BaseTable(SQLModel):
             offset=offset,
             as_dict=True,
             fields=view_fields,
+            with_total=with_total,
+            substring=True,
         )
         return records
 
+    @classmethod
+    def table_view_page(cls, request, with_total: bool = False) -> Page:
+        "Keyset-paginated counterpart of `table_view_data`"
+        search_value = None
+        cursor = None
+        per_page = 10
+        view_fields = cls.table_view_fields
+
+        if "id" not in view_fields:
+            view_fields.append("id")
+
+        if hasattr(request, "query_params"):
+            search_value = request.query_params.get("search_value")
+            cursor = request.query_params.get("cursor") or None
+            per_page = int(request.query_params.get("per_page", 10))
+
+        def page(cursor: Optional[str]) -> Page:
+            return cls.query(
+                search_value=search_value,
+                sorting_field=cls.default_sort_field,
+                sort_direction="asc",
+                limit=per_page,
+                as_dict=True,
+                fields=view_fields,
+                keyset=True,
+                cursor=cursor,
+                with_total=with_total,
+                substring=True,
+            )
+
+        try:
+            return page(cursor)
+        except InvalidCursor:
+            # A mangled or outdated link: start over from the first page
+            return page(None)
+
     @classmethod
     def get(cls, id: Any, alt_key: str = None) -> Optional["BaseTable"]:
         return db.get_record(cls, id, alt_key)
@@ -140,8 +229,72 @@ class BaseTable(SQLModel):
         db.delete_record(cls, id)
 
     @classmethod
-    def upsert(cls, data: Dict[str, Any]) -> "BaseTable":
-        return db.upsert_record(cls, data)
+    def upsert(
+        cls, data: Dict[str, Any], conflict_target: Optional[str] = None
+    ) -> "BaseTable":
+        return db.upsert_record(cls, data, conflict_target)
+
+    @classmethod
+    def defer_insert(cls, data: Dict[str, Any]) -> Any:
+        "Queue an insert on the write-behind queue; returns the new id"
+        return db.write_behind.insert(cls, data)
+
+    @classmethod
+    def defer_update(cls, id: Any, data: Dict[str, Any]) -> None:
+        "Queue a low-priority update on the write-behind queue"
+        db.write_behind.update(cls, id, data)
+
+    @classmethod
+    async def aall(cls) -> List["BaseTable"]:
+        return await db.aall_records(cls)
+
+    @classmethod
+    async def aquery(
+        cls,
+        search_value: Optional[str] = None,
+        sorting_field: Optional[str] = None,
+        sort_direction: str = "asc",
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        as_dict: bool = False,
+        fields: Optional[List[str]] = None,
+        keyset: bool = False,
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        substring: bool = False,
+    ) -> Union[List[Dict[str, Any]], Page]:
+        return await db.aquery_records(
+            cls,
+            search_value=search_value,
+            sorting_field=sorting_field,
+            sort_direction=sort_direction,
+            limit=limit,
+            offset=offset,
+            as_dict=as_dict,
+            fields=fields,
+            keyset=keyset,
+            cursor=cursor,
+            with_total=with_total,
+            substring=substring,
+        )
+
+    @classmethod
+    async def aget(cls, id: Any, alt_key: str = None) -> Optional["BaseTable"]:
+        return await db.aget_record(cls, id, alt_key)
+
+    @classmethod
+    async def aupdate_record(cls, id: Any, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await db.aupdate_record(cls, id, data)
+
+    @classmethod
+    async def adelete_record(cls, id: Any) -> None:
+        await db.adelete_record(cls, id)
+
+    @classmethod
+    async def aupsert(
+        cls, data: Dict[str, Any], conflict_target: Optional[str] = None
+    ) -> "BaseTable":
+        return await db.aupsert_record(cls, data, conflict_target)
 
     @classmethod
     def _cast_data(cls, data: List[Dict[str, Any]]) -> List["BaseTable"]:
@@ -153,7 +306,16 @@ class BaseTable(SQLModel):
         return
 
     def save(self) -> "BaseTable":
-        return db.upsert_record(self.__class__, self.dict())
+        "Insert a new record, or UPDATE only the fields changed since it was loaded"
+        return db.save_record(self)
+
+    async def ainserted(self) -> Optional["BaseTable"]:
+        if await db.aget_record(type(self), self.id):
+            return True
+        return
+
+    async def asave(self) -> "BaseTable":
+        return await db.asave_record(self)
 
     def dict(self, *args, **kwargs):
         return self._dict_with_custom_encoder(set(), *args, **kwargs)
@@ -207,17 +369,45 @@ class BaseTable(SQLModel):
                 return subclass
         return None
 
-    def _get_related_model_info(self, field_info) -> tuple:
+    @classmethod
+    def _get_related_model_info(cls, field_info) -> tuple:
         """Extract related model and field from foreign key"""
-        if not hasattr(field_info, "foreign_key"):
+        if getattr(field_info, "foreign_key", PydanticUndefined) is PydanticUndefined:
             return None, None
 
         # foreign_key format is "model.field"
         # if hasattr(field_info,"foreign_key"):
         model_name, field_name = field_info.foreign_key.split(".")
-        model_class = self._get_model_by_name(model_name)
+        model_class = cls._get_model_by_name(model_name)
         return model_class, field_name
 
+    @classmethod
+    def resolve_related(
+        cls, rows: List[Dict[str, Any]], fields: List[str]
+    ) -> Dict[str, Dict[Any, Optional["BaseTable"]]]:
+        """Related records behind the foreign key `fields` of `rows`.
+
+        One query per related model for the whole page, memoized for the rest
+        of the request: {field: {foreign key value: related record}}. Keys
+        pointing at the related model's `display_field` already read as the
+        record would, so they are left out.
+        """
+        loader = db.loader()
+        foreign_keys = describe(cls).foreign_keys
+        targets = {}
+        for field in fields:
+            if field not in foreign_keys:
+                continue
+            model_name, key = foreign_keys[field]
+            model_class = cls._get_model_by_name(model_name)
+            if model_class and model_class.display_field != key:
+                targets[field] = (model_class, key)
+                loader.want(model_class, key, [row.get(field) for row in rows])
+        return {
+            field: loader.get_many(model_class, key, [row.get(field) for row in rows])
+            for field, (model_class, key) in targets.items()
+        }
+
     def _get_field_options(self, field_info) -> list:
         """Get options for select fields"""
         # Handle enum options
@@ -232,7 +422,8 @@ class BaseTable(SQLModel):
             if field_info.foreign_key is not PydanticUndefined:
                 model_class, field_name = self._get_related_model_info(field_info)
                 if model_class:
-                    records = model_class.all()
+                    # Memoized per request: several fields and forms share it
+                    records = db.loader().all(model_class)
                     return [
                         {"value": getattr(r, field_name), "label": str(r)}
                         for r in records
@@ -240,33 +431,6 @@ class BaseTable(SQLModel):
 
         return []
 
-    def _get_field_type(self, field_info) -> str:
-        """Determine field type"""
-        # Check schema_extra first
-        if field_info._attributes_set and "input_type" in field_info._attributes_set:
-            return field_info._attributes_set["input_type"]
-
-        # Check for select types
-        if hasattr(field_info, "foreign_key"):
-            if field_info.foreign_key is not PydanticUndefined:
-                return "select"
-        if hasattr(field_info.annotation, "__members__"):  # Check for enum types
-            return "select"
-
-        # Standard type mapping
-        type_mapping = {
-            str: "text",
-            int: "number",
-            float: "number",
-            bool: "checkbox",
-            datetime: "date",
-            UUID: "text",
-            list: "select",
-            dict: "json",
-        }
-
-        return type_mapping.get(field_info.annotation, "text")
-
     def form_data(self) -> Dict[str, Any]:
         """Generate form template"""
         model_fields = self.model_fields
@@ -284,7 +448,7 @@ class BaseTable(SQLModel):
             field_def = {
                 "name": field_name,
                 "title": field_info.title or field_name.replace("_", " ").title(),
-                "type": self._get_field_type(field_info),
+                "type": describe(type(self)).input_types[field_name],
                 "value": field_value,
                 "required": required,
             }
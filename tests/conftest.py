@@ -0,0 +1,66 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# The database service is built from the environment on first import
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test.db"
+)
+os.environ["DATABASE_BACKEND"] = "sqlmodel"
+os.environ["DATABASE_REPLICA_URLS"] = ""
+os.environ["DATABASE_ECHO"] = "False"
+
+import modules  # noqa: E402,F401 - registers every model
+import modules.shared.db as db_package  # noqa: E402
+import modules.shared.models as shared_models  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+
+from modules.shared.db import get_db_service  # noqa: E402
+from modules.shared.db.async_sqlmodel import AsyncSQLModelDB  # noqa: E402
+from modules.shared.db.session import current_session  # noqa: E402
+
+
+def _drop_everything(engine) -> None:
+    with engine.begin() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).all()
+        # Virtual tables first: dropping one drops its shadow tables too
+        rows.sort(key=lambda row: not (row[1] or "").startswith("CREATE VIRTUAL"))
+        for name, _ in rows:
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
+
+
+@pytest.fixture
+def db(monkeypatch):
+    "A fresh service over a database holding just the models' tables, as migrated"
+    service = get_db_service()
+    _drop_everything(service.engine)
+    SQLModel.metadata.create_all(service.engine)
+    # BaseTable methods, the CLI and the middleware all use this service
+    monkeypatch.setattr(db_package, "service", service)
+    monkeypatch.setattr(shared_models, "db", service)
+    yield service
+    asyncio.run(service.aclose())
+
+
+@pytest.fixture
+def adb(db):
+    "The asyncio backend over the test database"
+    service = AsyncSQLModelDB(os.environ["DATABASE_URL"])
+    yield service
+    asyncio.run(service.aclose())
+
+
+@pytest.fixture
+def request_session(db):
+    "A request-scoped session bound the way DBSessionMiddleware binds it"
+    session = db.new_session()
+    token = current_session.set(session)
+    yield session
+    current_session.reset(token)
+    session.rollback()
+    session.close()
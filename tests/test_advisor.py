@@ -0,0 +1,51 @@
+from sqlmodel import SQLModel
+from typer.testing import CliRunner
+
+import cli
+from modules.auth.models import RolePriviledge, User
+from modules.shared.db.advisor import IndexAdvice, advise, covered, wanted_indexes
+from modules.shared.db.introspection import schema_cache
+
+runner = CliRunner()
+
+
+def models():
+    return [m.class_ for m in SQLModel._sa_registry.mappers]
+
+
+def test_indexes_follow_sort_fields_foreign_keys_and_alt_keys():
+    assert [(a.columns, a.reason) for a in wanted_indexes(User)] == [
+        (("role",), "foreign key to role.name"),
+        (("email",), "alt_keys lookup"),
+    ]
+    assert ("role_name", "id") in [a.columns for a in wanted_indexes(RolePriviledge)]
+
+
+def test_only_leading_columns_cover_an_index():
+    assert covered(("role_name",), [("role_name", "id")])
+    assert not covered(("id",), [("role_name", "id")])
+
+
+def test_advice_skips_indexes_the_schema_has(db):
+    advice = {(a.table, a.columns) for a in advise(db.engine, models())}
+    # user.email is unique already; the (role_name, id) index serves role_name
+    assert ("user", ("role",)) in advice
+    assert ("user", ("email",)) not in advice
+    assert ("rolepriviledge", ("role_name",)) not in advice
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('CREATE INDEX ix_user_role ON "user" (role)')
+    schema_cache.invalidate(db.engine)
+    advice = {(a.table, a.columns) for a in advise(db.engine, models())}
+    assert ("user", ("role",)) not in advice
+
+
+def test_long_names_are_shortened_for_postgres():
+    advice = IndexAdvice("t" * 60, ("a_column", "id"), "default_sort_field")
+    assert len(advice.name) == 63
+    assert advice.name.startswith("ix_adv_ttt")
+
+
+def test_indexes_command_reports_missing_indexes(db):
+    result = runner.invoke(cli.app, ["indexes"])
+    assert result.exit_code == 0, result.output
+    assert "missing user (role) - foreign key to role.name" in result.output
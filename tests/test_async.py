@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+import modules.shared.models as shared_models
+from modules.auth.models import Role
+from modules.shared.db.async_sqlmodel import async_url
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:///app.db", "sqlite+aiosqlite:///app.db"),
+        ("postgresql://u:p@host/app", "postgresql+asyncpg://u:p@host/app"),
+        ("postgresql+psycopg2://u:p@host/app", "postgresql+asyncpg://u:p@host/app"),
+        ("postgresql+asyncpg://u:p@host/app", "postgresql+asyncpg://u:p@host/app"),
+    ],
+)
+def test_async_url_swaps_the_driver(url, expected):
+    assert async_url(url) == expected
+
+
+def test_async_record_methods_round_trip(adb, monkeypatch):
+    monkeypatch.setattr(shared_models, "db", adb)
+
+    async def scenario():
+        role = await Role(name="admin").asave()
+        assert (await Role.aget(role.id)).name == "admin"
+        assert (await Role.aget("admin", "name")).id == role.id
+        await Role.aupdate_record(role.id, {"product_name": "shop"})
+        rows = await Role.aquery(fields=["name", "product_name"], as_dict=True)
+        assert rows == [{"name": "admin", "product_name": "shop"}]
+        assert [r.name for r in await Role.aall()] == ["admin"]
+        await Role.adelete_record(role.id)
+        assert await Role.aget(role.id) is None
+
+    asyncio.run(scenario())
+
+
+def test_sync_and_async_backends_share_the_database(db, adb):
+    db.bulk_insert(Role, [{"name": "admin"}])
+    assert asyncio.run(adb.acount_records(Role)) == 1
+    asyncio.run(adb.abulk_insert(Role, [{"name": "editor"}]))
+    assert db.count_records(Role) == 2
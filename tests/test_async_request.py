@@ -0,0 +1,145 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+import pytest
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from modules.auth.models import Role, User
+from modules.shared.db.async_sqlmodel import AsyncSQLModelDB
+from modules.shared.db.session import DBSessionMiddleware, current_session
+from modules.shared.db.sqlmodel import SQLModelDB
+
+
+def in_request(adb, scenario):
+    "Run `scenario(session)` the way a handler runs inside DBSessionMiddleware"
+
+    async def run():
+        session = adb.new_session()
+        token = current_session.set(session)
+        try:
+            return await scenario(session)
+        finally:
+            current_session.reset(token)
+            await asyncio.to_thread(session.close)
+
+    return asyncio.run(run())
+
+
+def test_async_writes_join_the_request_transaction(adb):
+    id = uuid4()
+
+    async def scenario(session):
+        await adb.abulk_insert(User, [{"id": id, "email": "ada@example.com"}])
+        # Reads after the write see it, on the request's own session
+        assert (await adb.aget_record(User, id)).email == "ada@example.com"
+        assert await adb.acount_records(User) == 1
+        rows = await adb.aquery_records(User, fields=["email"], as_dict=True)
+        assert [row["email"] for row in rows] == ["ada@example.com"]
+        await asyncio.to_thread(session.rollback)
+
+    in_request(adb, scenario)
+    # Rolled back together with the request
+    assert asyncio.run(adb.aget_record(User, id)) is None
+    assert asyncio.run(adb.acount_records(User)) == 0
+
+
+def test_async_reads_stay_native_until_the_request_writes(adb, monkeypatch):
+    joined = []
+    monkeypatch.setattr(
+        AsyncSQLModelDB, "all_records", lambda self, model: joined.append(model) or []
+    )
+
+    async def scenario(session):
+        await adb.aall_records(User)
+        assert joined == []
+        session.add(User(email="grace@example.com"))
+        await adb.aall_records(User)
+        assert joined == [User]
+
+    in_request(adb, scenario)
+
+
+def watch_overlap(monkeypatch, session):
+    "Record how many worker threads are inside the request session at once"
+    seen = {"active": 0, "most": 0}
+    opened = SQLModelDB._session
+
+    @contextmanager
+    def watched(self, write=False):
+        with opened(self, write) as used:
+            if used is not session:
+                yield used
+                return
+            seen["active"] += 1
+            seen["most"] = max(seen["most"], seen["active"])
+            try:
+                time.sleep(0.005)
+                yield used
+            finally:
+                seen["active"] -= 1
+
+    monkeypatch.setattr(SQLModelDB, "_session", watched)
+    return seen
+
+
+async def read_and_write(service):
+    names = [f"role-{n}" for n in range(8)]
+    await asyncio.gather(
+        *(service.abulk_insert(Role, [{"name": name}]) for name in names),
+        *(service.acount_records(Role) for _ in names),
+        *(service.aquery_records(Role, fields=["name"], as_dict=True) for _ in names),
+    )
+    return await service.acount_records(Role)
+
+
+def test_concurrent_calls_take_turns_on_the_request_session(
+    db, request_session, monkeypatch
+):
+    seen = watch_overlap(monkeypatch, request_session)
+    assert asyncio.run(read_and_write(db)) == 8
+    assert seen["most"] == 1
+
+
+def test_concurrent_async_calls_take_turns_once_joined(adb, monkeypatch):
+    async def scenario(session):
+        seen = watch_overlap(monkeypatch, session)
+        assert await read_and_write(adb) == 8
+        assert seen["most"] == 1
+        await asyncio.to_thread(session.rollback)
+
+    in_request(adb, scenario)
+
+
+@pytest.fixture
+def client(db):
+    "An app that writes a role and then answers with the status it is asked for"
+
+    def handler(request):
+        db.bulk_insert(Role, [{"name": request.path_params["name"]}])
+        status = int(request.query_params.get("status", 200))
+        if status >= 400:
+            raise HTTPException(status)
+        return PlainTextResponse("", status_code=status)
+
+    app = Starlette(routes=[Route("/{name}", handler)])
+    app.add_middleware(DBSessionMiddleware, service=db)
+    return TestClient(app, follow_redirects=False)
+
+
+def test_middleware_commits_success_and_redirects(client, db):
+    assert client.get("/ok").status_code == 200
+    assert client.get("/moved?status=303").status_code == 303
+    assert sorted(role.name for role in db.all_records(Role)) == ["moved", "ok"]
+
+
+def test_middleware_rolls_back_client_errors(client, db):
+    assert client.get("/denied?status=403").status_code == 403
+    assert client.get("/broken?status=500").status_code == 500
+    assert db.all_records(Role) == []
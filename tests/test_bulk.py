@@ -0,0 +1,72 @@
+import enum
+from uuid import uuid4
+
+import sqlalchemy as sa
+
+from modules.auth.models import Role
+from modules.shared.db.bulk import _copy_value
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+def role_names(session):
+    query = sa.text("SELECT name FROM role ORDER BY rowid")
+    return session.execute(query).scalars().all()
+
+
+def test_bulk_insert_writes_after_pending_changes(db, request_session):
+    request_session.add(Role(name="pending"))
+    db.bulk_insert(Role, [{"name": "bulk"}])
+    assert role_names(request_session) == ["pending", "bulk"]
+
+
+def test_bulk_insert_fills_defaults_and_returns_ids(db):
+    ids = db.bulk_insert(Role, [{"name": "a"}, {"name": "b"}], returning=True)
+    roles = db.get_records(Role, ids)
+    assert sorted(role.name for role in roles) == ["a", "b"]
+    assert all(role.created_at == roles[0].created_at for role in roles)
+
+
+def test_copy_writes_enum_names():
+    assert _copy_value(Color.RED) == '"RED"'
+    assert _copy_value(None) == ""
+    assert _copy_value('say "hi"') == '"say ""hi"""'
+
+
+def test_bulk_update_sets_only_the_given_columns(db):
+    ids = db.bulk_insert(
+        Role,
+        [{"name": "a", "product_name": "shop"}, {"name": "b", "product_name": "blog"}],
+        returning=True,
+    )
+    before = {role.id: role for role in db.get_records(Role, ids)}
+    rows = [
+        {"id": str(ids[0]), "name": "admin"},
+        {"id": ids[1], "product_name": "wiki"},
+    ]
+    assert db.bulk_update(Role, rows, chunk_size=1) == 2
+    after = {role.id: role for role in db.get_records(Role, ids)}
+    assert (after[ids[0]].name, after[ids[0]].product_name) == ("admin", "shop")
+    assert (after[ids[1]].name, after[ids[1]].product_name) == ("b", "wiki")
+    assert all(after[id].updated_at > before[id].updated_at for id in ids)
+
+
+def test_bulk_update_counts_matched_rows_and_refreshes(db):
+    [id] = db.bulk_insert(Role, [{"name": "a"}], returning=True)
+    rows = [
+        {"id": id, "name": "admin"},
+        {"id": uuid4(), "name": "ghost"},
+        {"name": "no id"},
+    ]
+    assert db.bulk_update(Role, rows) == 1
+    [role] = db.bulk_update(Role, [{"id": id, "name": "owner"}], refresh=True)
+    assert (role.id, role.name) == (id, "owner")
+
+
+def test_bulk_update_invalidates_cached_records(db):
+    [id] = db.bulk_insert(Role, [{"name": "a"}], returning=True)
+    assert db.get_record(Role, id).name == "a"
+    db.bulk_update(Role, [{"id": id, "name": "admin"}])
+    assert db.get_record(Role, id).name == "admin"
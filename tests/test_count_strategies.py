@@ -0,0 +1,61 @@
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db.counts import (
+    CACHED,
+    ESTIMATED,
+    EXACT,
+    count_strategy,
+    humanize_count,
+)
+
+
+@pytest.fixture
+def roles(db):
+    db.bulk_insert(Role, [{"name": f"role{i}"} for i in range(3)])
+
+
+def test_exact_is_the_default(db, roles):
+    assert count_strategy(Role) == EXACT
+    assert db.count_records(Role) == 3
+
+
+def test_unknown_strategy_is_rejected(monkeypatch):
+    monkeypatch.setattr(Role, "count_strategy", "guess")
+    with pytest.raises(ValueError, match="Unknown count_strategy 'guess'"):
+        count_strategy(Role)
+
+
+def test_cached_counts_are_served_until_refresh(db, roles, monkeypatch):
+    monkeypatch.setattr(Role, "count_strategy", CACHED)
+    monkeypatch.setattr(Role, "count_refresh", 60)
+    assert db.count_records(Role) == 3
+    db.bulk_insert(Role, [{"name": "late"}])
+    assert db.count_records(Role) == 3
+    monkeypatch.setattr(Role, "count_refresh", 0)
+    db.counts.clear()
+    assert db.count_records(Role) == 4
+    assert db.count_records(Role) == 4
+
+
+def test_estimates_come_from_planner_statistics(db, roles, monkeypatch):
+    monkeypatch.setattr(Role, "count_strategy", ESTIMATED)
+    # Without statistics the table is counted
+    page = db.query_records(Role, limit=1, with_total=True)
+    assert (page.total, page.approximate) == (3, False)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    db.bulk_insert(Role, [{"name": "late"}])
+    page = db.query_records(Role, limit=1, with_total=True)
+    assert (page.total, page.approximate) == (3, True)
+    # Filtered totals are always exact
+    page = db.query_records(Role, search_value="late", limit=1, with_total=True)
+    assert (page.total, page.approximate) == (1, False)
+
+
+@pytest.mark.parametrize(
+    "count, text",
+    [(999, "999"), (1000, "1K"), (4213337, "4.2M"), (2 * 10**9, "2B")],
+)
+def test_humanize_count(count, text):
+    assert humanize_count(count) == text
@@ -0,0 +1,85 @@
+import logging
+
+import pytest
+import sqlalchemy as sa
+from typer.testing import CliRunner
+
+import cli
+from modules.auth.models import User
+from modules.shared.db import counts
+from modules.shared.db.counts import COUNTS_TABLE, MAINTAINED, RowCounter
+
+runner = CliRunner()
+
+
+def test_install_command_creates_row_counter(db, monkeypatch, caplog):
+    monkeypatch.setattr(User, "count_strategy", MAINTAINED)
+    db.bulk_insert(User, [{"email": f"user{i}@example.com"} for i in range(3)])
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.counts"):
+        assert not db.counters.available(User)
+    assert "Row counter for user is not installed" in caplog.text
+    result = runner.invoke(cli.app, ["install"])
+    assert result.exit_code == 0, result.output
+    db.counters._installed.clear()
+    assert db.counters.available(User)
+    db.bulk_insert(User, [{"email": "user3@example.com"}])
+    with db.engine.connect() as conn:
+        assert conn.execute(db.counters.query(User)).scalar() == 4
+    assert db.count_records(User) == 4
+
+
+def test_missing_counter_is_looked_for_again(db, monkeypatch):
+    monkeypatch.setattr(User, "count_strategy", MAINTAINED)
+    monkeypatch.setattr(counts, "PROBE_INTERVAL", 0)
+    assert not db.counters.available(User)
+    # Installed by another process: found without a restart
+    RowCounter(db.engine).install(User)
+    assert db.counters.available(User)
+
+
+@pytest.fixture
+def counted(db, monkeypatch):
+    "Users with an installed row counter"
+    monkeypatch.setattr(User, "count_strategy", MAINTAINED)
+    db.bulk_insert(User, [{"email": f"user{i}@example.com"} for i in range(3)])
+    db.install_runtime_objects()
+    return db
+
+
+def set_counter(db, count):
+    "Skew the counter the way a restore with triggers disabled would"
+    with db.engine.begin() as conn:
+        conn.execute(
+            sa.text(f"UPDATE {COUNTS_TABLE} SET row_count = :count"), {"count": count}
+        )
+
+
+def test_reconcile_corrects_drift(counted):
+    set_counter(counted, 7)
+    assert counted.reconcile_counts() == {"user": 4}
+    assert counted.count_records(User) == 3
+    assert counted.reconcile_counts() == {"user": 0}
+
+
+def test_reconcile_keeps_writes_made_after_the_recount(counted, monkeypatch):
+    set_counter(counted, 5)
+    begin = counted.engine.begin
+
+    def write_first():
+        # Another request commits between the snapshot and the correction
+        monkeypatch.setattr(counted.engine, "begin", begin)
+        counted.bulk_insert(User, [{"email": "late@example.com"}])
+        return begin()
+
+    monkeypatch.setattr(counted.engine, "begin", write_first)
+    assert counted.reconcile_counts() == {"user": 2}
+    with counted.engine.connect() as conn:
+        assert conn.execute(counted.counters.query(User)).scalar() == 4
+
+
+def test_reconcile_counts_command(counted):
+    set_counter(counted, 1)
+    result = runner.invoke(cli.app, ["reconcile-counts"])
+    assert result.exit_code == 0, result.output
+    assert "user counter was off by -2, corrected" in result.output
+    assert counted.count_records(User) == 3
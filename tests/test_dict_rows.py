@@ -0,0 +1,16 @@
+from modules.auth.models import Role
+
+
+def test_dict_rows_skip_orm_loading(db, request_session):
+    db.bulk_insert(Role, [{"name": "admin", "product_name": "shop"}])
+    rows = db.query_records(Role, fields=["name", "product_name"], as_dict=True)
+    assert rows == [{"name": "admin", "product_name": "shop"}]
+    assert type(rows[0]) is dict
+    assert len(request_session.identity_map) == 0
+
+
+def test_dict_rows_see_pending_changes(db, request_session):
+    request_session.add(Role(name="pending"))
+    rows = db.query_records(Role, fields=["name"], as_dict=True)
+    assert rows == [{"name": "pending"}]
+
@@ -0,0 +1,55 @@
+import contextvars
+from uuid import uuid4
+
+import pytest
+
+from modules.auth.models import Role, User
+
+
+@pytest.fixture
+def role_id(db):
+    id = uuid4()
+    db.bulk_insert(Role, [{"id": id, "name": "admin", "description": "All"}])
+    # Cached by a read outside any request
+    assert db.get_record(Role, id).description == "All"
+    return id
+
+
+def test_hits_are_served_from_the_cache(db, role_id):
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE role SET description = 'Changed behind'")
+    assert db.get_record(Role, role_id).description == "All"
+    assert db.get_record(Role, "admin", alt_key="name").description == "All"
+
+
+def test_writes_through_the_service_invalidate(db, role_id):
+    db.update_record(Role, role_id, {"description": "Some"})
+    assert db.get_record(Role, role_id).description == "Some"
+    db.delete_record(Role, role_id)
+    assert db.get_record(Role, role_id) is None
+
+
+def test_users_are_never_cached(db):
+    # Credentials and admin flags must be read fresh on every sign-in
+    id = uuid4()
+    db.bulk_insert(User, [{"id": id, "email": "ada@example.com"}])
+    db.get_record(User, id)
+    assert db.cache.get(User, id) is None
+
+
+def test_cache_hit_keeps_unflushed_edits(db, role_id, request_session):
+    record = db.get_record(Role, role_id)
+    record.description = "Edited"
+    again = db.get_record(Role, role_id)
+    assert again is record
+    assert again.description == "Edited"
+    assert db.get_record(Role, "admin", alt_key="name") is record
+
+
+def test_request_that_wrote_skips_the_cache(db, role_id, request_session):
+    db.update_record(Role, role_id, {"description": "Flushed"})
+    # Another request re-caches the committed row before this one commits
+    contextvars.Context().run(db.get_record, Role, role_id)
+    request_session.expunge_all()
+    assert db.get_record(Role, role_id).description == "Flushed"
+    assert db.get_record(Role, "admin", alt_key="name").description == "Flushed"
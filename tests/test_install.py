@@ -0,0 +1,51 @@
+import logging
+import subprocess
+
+from typer.testing import CliRunner
+
+import cli
+from modules.auth.models import User
+
+runner = CliRunner()
+
+
+def test_missing_search_index_is_reported(db, caplog):
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.search"):
+        assert not db.search.available(User)
+    assert "fh install" in caplog.text
+
+
+def test_install_command_creates_search_index(db):
+    result = runner.invoke(cli.app, ["install"])
+    assert result.exit_code == 0, result.output
+    db.search._installed.clear()
+    assert db.search.available(User)
+    db.bulk_insert(User, [{"email": "ada@example.com", "full_name": "Ada Lovelace"}])
+    page = db.query_records(User, search_value="lovel", fields=["email"], as_dict=True)
+    assert [row["email"] for row in page] == ["ada@example.com"]
+
+
+def test_migrate_installs_after_upgrade(db, monkeypatch):
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: None)
+    result = runner.invoke(cli.app, ["migrate"])
+    assert result.exit_code == 0, result.output
+    db.search._installed.clear()
+    assert db.search.available(User)
+
+
+def test_install_command_creates_trigram_tables(db, caplog):
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.search"):
+        assert not db.ngrams.available(User)
+    assert "NgramSearch index for user is not installed" in caplog.text
+    db.ngrams._installed.clear()
+    result = runner.invoke(cli.app, ["install"])
+    assert result.exit_code == 0, result.output
+    db.ngrams._installed.clear()
+    assert db.ngrams.available(User)
+    db.bulk_insert(User, [{"email": "grace.hopper@example.com"}])
+    assert db.ngrams.prefilter(User, "hopper@ex")
+    page = db.query_records(
+        User, search_value="hopper@ex", substring=True, fields=["email"], as_dict=True
+    )
+    assert [row["email"] for row in page] == ["grace.hopper@example.com"]
+
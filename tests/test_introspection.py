@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import event
+
+from modules.auth.models import Role, User
+from modules.shared.db.introspection import describe, schema_cache
+
+
+@pytest.fixture
+def statements(db):
+    "Statements run while the test runs"
+    seen = []
+    listener = lambda *args: seen.append(args[2])  # noqa: E731
+    event.listen(db.engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db.engine, "before_cursor_execute", listener)
+
+
+def test_model_metadata_is_derived_once():
+    descriptor = describe(User)
+    assert describe(User) is descriptor
+    assert descriptor.foreign_keys == {"role": ("role", "name")}
+    assert "email" in descriptor.string_fields
+    assert "id" in descriptor.keyset_fields and "full_name" not in descriptor.keyset_fields
+    assert descriptor.input_types["role"] == "select"
+    assert descriptor.sortable_fields == frozenset(User.__table__.columns.keys())
+
+
+def test_reflection_is_reused_until_the_schema_changes(db, statements):
+    schema_cache.invalidate(db.engine)
+    tables = schema_cache.tables(db.engine)
+    reflected = len(statements)
+    assert {"user", "role"} <= set(tables)
+    statements.clear()
+    assert schema_cache.tables(db.engine) is tables
+    # Only the migration version is looked at
+    assert len(statements) < reflected
+    assert len(statements) <= 2
+
+
+def test_a_new_migration_version_reflects_again(db):
+    tables = schema_cache.tables(db.engine)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE alembic_version (version_num VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO alembic_version VALUES ('abc123')")
+    fresh = schema_cache.tables(db.engine)
+    assert fresh is not tables
+    assert "alembic_version" in fresh
+
+
+def test_schema_lists_the_primary_key(db):
+    schema = db.schema()
+    assert "Table: role\n" in schema
+    assert "  * id: " in schema
+    assert describe(Role).columns[0] in schema
@@ -0,0 +1,74 @@
+import pytest
+from starlette.datastructures import QueryParams
+
+from modules.auth.models import User
+from modules.shared.db.introspection import _describe_mapped
+from modules.shared.db.pagination import InvalidCursor, encode_cursor
+
+
+class Request:
+    def __init__(self, **params):
+        self.query_params = QueryParams(params)
+
+
+@pytest.fixture
+def users(db):
+    db.bulk_insert(User, [{"email": f"user{i}@example.com"} for i in range(15)])
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        "!!!",
+        "W10",
+        "WyJuIiw1XQ",
+        encode_cursor("n", ["a", "b", "c"]),
+        encode_cursor("n", [5]),
+        encode_cursor("n", ["not-a-uuid"]),
+        encode_cursor("n", [None]),
+    ],
+)
+def test_malformed_cursor_is_rejected(db, cursor):
+    with pytest.raises(InvalidCursor):
+        db.query_records(User, limit=10, keyset=True, cursor=cursor)
+
+
+def test_cursor_values_are_cast_to_their_columns(db, users):
+    first = db.query_records(User, limit=5, keyset=True, fields=["id"])
+    ids = [row[0] for row in first.records]
+    cursor = encode_cursor("n", [str(ids[0])])
+    page = db.query_records(User, limit=4, keyset=True, fields=["id"], cursor=cursor)
+    assert [row[0] for row in page.records] == ids[1:]
+
+
+def test_keyset_dicts_hold_only_the_requested_fields(db, users):
+    page = db.query_records(
+        User,
+        sorting_field="email",
+        limit=5,
+        keyset=True,
+        fields=["email"],
+        as_dict=True,
+    )
+    assert page.records[0] == {"email": "user0@example.com"}
+    assert page.next_cursor is not None
+
+
+def test_table_page_with_garbage_cursor_starts_over(db, users):
+    first = User.table_view_page(Request(per_page="10"))
+    page = User.table_view_page(Request(per_page="10", cursor="garbage"))
+    assert page.records == first.records
+    assert page.next_cursor == first.next_cursor
+    assert page.prev_cursor is None
+
+
+def test_keyset_refuses_nullable_sort_field(db):
+    with pytest.raises(ValueError, match="nullable field 'full_name'"):
+        db.query_records(User, sorting_field="full_name", limit=10, keyset=True)
+
+
+def test_keyset_model_needs_not_null_sort_field(monkeypatch):
+    monkeypatch.setattr(User, "default_sort_field", "full_name")
+    with pytest.raises(ValueError, match="'full_name' is nullable"):
+        _describe_mapped(User.__mapper__, User)
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+from sqlalchemy import exc
+
+from modules.shared.db.pool import (
+    POOL_TIMEOUTS,
+    create_db_engine,
+    engine_options,
+    pool_stats,
+)
+from modules.shared.metrics import MetricsRegistry, registry
+
+
+def test_file_databases_get_a_configured_queue_pool(monkeypatch):
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "7")
+    options = engine_options("sqlite:////tmp/app.db")
+    assert options["pool_size"] == 7
+    assert {"max_overflow", "pool_timeout", "pool_recycle"} <= set(options)
+
+
+def test_in_memory_sqlite_keeps_its_single_connection():
+    assert "pool_size" not in engine_options("sqlite://")
+
+
+@pytest.fixture
+def engine():
+    engine = create_db_engine(
+        os.environ["DATABASE_URL"],
+        label="test-pool",
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_pool_stats_follow_checkouts(engine):
+    assert pool_stats(engine)["checked_out"] == 0
+    with engine.connect():
+        stats = pool_stats(engine)
+        assert stats["pool"] == "test-pool"
+        assert (stats["size"], stats["checked_out"]) == (1, 1)
+        assert 'db_pool_checked_out{pool="test-pool"} 1' in registry.render()
+    assert pool_stats(engine)["wait"]["count"] >= 1
+
+
+def test_checkout_timeouts_are_counted(engine):
+    before = POOL_TIMEOUTS.value(pool="test-pool")
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    assert POOL_TIMEOUTS.value(pool="test-pool") == before + 1
+    assert pool_stats(engine)["timeouts"] == before + 1
+
+
+def test_registry_renders_prometheus_text():
+    metrics = MetricsRegistry()
+    hits = metrics.counter("hits_total", "Hits", labelnames=("page",))
+    hits.inc(page="home")
+    hits.inc(2, page="home")
+    latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.5)
+    text = metrics.render()
+    assert "# TYPE hits_total counter" in text
+    assert 'hits_total{page="home"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert "latency_seconds_count 1" in text
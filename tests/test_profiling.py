@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from modules.shared.db import profiling
+from modules.shared.db.profiling import QueryStats, QueryStatsMiddleware, current_stats
+
+
+def run(db, statement, times=1):
+    with db.engine.connect() as conn:
+        for _ in range(times):
+            conn.exec_driver_sql(statement)
+
+
+@pytest.fixture
+def stats():
+    "Statements counted as if run by a request to /users/{id}"
+    stats = QueryStats({"method": "GET", "path": "/users/7"})
+    token = current_stats.set(stats)
+    yield stats
+    current_stats.reset(token)
+
+
+def test_request_statements_are_counted_per_shape(db, stats):
+    run(db, "SELECT 1", times=2)
+    run(db, "SELECT 2")
+    assert stats.count == 3
+    assert stats.shapes == {"SELECT 1": 2, "SELECT 2": 1}
+    assert stats.seconds > 0
+
+
+def test_repeated_shapes_are_flagged_once(db, stats, monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "N_PLUS_ONE_THRESHOLD", 2)
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.profiling"):
+        run(db, "SELECT 1", times=5)
+    assert caplog.text.count("Possible N+1 in GET /users/7") == 1
+
+
+def test_slow_statements_are_logged_with_their_params(db, monkeypatch, caplog):
+    monkeypatch.setattr(profiling, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.profiling"):
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("SELECT ?", ("needle",))
+    assert "Slow query" in caplog.text
+    assert "outside a request" in caplog.text
+    assert "needle" in caplog.text
+
+
+def test_middleware_reports_the_request_totals(db, monkeypatch):
+    monkeypatch.setattr(profiling, "QUERY_HEADERS", True)
+
+    def handler(request):
+        run(db, "SELECT 1", times=3)
+        return PlainTextResponse("")
+
+    app = Starlette(routes=[Route("/items/{id}", handler)])
+    app.add_middleware(QueryStatsMiddleware)
+    response = TestClient(app).get("/items/1")
+    assert response.headers["x-db-queries"] == "3"
+    assert 'desc="3 queries"' in response.headers["server-timing"]
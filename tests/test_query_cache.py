@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db.async_sqlmodel import AsyncSQLModelDB
+from modules.shared.db.sqlmodel import SQLModelDB
+
+
+def role_names(service):
+    rows = service.query_records(Role, fields=["name"], as_dict=True)
+    return sorted(row["name"] for row in rows)
+
+
+@pytest.fixture
+def worker(db, monkeypatch):
+    "A second service over the same database, standing in for another process"
+    service = SQLModelDB(os.environ["DATABASE_URL"])
+    monkeypatch.setattr(service.query_cache, "sync", 0)
+    yield service
+    asyncio.run(service.aclose())
+
+
+def test_results_are_served_until_a_write(db, monkeypatch):
+    assert role_names(db) == []
+    db.bulk_insert(Role, [{"name": "admin"}])
+    assert role_names(db) == ["admin"]
+    calls = []
+    monkeypatch.setattr(db, "_run_query", lambda *args, **kwargs: calls.append(1))
+    assert role_names(db) == ["admin"]
+    assert calls == []
+
+
+def test_other_processes_see_bulk_writes(db, worker):
+    db.install_runtime_objects()
+    assert role_names(worker) == []
+    db.bulk_insert(Role, [{"name": "admin"}])
+    assert role_names(worker) == ["admin"]
+
+
+def test_other_processes_see_orm_commits(db, worker, request_session):
+    db.install_runtime_objects()
+    assert role_names(worker) == []
+    # Flushed by the commit itself, after the commit hooks ran
+    request_session.add(Role(name="admin"))
+    request_session.commit()
+    assert role_names(worker) == ["admin"]
+
+
+def test_rolled_back_writes_publish_nothing(db, worker, request_session):
+    db.install_runtime_objects()
+    db.bulk_insert(Role, [{"name": "admin"}])
+    request_session.rollback()
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT * FROM table_versions").all() == []
+
+
+def test_without_the_versions_table_other_writes_wait_for_the_ttl(
+    db, worker, caplog
+):
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.cache"):
+        assert role_names(worker) == []
+        db.bulk_insert(Role, [{"name": "admin"}])
+        assert role_names(worker) == []
+    # Once per process
+    assert caplog.text.count("table_versions is not installed") == 2
+
+
+def test_async_writes_publish_too(db, worker):
+    db.install_runtime_objects()
+    assert role_names(worker) == []
+    service = AsyncSQLModelDB(os.environ["DATABASE_URL"])
+
+    async def write():
+        try:
+            await service.abulk_insert(Role, [{"name": "admin"}])
+        finally:
+            await service.aclose()
+
+    asyncio.run(write())
+    assert role_names(worker) == ["admin"]
@@ -0,0 +1,24 @@
+from sqlalchemy import event
+
+from modules.auth.models import Role, RolePriviledge, User
+
+
+def test_keys_to_the_display_field_are_not_resolved(db):
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    rows = [{"email": "ada@example.com", "role": "admin"}]
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        assert User.resolve_related(rows, ["email", "role"]) == {}
+        pairs = [{"role_name": "admin", "priviledge_name": "read"}]
+        assert RolePriviledge.resolve_related(pairs, list(pairs[0])) == {}
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert statements == []
+
+
+def test_keys_to_other_columns_are_resolved(db, monkeypatch):
+    db.bulk_insert(Role, [{"name": "admin"}])
+    monkeypatch.setattr(Role, "display_field", None)
+    related = User.resolve_related([{"role": "admin"}], ["role"])
+    assert str(related["role"]["admin"]) == "admin"
@@ -0,0 +1,39 @@
+from uuid import uuid4
+
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db import cache
+
+
+@pytest.fixture
+def replica(db, monkeypatch):
+    "Reads go to a replica, played by the primary's own engine"
+    monkeypatch.setattr(db, "replicas", [db.engine])
+    return db
+
+
+def test_replica_reads_fill_only_after_the_lag_window(replica, monkeypatch):
+    id = uuid4()
+    replica.bulk_insert(Role, [{"id": id, "name": "admin"}])
+    replica.update_record(Role, id, {"description": "Everything"})
+    assert replica.get_record(Role, id) is not None
+    assert replica.cache.get(Role, id) is None
+    replica.query_records(Role, fields=["name"], as_dict=True)
+    assert len(replica.query_cache._entries) == 0
+
+    monkeypatch.setattr(cache, "REPLICA_LAG", 0)
+    replica.get_record(Role, id)
+    assert replica.cache.get(Role, id).description == "Everything"
+    replica.query_records(Role, fields=["name"], as_dict=True)
+    assert len(replica.query_cache._entries) == 1
+
+
+def test_primary_reads_fill_right_after_a_write(db):
+    id = uuid4()
+    db.bulk_insert(Role, [{"id": id, "name": "admin"}])
+    db.update_record(Role, id, {"description": "Everything"})
+    db.get_record(Role, id)
+    assert db.cache.get(Role, id) is not None
+    db.query_records(Role, fields=["name"], as_dict=True)
+    assert len(db.query_cache._entries) == 1
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import event
+
+from modules.auth.models import Role
+
+
+@pytest.fixture
+def writes(db):
+    "INSERT/UPDATE statements run while the test runs"
+    seen = []
+
+    def listener(conn, cursor, statement, *args):
+        if statement.startswith(("INSERT", "UPDATE")):
+            seen.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db.engine, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def role(db):
+    [id] = db.bulk_insert(
+        Role, [{"name": "admin", "product_name": "shop"}], returning=True
+    )
+    return db.get_record(Role, id)
+
+
+def test_save_updates_only_the_changed_columns(db, role, writes):
+    role.product_name = "blog"
+    db.save_record(role)
+    [statement] = writes
+    assignments = statement.split(" SET ")[1].split(" WHERE ")[0].split(",")
+    assert {a.split("=")[0].strip() for a in assignments} == {
+        "product_name",
+        "updated_at",
+    }
+    stored = db.get_record(Role, role.id)
+    assert (stored.name, stored.product_name) == ("admin", "blog")
+
+
+def test_unchanged_records_are_not_written(db, role, writes):
+    role.product_name = "shop"
+    assert db.save_record(role) is role
+    assert writes == []
+
+
+def test_saved_values_become_the_loaded_state(db, role, writes):
+    role.product_name = "blog"
+    db.save_record(role)
+    db.save_record(role)
+    assert len(writes) == 1
+
+
+def test_new_records_are_inserted(db, writes):
+    role = db.save_record(Role(name="editor"))
+    assert db.get_record(Role, role.id).name == "editor"
+    assert writes[0].startswith("INSERT")
+
+
+def test_a_row_deleted_meanwhile_is_inserted_again(db, role):
+    db.delete_record(Role, role.id)
+    role.product_name = "blog"
+    db.save_record(role)
+    stored = db.get_record(Role, role.id)
+    assert (stored.name, stored.product_name) == ("admin", "blog")
+
+
+def test_save_in_a_request_is_written_once(db, request_session, writes):
+    [id] = db.bulk_insert(Role, [{"name": "admin"}], returning=True)
+    writes.clear()
+    role = db.get_record(Role, id)
+    role.product_name = "blog"
+    db.save_record(role)
+    request_session.commit()
+    assert len(writes) == 1
+    assert db.get_record(Role, id).product_name == "blog"
@@ -0,0 +1,61 @@
+import logging
+
+import sqlalchemy as sa
+
+from modules.auth.models import User
+from modules.shared.db import search
+from modules.shared.db.search import SEARCH_ROWID, FullTextSearch
+
+
+def search_emails(db, value, substring=False):
+    page = db.query_records(
+        User, search_value=value, substring=substring, fields=["email"], as_dict=True
+    )
+    return sorted(row["email"] for row in page)
+
+
+def test_rows_written_before_the_install_are_keyed(db):
+    db.bulk_insert(User, [{"email": "ada@example.com", "full_name": "Ada Lovelace"}])
+    db.install_runtime_objects()
+    db.bulk_insert(User, [{"email": "grace@example.com", "full_name": "Grace Hopper"}])
+    with db.engine.connect() as conn:
+        keys = conn.exec_driver_sql(f"SELECT {SEARCH_ROWID} FROM user").scalars().all()
+    assert sorted(keys) == [1, 2]
+    assert search_emails(db, "lovel") == ["ada@example.com"]
+    assert search_emails(db, "hopper") == ["grace@example.com"]
+
+
+def test_index_survives_renumbered_rowids(db):
+    db.install_runtime_objects()
+    db.bulk_insert(User, [{"email": "ada@example.com", "full_name": "Ada Lovelace"}])
+    with db.engine.begin() as conn:
+        # VACUUM renumbers rows without running any trigger
+        triggers = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'user'"
+        ).scalars()
+        for name in list(triggers):
+            conn.exec_driver_sql(f'DROP TRIGGER "{name}"')
+        conn.exec_driver_sql("UPDATE user SET rowid = rowid + 1000")
+    assert search_emails(db, "lovel") == ["ada@example.com"]
+    assert search_emails(db, "ada@ex", substring=True) == ["ada@example.com"]
+
+
+def test_updates_reindex_only_searched_fields(db):
+    db.install_runtime_objects()
+    db.bulk_insert(User, [{"email": "ada@example.com", "full_name": "Ada Lovelace"}])
+    with db.engine.begin() as conn:
+        conn.execute(sa.update(User).values(full_name="Ada King"))
+    assert search_emails(db, "lovel") == []
+    assert search_emails(db, "king") == ["ada@example.com"]
+
+
+def test_missing_index_is_looked_for_again(db, monkeypatch, caplog):
+    monkeypatch.setattr(search, "PROBE_INTERVAL", 0)
+    with caplog.at_level(logging.WARNING, logger="modules.shared.db.search"):
+        assert not db.search.available(User)
+        assert not db.search.available(User)
+    assert caplog.text.count("FullTextSearch index for user is not installed") == 1
+    # Installed by another process: found without a restart
+    FullTextSearch(db.engine).install(User)
+    assert db.search.available(User)
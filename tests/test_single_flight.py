@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db.async_sqlmodel import AsyncSQLModelDB
+from modules.shared.db.sqlmodel import SQLModelDB
+
+CALLERS = 6
+
+
+def slowed(monkeypatch, cls, name, calls):
+    "Make `cls.name` slow enough for every caller to arrive while it runs"
+    original = getattr(cls, name)
+    if asyncio.iscoroutinefunction(original):
+
+        async def wrapper(*args, **kwargs):
+            calls.append(name)
+            await asyncio.sleep(0.2)
+            return await original(*args, **kwargs)
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            time.sleep(0.2)
+            return original(*args, **kwargs)
+
+    monkeypatch.setattr(cls, name, wrapper)
+
+
+def in_threads(fn):
+    start = threading.Barrier(CALLERS)
+
+    def call(_):
+        start.wait()
+        return fn()
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        return list(pool.map(call, range(CALLERS)))
+
+
+@pytest.fixture
+def roles(db):
+    db.bulk_insert(Role, [{"name": "admin"}, {"name": "editor"}])
+
+
+def test_concurrent_counts_share_one_query(db, roles, monkeypatch):
+    calls = []
+    slowed(monkeypatch, SQLModelDB, "_table_count", calls)
+    assert in_threads(lambda: db.count_records(Role)) == [2] * CALLERS
+    assert calls == ["_table_count"]
+
+
+def test_concurrent_queries_share_one_query(db, roles, monkeypatch):
+    calls = []
+    slowed(monkeypatch, SQLModelDB, "_run_query", calls)
+    results = in_threads(
+        lambda: db.query_records(Role, fields=["name"], as_dict=True)
+    )
+    assert calls == ["_run_query"]
+    assert all(result == results[0] for result in results)
+    # Every caller gets its own copy
+    results[0].append({"name": "intruder"})
+    assert len(results[1]) == 2
+
+
+def test_different_queries_run_separately(db, roles, monkeypatch):
+    calls = []
+    slowed(monkeypatch, SQLModelDB, "_run_query", calls)
+    in_threads(lambda: db.query_records(Role, fields=["name"], as_dict=True))
+    db.query_records(Role, fields=["name"], as_dict=True, limit=1)
+    assert calls == ["_run_query", "_run_query"]
+
+
+def test_a_write_is_not_answered_by_an_earlier_read(db, roles, monkeypatch):
+    calls = []
+    slowed(monkeypatch, SQLModelDB, "_table_count", calls)
+    assert db.count_records(Role) == 2
+    db.bulk_insert(Role, [{"name": "viewer"}])
+    assert db.count_records(Role) == 3
+    assert len(calls) == 2
+
+
+def test_concurrent_async_reads_share_one_query(adb, roles, monkeypatch):
+    calls = []
+    slowed(monkeypatch, AsyncSQLModelDB, "_atable_count", calls)
+    slowed(monkeypatch, AsyncSQLModelDB, "_arun_query", calls)
+
+    async def main():
+        counts = await asyncio.gather(
+            *(adb.acount_records(Role) for _ in range(CALLERS))
+        )
+        pages = await asyncio.gather(
+            *(
+                adb.aquery_records(Role, fields=["name"], as_dict=True)
+                for _ in range(CALLERS)
+            )
+        )
+        return counts, pages
+
+    counts, pages = asyncio.run(main())
+    assert counts == [2] * CALLERS
+    assert all(len(page) == 2 for page in pages)
+    assert calls == ["_atable_count", "_arun_query"]
@@ -0,0 +1,31 @@
+from modules.auth.models import Role
+from modules.shared.db.statements import StatementCache
+
+
+def test_calls_differing_only_in_values_share_a_statement(db):
+    db.bulk_insert(Role, [{"name": "admin"}, {"name": "editor"}, {"name": "O'Brien"}])
+    first = db.query_records(Role, search_value="adm", limit=5, offset=0)
+    assert len(db.statements._entries) == 1
+    second = db.query_records(Role, search_value="O'Bri", limit=1, offset=0)
+    assert len(db.statements._entries) == 1
+    assert [role.name for role in first] == ["admin"]
+    assert [role.name for role in second] == ["O'Brien"]
+    [statement] = db.statements._entries.values()
+    assert "Bri" not in str(statement)
+
+
+def test_each_shape_gets_its_own_statement(db):
+    db.query_records(Role, limit=5)
+    db.query_records(Role, limit=5, offset=5)
+    db.query_records(Role, limit=5, sorting_field="name")
+    db.query_records(Role, limit=5, fields=["name"])
+    assert len(db.statements._entries) == 4
+
+
+def test_least_recently_used_shapes_are_evicted():
+    cache = StatementCache(maxsize=2)
+    cache.get("a", lambda: "A")
+    cache.get("b", lambda: "B")
+    assert cache.get("a", lambda: "rebuilt") == "A"
+    cache.get("c", lambda: "C")
+    assert list(cache._entries) == ["a", "c"]
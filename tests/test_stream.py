@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db.pool import pool_stats
+
+
+@pytest.fixture
+def roles(db):
+    db.bulk_insert(Role, [{"name": f"role{i:02}"} for i in range(25)])
+
+
+def test_stream_yields_every_match_in_order(db, roles):
+    records = db.stream_records(Role, sorting_field="name", batch_size=10)
+    assert [role.name for role in records] == [f"role{i:02}" for i in range(25)]
+
+
+def test_stream_dicts_of_selected_fields(db, roles):
+    records = db.stream_records(
+        Role, search_value="role1", fields=["name"], as_dict=True, batch_size=3
+    )
+    assert sorted(row["name"] for row in records) == [f"role{i}" for i in range(10, 20)]
+
+
+def test_closing_the_stream_releases_its_connection(db, roles):
+    records = db.stream_records(Role, batch_size=5)
+    next(records)
+    assert pool_stats(db.engine)["checked_out"] == 1
+    records.close()
+    assert pool_stats(db.engine)["checked_out"] == 0
+
+
+def test_async_stream(adb, roles):
+    async def names():
+        records = adb.astream_records(
+            Role, sorting_field="name", sort_direction="desc", batch_size=10
+        )
+        return [role.name async for role in records]
+
+    assert asyncio.run(names()) == [f"role{i:02}" for i in reversed(range(25))]
@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import event
+
+from modules.auth.models import User
+
+
+@pytest.fixture
+def users(db):
+    db.bulk_insert(User, [{"email": f"user{i:02}@example.com"} for i in range(15)])
+
+
+@pytest.fixture
+def statements(db):
+    "SELECTs of the user table run while the test runs"
+    seen = []
+
+    def listener(conn, cursor, statement, *args):
+        if statement.startswith("SELECT") and "FROM user" in statement:
+            seen.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", listener)
+    yield seen
+    event.remove(db.engine, "before_cursor_execute", listener)
+
+
+def test_page_and_total_come_from_one_query(db, users, statements):
+    page = db.query_records(
+        User, sorting_field="email", limit=5, offset=5, with_total=True
+    )
+    assert [user.email for user in page.records] == [
+        f"user{i:02}@example.com" for i in range(5, 10)
+    ]
+    assert (page.total, page.approximate) == (15, False)
+    assert len(statements) == 1
+
+
+def test_total_counts_the_filtered_rows(db, users, statements):
+    page = db.query_records(
+        User,
+        search_value="user1",
+        sorting_field="email",
+        fields=["email"],
+        as_dict=True,
+        limit=2,
+        with_total=True,
+    )
+    assert page.total == 5
+    assert [row["email"] for row in page.records] == [
+        "user10@example.com",
+        "user11@example.com",
+    ]
+    assert len(statements) == 1
+
+
+def test_page_past_the_end_still_has_the_total(db, users):
+    page = db.query_records(User, fields=["email"], limit=5, offset=50, with_total=True)
+    assert (page.records, page.total) == ([], 15)
+
+
+def test_empty_table_totals_zero(db, statements):
+    page = db.query_records(User, limit=5, with_total=True)
+    assert (page.records, page.total) == ([], 0)
+    assert len(statements) == 1
@@ -0,0 +1,41 @@
+from modules.auth.models import Role
+
+
+def test_upsert_on_the_primary_key_returns_the_stored_row(db):
+    role = db.upsert_record(Role, {"name": "admin", "product_name": "shop"})
+    updated = db.upsert_record(Role, {"id": str(role.id), "product_name": "blog"})
+    assert updated.id == role.id
+    assert (updated.name, updated.product_name) == ("admin", "blog")
+    assert updated.created_at == role.created_at
+    assert updated.updated_at > role.updated_at
+    assert db.count_records(Role) == 1
+
+
+def test_upsert_on_a_unique_column_returns_the_stored_row(db):
+    role = db.upsert_record(Role, {"name": "admin", "product_name": "shop"})
+    updated = db.upsert_record(Role, {"name": "admin", "product_name": "blog"}, "name")
+    # The existing id, not the one generated for the rejected insert
+    assert (updated.id, updated.product_name) == (role.id, "blog")
+    assert db.get_record(Role, role.id).product_name == "blog"
+
+
+def test_upsert_ignores_caller_timestamps(db):
+    role = db.upsert_record(Role, {"name": "admin", "created_at": None})
+    assert role.created_at is not None
+
+
+def test_upsert_inside_a_request_is_part_of_it(db, request_session):
+    role = db.upsert_record(Role, {"name": "admin"})
+    assert role in request_session
+    request_session.rollback()
+    assert db.count_records(Role) == 0
+
+
+def test_upsert_many_only_overwrites_the_columns_given(db):
+    db.bulk_insert(Role, [{"name": "admin", "product_name": "shop"}])
+    rows = [{"name": "admin", "description": "Everything"}, {"name": "editor"}]
+    assert db.upsert_many(Role, rows, conflict_target="name") == 2
+    roles = {role.name: role for role in db.all_records(Role)}
+    admin = roles["admin"]
+    assert (admin.product_name, admin.description) == ("shop", "Everything")
+    assert set(roles) == {"admin", "editor"}
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from modules.auth.models import Role
+from modules.shared.db.writebehind import INSERT, WriteBehindQueue
+
+
+@pytest.fixture
+def queue(db):
+    return WriteBehindQueue(db, retries=1)
+
+
+def failing(*args, **kwargs):
+    raise RuntimeError("database unavailable")
+
+
+def test_writes_to_one_row_coalesce(db, queue):
+    id = queue.insert(Role, {"name": "admin"})
+    queue.update(Role, id, {"product_name": "shop"})
+    assert len(queue) == 1
+    assert queue.flush() == 1
+    role = db.get_record(Role, id)
+    assert (role.name, role.product_name) == ("admin", "shop")
+
+
+def test_flush_commits_apart_from_the_request(db, queue, request_session):
+    id = queue.insert(Role, {"name": "admin"})
+    queue.flush()
+    request_session.rollback()
+    assert db.get_record(Role, id) is not None
+
+
+def test_full_queue_flushes_off_the_callers_thread(db, monkeypatch):
+    queue = WriteBehindQueue(db, max_items=2)
+    threads = []
+    bulk_insert = db.bulk_insert
+
+    def recording(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return bulk_insert(*args, **kwargs)
+
+    monkeypatch.setattr(db, "bulk_insert", recording)
+    queue.insert(Role, {"name": "admin"})
+    queue.insert(Role, {"name": "editor"})
+    queue._flusher.join()
+    assert threads and threading.current_thread() not in threads
+    assert db.count_records(Role) == 2
+
+
+def test_failed_batches_are_retried_then_dead_lettered(db, queue, monkeypatch):
+    monkeypatch.setattr(db, "bulk_insert", failing)
+    queue.insert(Role, {"name": "admin"})
+    assert queue.flush() == 0
+    assert len(queue) == 1 and not queue.dead_letters
+    assert queue.flush() == 0
+    assert len(queue) == 0
+    [(model, kind, row)] = queue.dead_letters
+    assert (model, kind, row["name"]) == (Role, INSERT, "admin")
+
+
+def test_retried_batches_keep_newer_writes(db, queue, monkeypatch):
+    id = queue.insert(Role, {"name": "admin", "product_name": "old"})
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "bulk_insert", failing)
+        queue.flush()
+    queue.update(Role, id, {"product_name": "new"})
+    queue.flush()
+    assert db.get_record(Role, id).product_name == "new"